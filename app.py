@@ -1,16 +1,114 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
-from scipy.optimize import curve_fit, minimize
+import gzip
+import hashlib
 import json
+import multiprocessing
 import os
+import sys
+import threading
+import time
 import traceback
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from book_cache import iter_book_chunks, load_book, load_depth_index, load_timestamped_book, source_fingerprint
+from order_book import BOOK_SIDES, OrderBook, fill_prices, snapshot_rows
+from streaming import SAMPLING_MODES, aggregate_slippage, book_slippage, head_sample, reservoir_sample, sample_sides
+from payload import SLIPPAGE_FORMATS, encode_slippage_data
+from result_cache import LRUCache
+from metrics import MetricsRegistry, start_profile, stop_profile
+from jobs import FINISHED_STATES, JobManager, QueueFull
+from catalog import DataCatalog
+from bootstrap import bootstrap_intervals
+from export import EXPORT_FORMATS, EXPORT_TABLES, MIMETYPES, chunk_columns, stream_table
+from intraday import BucketedImpactModel, time_of_day
+from backtest import EXECUTION_MODES, SCHEDULES, format_bounds, replay_schedules, schedule_allocations
+from slippage_model import fit_impact_models
+from trade_allocation import (solve_portfolio_allocation, solve_trade_allocation as solve_power_law_allocation,
+                              solve_trade_allocation_batch)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 app = Flask(__name__)
 CORS(app)
 
+# Index of the ticker/date data files; refreshed at most every CATALOG_REFRESH_S seconds
+DATA_DIR = os.environ.get('DATA_DIR', './Data')
+CATALOG_REFRESH_S = float(os.environ.get('CATALOG_REFRESH_S', 5))
+catalog = DataCatalog(DATA_DIR, CATALOG_REFRESH_S)
+
+# Bumped whenever the analysis output changes for the same inputs, so
+# clients revalidating with an old ETag get the new response
+ANALYSIS_VERSION = 2
+
+# Fitted models and allocations are cached separately, so changing only the
+# trading parameters reuses the fit. The budget is shared by both caches.
+ANALYSIS_CACHE_MB = float(os.environ.get('ANALYSIS_CACHE_MB', 256))
+fit_cache = LRUCache(int(ANALYSIS_CACHE_MB * 2**20 * 0.9))
+allocation_cache = LRUCache(int(ANALYSIS_CACHE_MB * 2**20 * 0.1))
+
+# Normalized inputs of recent analysis results by `result_id`, pinned to the data
+# file version they were computed from (see `pin_inputs`), for /api/export
+recent_results = LRUCache(4 * 2**20)
+
+# Time-of-day bucketed impact models of /api/intraday, updated in place as rows
+# are appended to their files; `intraday_lock` serializes updates
+intraday_models = LRUCache(32 * 2**20)
+intraday_lock = threading.Lock()
+
+# /api/compare fits scenarios on a process pool; 0 workers runs them in-process
+COMPARE_WORKERS = int(os.environ.get('COMPARE_WORKERS', os.cpu_count() or 1))
+COMPARE_TIMEOUT_S = float(os.environ.get('COMPARE_TIMEOUT_S', 120))
+_compare_pool = None
+_compare_pool_lock = threading.Lock()
+
+# /api/jobs runs analyses in the background on a bounded thread pool; finished
+# results are kept for JOB_RESULT_TTL_S seconds
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 32))
+JOB_RESULT_TTL_S = float(os.environ.get('JOB_RESULT_TTL_S', 900))
+JOB_HEARTBEAT_S = 15
+job_manager = JobManager(JOB_WORKERS, JOB_RESULT_TTL_S, JOB_MAX_PENDING)
+
+# Largest number of (snapshot, order size) cells /api/slippage answers in one call
+MAX_SLIPPAGE_QUERIES = int(os.environ.get('MAX_SLIPPAGE_QUERIES', 1_000_000))
+
+# Upper bounds on the grid points and distinct model fits of one /api/sweep request
+MAX_SWEEP_CELLS = int(os.environ.get('MAX_SWEEP_CELLS', 100_000))
+MAX_SWEEP_FITS = int(os.environ.get('MAX_SWEEP_FITS', 200))
+
+# Upper bound on the bootstrap replicates of one analysis
+MAX_BOOTSTRAP_REPLICATES = int(os.environ.get('MAX_BOOTSTRAP_REPLICATES', 10_000))
+
+# JSON responses at least this large are compressed when the client accepts it
+COMPRESS_MIN_BYTES = 1024
+
+# Tickers whose book caches are built, paged in and analyzed once by `warm_up`
+# before serving (comma-separated, '*' for every ticker in the catalog)
+PRELOAD_TICKERS = os.environ.get('PRELOAD_TICKERS', '')
+
+# Set by `warm_up`; /api/ready answers 503 until then
+readiness = {'ready': False, 'warming': False, 'started': time.time(), 'warmup_seconds': None, 'preloaded': []}
+readiness_lock = threading.Lock()
+
+# Request latency, per-stage timings and failure counters, exposed at /api/metrics
+metrics = MetricsRegistry(stage_metric='slippage_stage_seconds')
+metrics.describe('slippage_request_seconds', 'HTTP request latency by endpoint, method and status.')
+metrics.describe('slippage_stage_seconds', 'Time spent in each analysis stage.')
+metrics.describe('slippage_fit_failures_total', 'Model fits that produced no result, by reason.')
+metrics.describe('slippage_fit_nonconverged_total',
+                 'Power-law fits that did not converge and kept the log-log estimate.')
+metrics.describe('slippage_allocation_fallbacks_total',
+                 'Allocations where the optimizer failed and the equal split was used.')
+
 # Import existing functions
 def power_law_model(x, a, b):
     """Power law model for market impact."""
@@ -20,43 +118,13 @@ def linear_model(x, beta):
     """Linear model for market impact."""
     return beta * x
 
-def calculate_slippage(order_size, book_levels_prices, book_levels_sizes, mid_price):
-    """Calculate slippage for a given order size by walking the order book."""
-    shares_remaining = order_size
-    total_cost = 0
-    
-    for price, size in zip(book_levels_prices, book_levels_sizes):
-        if shares_remaining <= 0:
-            break
-        volume_to_take = min(shares_remaining, size)
-        total_cost += volume_to_take * price
-        shares_remaining -= volume_to_take
-        
-    if order_size > 0:
-        return (total_cost / order_size) - mid_price
-    return 0
-
-def objective_function(x, slippage_params):
-    """Objective function to minimize total slippage cost."""
-    a, b = slippage_params
-    return np.sum(power_law_model(x, a, b) * x)
-
 def solve_trade_allocation(total_shares, num_intervals, slippage_params):
-    """Solve optimal trade allocation problem."""
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - total_shares})
-    bounds = [(0, total_shares) for _ in range(num_intervals)]
-    initial_guess = np.full(num_intervals, total_shares / num_intervals)
-    
-    result = minimize(
-        objective_function, 
-        initial_guess, 
-        args=(slippage_params,), 
-        method='SLSQP', 
-        bounds=bounds, 
-        constraints=constraints
-    )
-    
-    return result.x if result.success else np.full(num_intervals, total_shares / num_intervals)
+    """Solve optimal trade allocation problem, falling back to an equal split."""
+    try:
+        return solve_power_law_allocation(total_shares, num_intervals, slippage_params)
+    except ValueError:
+        metrics.inc('slippage_allocation_fallbacks_total')
+        return np.full(num_intervals, total_shares / num_intervals)
 
 def calculate_risk_metrics(allocations, slippage_params):
     """Calculate risk metrics for the allocation."""
@@ -74,6 +142,54 @@ def calculate_risk_metrics(allocations, slippage_params):
         'allocation_std': float(np.sqrt(allocation_variance))
     }
 
+def profile_requested():
+    """Whether the request asked for a per-stage timing breakdown with ?profile=1."""
+    return request.args.get('profile', '').lower() in ('1', 'true', 'yes')
+
+@app.before_request
+def start_request_timer():
+    """Start timing the request, and profiling its stages if requested."""
+    g.request_started = time.perf_counter()
+    if profile_requested():
+        start_profile()
+
+# Registered before compress_response so that it runs after it and includes compression
+@app.after_request
+def record_request_metrics(response):
+    """Record the request's latency by endpoint, method and status."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('slippage_request_seconds', time.perf_counter() - started,
+                        endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.teardown_request
+def discard_profile(exception=None):
+    """Stop profiling, even when the request failed before its breakdown was used."""
+    stop_profile()
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON responses with brotli or gzip, as negotiated from Accept-Encoding."""
+    if (response.mimetype != 'application/json' or response.status_code != 200
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=4))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(data, compresslevel=5))
+    else:
+        return response
+    response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route('/')
 def index():
     """Serve the main HTML file."""
@@ -86,22 +202,181 @@ def serve_static(filename):
 
 @app.route('/api/tickers')
 def get_available_tickers():
-    """Get list of available tickers."""
+    """Get list of available tickers, with every date's file, row count, size and time range."""
     tickers = []
-    data_dir = './Data'
-    if os.path.exists(data_dir):
-        for ticker_dir in os.listdir(data_dir):
-            ticker_path = os.path.join(data_dir, ticker_dir)
-            if os.path.isdir(ticker_path):
-                csv_files = [f for f in os.listdir(ticker_path) if f.endswith('.csv')]
-                if csv_files:
-                    tickers.append({
-                        'symbol': ticker_dir,
-                        'file': csv_files[0],
-                        'path': os.path.join(ticker_path, csv_files[0])
-                    })
+    for entry in catalog.tickers():
+        latest = entry['dates'][-1]
+        tickers.append({
+            'symbol': entry['symbol'],
+            'file': latest['file'],
+            'path': latest['path'],
+            'latest_date': entry['latest_date'],
+            'dates': entry['dates']
+        })
     return jsonify(tickers)
 
+@app.route('/api/health')
+def health():
+    """Liveness probe: the process is up and answering requests."""
+    return jsonify({'status': 'ok', 'pid': os.getpid(), 'uptime_seconds': time.time() - readiness['started']})
+
+@app.route('/api/ready')
+def ready():
+    """
+    Readiness probe: 200 once `warm_up` has finished and the data directory is readable, 503 before.
+    
+    A process that was not warmed up before serving (e.g. `python app.py` or a
+    WSGI server importing `app:app`) starts warming up on the first probe.
+    """
+    if not readiness['ready']:
+        start_warm_up()
+    status = {
+        'ready': readiness['ready'] and os.path.isdir(DATA_DIR),
+        'warming': readiness['warming'],
+        'warmup_seconds': readiness['warmup_seconds'],
+        'preloaded': readiness['preloaded']
+    }
+    return jsonify(status), 200 if status['ready'] else 503
+
+def preload_books(tickers):
+    """
+    Build the book caches of the latest file of each ticker and read their pages once.
+    
+    The arrays are memory-mapped files, so once their pages are in the page cache
+    every worker process maps the same physical memory instead of loading its own
+    copy, and the first request for a ticker does no parsing or disk reads.
+    
+    Returns:
+        list: {'ticker', 'date', 'rows', 'bytes'} for each preloaded file.
+    """
+    preloaded = []
+    for ticker in tickers:
+        data_file = catalog.resolve(ticker)
+        if data_file is None:
+            app.logger.warning(data_not_found(ticker))
+            continue
+        book = load_book(data_file['path'])
+        index = load_depth_index(data_file['path'])
+        arrays = [book.ask_prices, book.ask_sizes, book.bid_prices, book.bid_sizes,
+                  index.timestamps, index.level_prices, index.cum_size, index.cum_notional]
+        for array in arrays:
+            # Touching every page faults the file into the page cache
+            np.add.reduce(array, axis=None)
+        preloaded.append({'ticker': ticker, 'date': data_file['date'], 'rows': len(book.bid_top),
+                          'bytes': int(sum(array.nbytes for array in arrays))})
+    return preloaded
+
+def warm_up(tickers=(), reset_metrics=True):
+    """
+    Prepare the process for serving and mark it ready.
+    
+    Refreshes the catalog, preloads the book caches of `tickers` (see
+    `preload_books`) and runs the default analysis of each once, which exercises
+    the lazily initialized NumPy, pandas and SciPy code paths and leaves the
+    default fits in the analysis caches. Called before forking, so workers inherit
+    all of it; metrics recorded during warm-up are then discarded unless
+    `reset_metrics` is false, as when requests are already being served.
+    """
+    started = time.perf_counter()
+    catalog.refresh(force=True)
+    if '*' in tickers:
+        tickers = [entry['symbol'] for entry in catalog.tickers()]
+    preloaded = preload_books(tickers)
+    for entry in preloaded:
+        data_file = catalog.resolve(entry['ticker'])
+        process_ticker_data_dynamic(data_file['path'], entry['ticker'], 1000, 20, 0.5, 50000, 10,
+                                    date=data_file['date'])
+    if reset_metrics:
+        metrics.reset()
+    readiness.update(ready=True, warmup_seconds=time.perf_counter() - started, preloaded=preloaded)
+
+def start_warm_up():
+    """Run `warm_up` of PRELOAD_TICKERS in a background thread, unless it has finished or is running."""
+    with readiness_lock:
+        if readiness['ready'] or readiness['warming']:
+            return
+        readiness['warming'] = True
+    
+    def run():
+        try:
+            warm_up(parse_list(PRELOAD_TICKERS, str), reset_metrics=False)
+        except Exception:
+            # The next probe tries again
+            app.logger.exception('Warm-up failed')
+        finally:
+            readiness['warming'] = False
+    
+    threading.Thread(target=run, name='warm-up', daemon=True).start()
+
+def data_not_found(ticker, date=None):
+    """Error message for a ticker (and date) without a data file."""
+    return f'Data file not found for ticker {ticker}' + (f' on {date}' if date else '')
+
+def parse_sampling_params(params):
+    """Read the sampling mode options of an analysis request, raising ValueError if invalid."""
+    sampling = {
+        'sampling': params.get('sampling', 'head'),
+        'stride': int(params.get('stride', 10)),
+        'seed': int(params.get('seed', 0))
+    }
+    if sampling['sampling'] not in SAMPLING_MODES:
+        raise ValueError(f"sampling must be one of {', '.join(SAMPLING_MODES)}")
+    if sampling['stride'] < 1:
+        raise ValueError('stride must be a positive integer')
+    return sampling
+
+def parse_side_param(params, two_sided=True):
+    """Read the `side` of an analysis request ('buy', 'sell', or 'both' if `two_sided`), raising ValueError if invalid."""
+    side = params.get('side', 'buy')
+    sides = BOOK_SIDES + ('both',) if two_sided else BOOK_SIDES
+    if side not in sides:
+        raise ValueError(f"side must be one of {', '.join(sides)}")
+    return side
+
+def parse_bootstrap_params(params, sampling):
+    """Read the bootstrap interval options of an analysis request, raising ValueError if invalid."""
+    bootstrap = {
+        'bootstrap': int(params.get('bootstrap', 0)),
+        'confidence': float(params.get('confidence', 0.95))
+    }
+    if not 0 <= bootstrap['bootstrap'] <= MAX_BOOTSTRAP_REPLICATES:
+        raise ValueError(f'bootstrap must be between 0 and {MAX_BOOTSTRAP_REPLICATES}')
+    if not 0 < bootstrap['confidence'] < 1:
+        raise ValueError('confidence must be between 0 and 1')
+    if bootstrap['bootstrap'] and sampling['sampling'] not in ('head', 'reservoir'):
+        raise ValueError("bootstrap requires sampling 'head' or 'reservoir'")
+    return bootstrap
+
+def fit_cache_key(file_path, sample_rows, order_size_points, book_depth_pct,
+                  sampling='head', stride=10, seed=0, side='buy'):
+    """Build the cache key of a model fit from its normalized inputs and the data file's fingerprint."""
+    fingerprint = source_fingerprint(file_path)
+    return (os.path.abspath(file_path), fingerprint['size'], fingerprint['mtime_ns'],
+            int(sample_rows) if sampling in ('head', 'reservoir') else None,
+            int(order_size_points), round(float(book_depth_pct), 10), sampling,
+            int(stride) if sampling == 'stride' else None,
+            int(seed) if sampling == 'reservoir' else None, side)
+
+def parse_payload_params(params):
+    """Read the response encoding options of an analysis request, raising ValueError if invalid."""
+    payload = {
+        'slippage_format': params.get('slippage_format', 'records'),
+        'max_points': int(params.get('max_points', 1000))
+    }
+    if payload['slippage_format'] not in SLIPPAGE_FORMATS:
+        raise ValueError(f"slippage_format must be one of {', '.join(SLIPPAGE_FORMATS)}")
+    if payload['max_points'] < 3:
+        raise ValueError('max_points must be at least 3')
+    return payload
+
+def analysis_etag(fit_key, total_shares, num_intervals, slippage_format='records', max_points=1000,
+                  bootstrap=0, confidence=0.95, seed=0):
+    """Weak ETag value for an analysis response, derived from everything that determines its content."""
+    key = (ANALYSIS_VERSION, fit_key, int(total_shares), int(num_intervals), slippage_format,
+           int(max_points) if slippage_format == 'lttb' else None,
+           (int(bootstrap), float(confidence), int(seed)) if bootstrap else None)
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_ticker():
     """Analyze ticker data with custom parameters."""
@@ -113,170 +388,1512 @@ def analyze_ticker():
         book_depth_pct = float(params.get('book_depth_pct', 50)) / 100
         total_shares = int(params.get('total_shares', 50000))
         trading_intervals = int(params.get('trading_intervals', 10))
+        try:
+            sampling = parse_sampling_params(params)
+            side = parse_side_param(params)
+            payload = parse_payload_params(params)
+            bootstrap = parse_bootstrap_params(params, sampling)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Get file path
-        file_path = f'./Data/{ticker}/{ticker}_2025-05-02 00_00_00+00_00.csv'
+        # Get file path; without a date the latest one is analysed
+        data_file = catalog.resolve(ticker, params.get('date'))
+        if data_file is None:
+            return jsonify({'error': data_not_found(ticker, params.get('date'))}), 404
+        file_path = data_file['path']
         
-        if not os.path.exists(file_path):
-            return jsonify({'error': f'Data file not found for ticker {ticker}'}), 404
+        # Profiled responses carry timings, so they are never served from or tagged for a client cache
+        profile = profile_requested()
+        fit_key = fit_cache_key(file_path, sample_size, order_size_points, book_depth_pct, **sampling, side=side)
+        etag = analysis_etag(fit_key, total_shares, trading_intervals, **payload, **bootstrap, seed=sampling['seed'])
+        if not profile and request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            return response
         
         # Process data
         result = process_ticker_data_dynamic(
             file_path, ticker, sample_size, order_size_points, 
-            book_depth_pct, total_shares, trading_intervals
+            book_depth_pct, total_shares, trading_intervals, **sampling, **payload, **bootstrap,
+            date=data_file['date'], side=side
         )
         
         if result is None:
             return jsonify({'error': 'Insufficient data to fit models'}), 400
-            
-        return jsonify(result)
+        result['result_id'] = remember_result(pin_inputs({
+            'ticker': ticker, 'date': data_file['date'], 'file_path': file_path, 'sample_rows': sample_size,
+            'order_size_points': order_size_points, 'book_depth_pct': book_depth_pct,
+            'total_shares': total_shares, 'num_intervals': trading_intervals, **sampling, 'side': side
+        }, fit_key))
+        
+        if profile:
+            result['profile'] = stop_profile()
+            return jsonify(result)
+        with metrics.timed('serialize'):
+            response = jsonify(result)
+        response.set_etag(etag, weak=True)
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
 
-def process_ticker_data_dynamic(file_path, ticker, sample_rows, order_size_points, 
-                               book_depth_pct, total_shares, num_intervals):
-    """Process ticker data with dynamic parameters."""
+@app.route('/api/cache', methods=['GET', 'DELETE'])
+def analysis_cache():
+    """Report analysis cache statistics, or clear the caches on DELETE."""
+    if request.method == 'DELETE':
+        fit_cache.clear()
+        allocation_cache.clear()
+        intraday_models.clear()
+    return jsonify({'fits': fit_cache.stats(), 'allocations': allocation_cache.stats(),
+                    'intraday_models': intraday_models.stats()})
+
+@app.route('/api/metrics')
+def prometheus_metrics():
+    """Expose request and stage latency histograms, failure counters and cache statistics for Prometheus."""
+    caches = {'fit': fit_cache.stats(), 'allocation': allocation_cache.stats(), 'intraday': intraday_models.stats()}
+    def per_cache(field):
+        return {(('cache', name),): stats[field] for name, stats in caches.items()}
+    gauges = [
+        ('slippage_cache_hits_total', 'counter', 'Analysis cache hits.', per_cache('hits')),
+        ('slippage_cache_misses_total', 'counter', 'Analysis cache misses.', per_cache('misses')),
+        ('slippage_cache_evictions_total', 'counter', 'Analysis cache evictions.', per_cache('evictions')),
+        ('slippage_cache_hit_ratio', 'gauge', 'Analysis cache hit rate since startup.', per_cache('hit_rate')),
+        ('slippage_cache_entries', 'gauge', 'Entries held by each analysis cache.', per_cache('entries')),
+        ('slippage_cache_bytes', 'gauge', 'Approximate bytes held by each analysis cache.', per_cache('bytes')),
+        ('slippage_jobs', 'gauge', 'Background jobs currently retained, by status.',
+         {(('status', status),): count for status, count in job_manager.counts().items()})
+    ]
+    return app.response_class(metrics.render(gauges), mimetype='text/plain',
+                              content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 time (UTC unless it has an offset) to nanoseconds since the epoch."""
+    timestamp = pd.Timestamp(value)
+    if pd.isna(timestamp):
+        raise ValueError(f'Invalid time {value!r}')
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return timestamp.value
+
+def parse_list(value, parse):
+    """Parse a comma-separated query parameter, skipping empty items."""
+    return [parse(item.strip()) for item in (value or '').split(',') if item.strip()]
+
+def nan_to_none(values):
+    """Convert an array to (nested) lists with NaN replaced by None, so it serializes as valid JSON."""
+    values = np.asarray(values, dtype=float)
+    result = values.astype(object)
+    result[np.isnan(values)] = None
+    return result.tolist()
+
+@app.route('/api/slippage')
+def point_slippage():
+    """
+    Cost of buy orders of arbitrary sizes at arbitrary times, from the precomputed depth index.
+    
+    Query parameters: `ticker`, optional `date` (the latest by default), `sizes`
+    (comma-separated share counts) and either
+    `at` (comma-separated times, each answered from the last snapshot at or before
+    it) or a `from`/`to` range (every snapshot in it; the whole file by default).
+    Times are ISO 8601 and UTC unless they carry an offset. Every size is priced
+    against every selected snapshot in one vectorized pass; sizes beyond the visible
+    depth, and times before the first snapshot, give null.
+    """
+    ticker = request.args.get('ticker')
     try:
-        df = pd.read_csv(file_path, nrows=sample_rows)
-        df.dropna(subset=['bid_px_00', 'ask_px_00'], inplace=True)
-        
-        if len(df) < 10:
-            return None
-            
-        slippage_points = []
-        for _, row in df.iterrows():
-            ask_prices = [row[f'ask_px_{i:02d}'] for i in range(10) 
-                         if f'ask_px_{i:02d}' in row and pd.notna(row[f'ask_px_{i:02d}'])]
-            ask_sizes = [row[f'ask_sz_{i:02d}'] for i in range(10) 
-                        if f'ask_sz_{i:02d}' in row and pd.notna(row[f'ask_sz_{i:02d}'])]
-            
-            if not ask_prices or not ask_sizes:
-                continue
-                
-            mid_price = (row['bid_px_00'] + row['ask_px_00']) / 2
-            max_order_size = sum(ask_sizes) * book_depth_pct
-            order_sizes = np.linspace(1, max_order_size, order_size_points)
-            
-            for x in order_sizes:
-                slippage = calculate_slippage(x, ask_prices, ask_sizes, mid_price)
-                if slippage > 0:
-                    slippage_points.append({'order_size': x, 'slippage': slippage})
+        sizes = parse_list(request.args.get('sizes'), float)
+        at = parse_list(request.args.get('at'), parse_timestamp)
+        start = parse_timestamp(request.args['from']) if request.args.get('from') else None
+        end = parse_timestamp(request.args['to']) if request.args.get('to') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not sizes:
+        return jsonify({'error': 'sizes must list at least one order size'}), 400
+    
+    data_file = catalog.resolve(ticker, request.args.get('date'))
+    if data_file is None:
+        return jsonify({'error': data_not_found(ticker, request.args.get('date'))}), 404
+    file_path = data_file['path']
+    
+    with metrics.timed('depth_query'):
+        index = load_depth_index(file_path)
+        rows = snapshot_rows(index.timestamps, start, end, np.array(at, dtype=np.int64) if at else None)
+        if len(rows) * len(sizes) > MAX_SLIPPAGE_QUERIES:
+            return jsonify({'error': f'{len(rows)} snapshots x {len(sizes)} sizes exceeds the limit of '
+                                     f'{MAX_SLIPPAGE_QUERIES} queries; narrow the time range'}), 400
+        found = rows >= 0
+        selected = rows[found]
         
-        slippage_df = pd.DataFrame(slippage_points)
-        if slippage_df.empty or len(slippage_df) < 2:
-            return None
+        avg_price = np.full((len(rows), len(sizes)), np.nan)
+        avg_price[found] = fill_prices(np.array(sizes), index.level_prices[selected],
+                                       index.cum_size[selected], index.cum_notional[selected])
+        mid_prices = np.full(len(rows), np.nan)
+        mid_prices[found] = index.mid_prices[selected]
+        timestamps = np.full(len(rows), None, dtype=object)
+        timestamps[found] = np.datetime_as_string(index.timestamps[selected].view('datetime64[ns]'), timezone='UTC')
+    
+    result = {
+        'ticker': ticker,
+        'date': data_file['date'],
+        'sizes': sizes,
+        'snapshots': int(found.sum()),
+        'timestamp': timestamps.tolist(),
+        'mid_price': nan_to_none(mid_prices),
+        'avg_price': nan_to_none(avg_price),
+        'slippage': nan_to_none(avg_price - mid_prices[:, None])
+    }
+    if at:
+        result['at'] = parse_list(request.args.get('at'), str)
+    return jsonify(result)
+
+def fit_slippage_models(file_path, sample_rows, order_size_points, book_depth_pct,
+                        sampling='head', stride=10, seed=0, progress=None, side='buy'):
+    """
+    Compute slippage points and fit both impact models, or return None if the data is insufficient.
+    
+    `side` is 'buy' (walk the asks), 'sell' (walk the bids) or 'both'. Both sides
+    are sampled from one read of the book and walked together, and give a dict of
+    side -> fit (None for a side without enough data).
+    
+    Records the 'load' (reading book chunks), 'sample' (sampling and the book walk,
+    including 'load') and 'fit' stages. If given, `progress` is called with the
+    current stage and the number of snapshots read so far.
+    """
+    chunks = iter_book_chunks(file_path)
+    if progress is not None:
+        rows_total = len(load_book(file_path).bid_top)
+        if sampling == 'head':
+            rows_total = min(rows_total, sample_rows)
+        chunks = report_rows(chunks, progress, rows_total)
+    chunks = metrics.timed_iter(chunks, 'load')
+    sides = BOOK_SIDES if side == 'both' else (side,)
+    with metrics.timed('sample'):
+        samples = sample_sides(chunks, sides, sampling, sample_rows, order_size_points,
+                               book_depth_pct, stride, seed)
+        chunks.close()
+    
+    if progress is not None:
+        progress(stage='fit')
+    if side != 'both':
+        return fit_sample(samples[side])
+    fits = {name: fit_sample(sample) for name, sample in samples.items()}
+    return fits if any(fit is not None for fit in fits.values()) else None
+
+def fit_sample(sample):
+    """Fit both impact models to a SlippageSample, recording the 'fit' stage; None if the data is insufficient."""
+    if sample.snapshots < 10:
+        return None
         
-        # Fit models
-        try:
-            popt_linear, _ = curve_fit(linear_model, slippage_df['order_size'], 
-                                     slippage_df['slippage'])
-            popt_power, _ = curve_fit(power_law_model, slippage_df['order_size'], 
-                                    slippage_df['slippage'], p0=[1e-5, 1.5], maxfev=5000)
-        except:
+    slippage_df = pd.DataFrame({'order_size': sample.order_sizes, 'slippage': sample.slippage})
+    if slippage_df.empty or len(slippage_df) < 2:
+        return None
+    
+    with metrics.timed('fit'):
+        fit = fit_impact_models(sample.order_sizes, sample.slippage, sample.counts, sample.binned)
+    if fit is None:
+        return None
+    
+    return {
+        'slippage_df': slippage_df,
+        'popt_linear': fit['popt_linear'],
+        'popt_power': fit['popt_power'],
+        'diagnostics': fit['diagnostics'],
+        'counts': sample.counts if sample.binned else None,
+        'rows': sample.rows,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def report_rows(chunks, progress, rows_total):
+    """Yield book chunks, reporting how many snapshots have been processed to `progress`."""
+    rows = 0
+    progress(stage='sample', rows_processed=rows, rows_total=rows_total)
+    for chunk in chunks:
+        yield chunk
+        rows += len(chunk.bid_top)
+        progress(stage='sample', rows_processed=min(rows, rows_total), rows_total=rows_total)
+
+def cached_fit(file_path, sample_rows, order_size_points, book_depth_pct, progress=None, **sampling):
+    """Return the model fit for these inputs, computing it only on a cache miss."""
+    key = fit_cache_key(file_path, sample_rows, order_size_points, book_depth_pct, **sampling)
+    fit = fit_cache.get(key, default=key)
+    if fit is key:
+        fit = fit_slippage_models(file_path, sample_rows, order_size_points, book_depth_pct,
+                                  progress=progress, **sampling)
+        side = sampling.get('side', 'buy')
+        record_fit_outcome(fit, side)
+        fit_cache.put(key, fit, fit_size(fit, side))
+    return fit
+
+def pin_inputs(inputs, fit_key=None):
+    """
+    Add the fit cache key, which includes the data file's fingerprint, to the normalized inputs of a result.
+    
+    `fit_key` is the key the result's fit was looked up under; by default it is
+    computed from the file as it is now.
+    """
+    if fit_key is None:
+        fit_key = fit_cache_key(inputs['file_path'], inputs['sample_rows'], inputs['order_size_points'],
+                                inputs['book_depth_pct'], inputs['sampling'], inputs['stride'], inputs['seed'],
+                                inputs['side'])
+    return {**inputs, 'fit_key': fit_key}
+
+def remember_result(pinned):
+    """Keep the pinned inputs (see `pin_inputs`) of an analysis result for `/api/export` and return its `result_id`."""
+    key = (pinned['fit_key'], int(pinned['total_shares']), int(pinned['num_intervals']))
+    result_id = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+    recent_results.put(result_id, pinned, 1024)
+    return result_id
+
+def side_fits(fit, side):
+    """The one-sided fits behind a fit for `side`, as a dict of side -> fit (None where it failed)."""
+    return fit if side == 'both' else {side: fit}
+
+def profiled_fit_slippage_models(*args):
+    """Run `fit_slippage_models` and return its result with the stage breakdown, for pool workers."""
+    start_profile()
+    try:
+        fit = fit_slippage_models(*args)
+    finally:
+        profile = stop_profile()
+    return fit, profile
+
+def record_fit_outcome(fit, side='buy'):
+    """Count a freshly computed fit that failed for lack of data or whose power law did not converge."""
+    if fit is None:
+        metrics.inc('slippage_fit_failures_total', reason='insufficient_data')
+        return
+    for one_sided in side_fits(fit, side).values():
+        if one_sided is None:
+            metrics.inc('slippage_fit_failures_total', reason='insufficient_data')
+        elif not one_sided['diagnostics']['power_law']['converged']:
+            metrics.inc('slippage_fit_nonconverged_total')
+
+def fit_size(fit, side='buy'):
+    """Approximate memory footprint of a cached fit, in bytes."""
+    if fit is None:
+        return 256
+    size = 0
+    for one_sided in side_fits(fit, side).values():
+        if one_sided is None:
+            size += 256
+            continue
+        rows = one_sided.get('rows')
+        size += int(one_sided['slippage_df'].memory_usage().sum()) + (0 if rows is None else rows.nbytes) + 1024
+    return size
+
+def cached_allocation(total_shares, num_intervals, popt_power):
+    """Return the optimal allocation and its risk metrics, solving only on a cache miss."""
+    key = (int(total_shares), int(num_intervals), float(popt_power[0]), float(popt_power[1]))
+    allocation = allocation_cache.get(key)
+    if allocation is None:
+        with metrics.timed('allocate'):
+            allocations = solve_trade_allocation(total_shares, num_intervals, popt_power)
+            allocation = (allocations, calculate_risk_metrics(allocations, popt_power))
+        allocation_cache.put(key, allocation, allocations.nbytes + 1024)
+    return allocation
+
+def process_ticker_data_dynamic(file_path, ticker, sample_rows, order_size_points, 
+                               book_depth_pct, total_shares, num_intervals,
+                               sampling='head', stride=10, seed=0,
+                               slippage_format='records', max_points=1000, progress=None, date=None,
+                               bootstrap=0, confidence=0.95, side='buy'):
+    """
+    Process ticker data with dynamic parameters.
+    
+    `sampling` selects which snapshots are analysed: 'head' (first `sample_rows`),
+    'reservoir' (uniform random `sample_rows`, seeded by `seed`), 'stride' (every
+    `stride`-th snapshot of the day) or 'full' (the whole day). The last two are
+    streamed in chunks and return per-bin mean slippage points.
+    
+    `slippage_format` selects how `slippage_data` is encoded (see
+    `encode_slippage_data`); 'lttb' keeps at most `max_points` points.
+    
+    `progress`, if given, is called with the stage and snapshots processed so far.
+    `date` is the trading date of `file_path`, reported in `analysis_params`.
+    
+    With `bootstrap` replicates, `confidence_intervals` reports percentile intervals
+    of the power-law parameters and the allocation's cost (see `bootstrap_intervals`).
+    
+    `side` selects sell impact ('sell', from the bids) instead of buy impact, or
+    both from one pass over the book ('both'; see `analysis_result`).
+    """
+    try:
+        fit = cached_fit(file_path, sample_rows, order_size_points, book_depth_pct, progress=progress,
+                         sampling=sampling, stride=stride, seed=seed, side=side)
+        if fit is None:
             return None
+        if progress is not None:
+            progress(stage='allocate')
+        return analysis_result(ticker, fit, sample_rows, order_size_points, book_depth_pct,
+                               total_shares, num_intervals, sampling, slippage_format, max_points, date,
+                               bootstrap, confidence, seed, side)
         
-        # Calculate optimal allocation
-        allocations = solve_trade_allocation(total_shares, num_intervals, popt_power)
-        
-        # Calculate risk metrics
-        risk_metrics = calculate_risk_metrics(allocations, popt_power)
-        
-        return {
-            'ticker': ticker,
-            'model_params': {
-                'linear': {'beta': float(popt_linear[0])},
-                'power_law': {'a': float(popt_power[0]), 'b': float(popt_power[1])}
-            },
-            'slippage_data': slippage_df.to_dict('records'),
-            'allocation': {
-                'total_shares': total_shares,
-                'intervals': num_intervals,
-                'allocations': allocations.tolist()
-            },
-            'risk_metrics': risk_metrics,
-            'analysis_params': {
-                'sample_size': sample_rows,
-                'order_size_points': order_size_points,
-                'book_depth_pct': book_depth_pct * 100,
-                'timestamp': datetime.now().isoformat()
-            }
-        }
-        
-    except Exception as e:
-        print(f"Error processing {ticker}: {str(e)}")
+    except Exception:
+        app.logger.exception(f"Error processing {ticker}")
+        metrics.inc('slippage_fit_failures_total', reason='error')
         return None
 
+def analysis_result(ticker, fit, sample_rows, order_size_points, book_depth_pct,
+                    total_shares, num_intervals, sampling='head',
+                    slippage_format='records', max_points=1000, date=None,
+                    bootstrap=0, confidence=0.95, seed=0, side='buy'):
+    """
+    Build the analysis response for a model fit, solving the allocation on top of it.
+    
+    A one-sided response carries the fit, allocation and risk metrics at the top
+    level. With side 'both', they are under `sides` -> 'buy' / 'sell' instead,
+    each side allocating `total_shares` with its own fit (None if that side had
+    too little data).
+    """
+    fits = side_fits(fit, side)
+    analyses = {name: None if one_sided is None else side_analysis(
+                    one_sided, total_shares, num_intervals, slippage_format, max_points, bootstrap, confidence, seed)
+                for name, one_sided in fits.items()}
+    
+    result = {'ticker': ticker}
+    if side == 'both':
+        result['sides'] = analyses
+    else:
+        result.update(analyses[side])
+    result['analysis_params'] = {
+        'sample_size': sample_rows,
+        'order_size_points': order_size_points,
+        'book_depth_pct': book_depth_pct * 100,
+        'sampling': sampling,
+        'side': side,
+        'date': date,
+        'timestamp': next(one_sided['timestamp'] for one_sided in fits.values() if one_sided is not None)
+    }
+    return result
+
+def side_analysis(fit, total_shares, num_intervals, slippage_format='records', max_points=1000,
+                  bootstrap=0, confidence=0.95, seed=0):
+    """Build the model, allocation and risk sections of an analysis response for a one-sided fit."""
+    popt_linear, popt_power = fit['popt_linear'], fit['popt_power']
+    
+    # Calculate optimal allocation and its risk metrics
+    allocations, risk_metrics = cached_allocation(total_shares, num_intervals, popt_power)
+    
+    with metrics.timed('encode'):
+        slippage_data = encode_slippage_data(
+            fit['slippage_df']['order_size'].to_numpy(), fit['slippage_df']['slippage'].to_numpy(),
+            slippage_format, max_points, fit['counts']
+        )
+    
+    result = {
+        'model_params': {
+            'linear': {'beta': float(popt_linear[0])},
+            'power_law': {'a': float(popt_power[0]), 'b': float(popt_power[1])}
+        },
+        'slippage_data': slippage_data,
+        'allocation': {
+            'total_shares': total_shares,
+            'intervals': num_intervals,
+            'allocations': allocations.tolist()
+        },
+        'risk_metrics': dict(risk_metrics),
+        'fit_diagnostics': fit['diagnostics']
+    }
+    
+    if bootstrap:
+        if fit.get('rows') is None:
+            raise ValueError('Bootstrap intervals need per-snapshot slippage points')
+        with metrics.timed('bootstrap'):
+            result['confidence_intervals'] = bootstrap_intervals(
+                fit['slippage_df']['order_size'].to_numpy(), fit['slippage_df']['slippage'].to_numpy(),
+                fit['rows'], popt_power, allocations, bootstrap, confidence, seed
+            )
+    return result
+
 @app.route('/api/compare', methods=['POST'])
 def compare_scenarios():
-    """Compare multiple analysis scenarios."""
+    """
+    Compare multiple analysis scenarios.
+    
+    Scenarios whose fit is not cached are fitted in parallel on the compare process
+    pool. Failed or timed-out scenarios are reported under `errors` with their
+    position in the request, and the remaining results keep their original order.
+    """
     try:
         scenarios = request.json.get('scenarios', [])
-        results = []
-        
-        for scenario in scenarios:
-            result = analyze_ticker_internal(scenario)
-            if result:
-                results.append(result)
-        
-        return jsonify({
-            'scenarios': results,
-            'comparison_metrics': calculate_comparison_metrics(results)
-        })
+        timeout = float(request.json.get('timeout', COMPARE_TIMEOUT_S))
+        response = compare_results(scenarios, timeout)
+        if profile_requested():
+            response['profile'] = stop_profile()
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def analyze_ticker_internal(params):
-    """Internal function to analyze ticker (used by compare endpoint)."""
+def compare_results(scenarios, timeout, progress=None, exports=None):
+    """Run compare scenarios and build the comparison response."""
+    results, errors = run_scenarios(scenarios, timeout, progress, exports)
+    indices = [i for i, result in enumerate(results) if result is not None]
+    results = [results[i] for i in indices]
+    
+    return {
+        'scenarios': results,
+        'errors': errors,
+        'comparison_metrics': calculate_comparison_metrics(results, indices)
+    }
+
+def scenario_inputs(params):
+    """
+    Normalize the parameters of one compare scenario (raises ValueError if invalid).
+    
+    `file_path` is None when the catalog has no file for the ticker on `date`
+    (the latest date if not given).
+    """
     ticker = params.get('ticker')
-    sample_size = int(params.get('sample_size', 1000))
-    order_size_points = int(params.get('order_size_points', 20))
-    book_depth_pct = float(params.get('book_depth_pct', 50)) / 100
-    total_shares = int(params.get('total_shares', 50000))
-    trading_intervals = int(params.get('trading_intervals', 10))
+    data_file = catalog.resolve(ticker, params.get('date'))
+    sampling = parse_sampling_params(params)
+    return {
+        'ticker': ticker,
+        'date': data_file['date'] if data_file else params.get('date'),
+        'file_path': data_file['path'] if data_file else None,
+        'sample_rows': int(params.get('sample_size', 1000)),
+        'order_size_points': int(params.get('order_size_points', 20)),
+        'book_depth_pct': float(params.get('book_depth_pct', 50)) / 100,
+        'total_shares': int(params.get('total_shares', 50000)),
+        'num_intervals': int(params.get('trading_intervals', 10)),
+        **sampling,
+        'side': parse_side_param(params),
+        **parse_payload_params(params),
+        **parse_bootstrap_params(params, sampling)
+    }
 
-    file_path = f'./Data/{ticker}/{ticker}_2025-05-02 00_00_00+00_00.csv'
+def get_compare_pool():
+    """Return the shared compare process pool, creating it on first use."""
+    global _compare_pool
+    with _compare_pool_lock:
+        if _compare_pool is None:
+            _compare_pool = ProcessPoolExecutor(max_workers=COMPARE_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _compare_pool
 
-    if not os.path.exists(file_path):
-        return None
+def reset_compare_pool(pool):
+    """
+    Discard a broken or stalled compare pool so the next request starts a new one.
+    
+    Fits still queued on it are cancelled, including those of other requests,
+    which resubmit them. Fits already running cannot be interrupted: their worker
+    processes finish them and then exit, outside the new pool's worker count.
+    """
+    global _compare_pool
+    with _compare_pool_lock:
+        if _compare_pool is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            _compare_pool = None
 
-    return process_ticker_data_dynamic(
-        file_path, ticker, sample_size, order_size_points,
-        book_depth_pct, total_shares, trading_intervals
-    )
+def run_scenarios(scenarios, timeout, progress=None, exports=None):
+    """
+    Analyze compare scenarios, fitting uncached models in parallel.
+    
+    Identical fits are computed once. Every distinct data file is converted to the
+    memory-mapped book cache before dispatch, so workers share its pages instead of
+    each parsing the CSV. A worker slot runs one fit at a time, so the k-th wave of
+    jobs (k = position // COMPARE_WORKERS) is given (k + 1) * timeout to finish.
+    A running fit cannot be cancelled, so when one times out the shared pool is
+    recycled (see `reset_compare_pool`) and the fits still queued are resubmitted
+    to a new pool, with their waves counted from then; the timed-out fit keeps
+    its CPU until it finishes, but no longer holds a slot of the pool.
+    
+    `progress`, if given, is called with the stage and the number of fits done.
+    If it raises, fits that have not started are cancelled. `exports`, if given,
+    receives the (index, pinned inputs) of every result, for `/api/export`.
+    
+    Returns:
+        tuple: (results with None for failed scenarios, list of error dicts)
+    """
+    results = [None] * len(scenarios)
+    errors = []
+    inputs, fits, pending = {}, {}, {}
+    
+    for index, params in enumerate(scenarios):
+        try:
+            scenario = scenario_inputs(params)
+        except (TypeError, ValueError) as e:
+            errors.append({'index': index, 'ticker': params.get('ticker'), 'error': str(e)})
+            continue
+        if scenario['file_path'] is None:
+            errors.append({'index': index, 'ticker': scenario['ticker'],
+                           'error': data_not_found(scenario['ticker'], scenario['date'])})
+            continue
+        key = fit_cache_key(scenario['file_path'], scenario['sample_rows'], scenario['order_size_points'],
+                            scenario['book_depth_pct'], scenario['sampling'], scenario['stride'], scenario['seed'],
+                            scenario['side'])
+        inputs[index] = (scenario, key)
+        if key not in fits and key not in pending:
+            fit = fit_cache.get(key, default=key)
+            if fit is key:
+                pending[key] = scenario
+            else:
+                fits[key] = fit
+    
+    def report(stage, done):
+        if progress is not None:
+            progress(stage=stage, fits_done=done, fits_total=len(pending))
+    
+    if pending:
+        report('load', 0)
+        for file_path in {scenario['file_path'] for scenario in pending.values()}:
+            load_book(file_path)
+        
+        report('fit', 0)
+        if COMPARE_WORKERS > 0:
+            def submit(pool, s):
+                return pool.submit(profiled_fit_slippage_models, s['file_path'], s['sample_rows'],
+                                   s['order_size_points'], s['book_depth_pct'],
+                                   s['sampling'], s['stride'], s['seed'], None, s['side'])
+            
+            def resubmit_cancelled(keys):
+                # Fits cancelled by a pool recycle go to the new pool, counted in fresh waves
+                pool = get_compare_pool()
+                for key in keys:
+                    if futures[key].cancelled():
+                        futures[key] = submit(pool, pending[key])
+                return pool, time.monotonic()
+            
+            pool = get_compare_pool()
+            futures = {key: submit(pool, s) for key, s in pending.items()}
+            keys = list(futures)
+            started, first = time.monotonic(), 0
+            try:
+                for position, key in enumerate(keys):
+                    while True:
+                        deadline = started + ((position - first) // COMPARE_WORKERS + 1) * timeout
+                        try:
+                            fits[key], profile = futures[key].result(timeout=max(0.0, deadline - time.monotonic()))
+                            # Stage timings of the worker are recorded here, as if the fit ran in this process
+                            for stage, totals in profile['stages'].items():
+                                metrics.record_stage(stage, totals['seconds'])
+                        except CancelledError:
+                            # Another request recycled the shared pool before this fit started
+                            pool, started = resubmit_cancelled(keys[position:])
+                            first = position
+                            continue
+                        except FuturesTimeoutError:
+                            if not futures[key].cancel():
+                                # The fit is running and would hold its worker slot, delaying every
+                                # later wave, so the pool is replaced and the queued fits move over
+                                reset_compare_pool(pool)
+                                pool, started = resubmit_cancelled(keys[position + 1:])
+                                first = position + 1
+                            fits[key] = TimeoutError(f'Scenario timed out after {timeout:g}s')
+                        except BrokenProcessPool as e:
+                            reset_compare_pool(pool)
+                            fits[key] = e
+                        except Exception as e:
+                            fits[key] = e
+                        break
+                    report('fit', position + 1)
+            except BaseException:
+                for future in futures.values():
+                    future.cancel()
+                raise
+        else:
+            for position, (key, s) in enumerate(pending.items()):
+                try:
+                    fits[key] = fit_slippage_models(s['file_path'], s['sample_rows'], s['order_size_points'],
+                                                    s['book_depth_pct'], s['sampling'], s['stride'], s['seed'],
+                                                    side=s['side'])
+                except Exception as e:
+                    fits[key] = e
+                report('fit', position + 1)
+        
+        for key, fit in fits.items():
+            if key not in pending:
+                continue
+            if isinstance(fit, Exception):
+                metrics.inc('slippage_fit_failures_total',
+                            reason='timeout' if isinstance(fit, TimeoutError) else 'error')
+            else:
+                record_fit_outcome(fit, pending[key]['side'])
+                fit_cache.put(key, fit, fit_size(fit, pending[key]['side']))
+    
+    report('allocate', len(pending))
+    for index, (scenario, key) in sorted(inputs.items()):
+        fit = fits[key]
+        if isinstance(fit, Exception):
+            errors.append({'index': index, 'ticker': scenario['ticker'], 'error': str(fit) or type(fit).__name__})
+        elif fit is None:
+            errors.append({'index': index, 'ticker': scenario['ticker'], 'error': 'Insufficient data to fit models'})
+        else:
+            results[index] = analysis_result(
+                scenario['ticker'], fit, scenario['sample_rows'], scenario['order_size_points'],
+                scenario['book_depth_pct'], scenario['total_shares'], scenario['num_intervals'],
+                scenario['sampling'], scenario['slippage_format'], scenario['max_points'], scenario['date'],
+                scenario['bootstrap'], scenario['confidence'], scenario['seed'], scenario['side']
+            )
+            pinned = pin_inputs(scenario, key)
+            results[index]['result_id'] = remember_result(pinned)
+            if exports is not None:
+                exports.append((index, pinned))
+    
+    errors.sort(key=lambda error: error['index'])
+    return results, errors
 
-def calculate_comparison_metrics(results):
-    """Calculate comparison metrics between scenarios."""
+def calculate_comparison_metrics(results, indices=None):
+    """
+    Calculate comparison metrics between scenarios.
+    
+    Metrics are keyed by ticker and the scenario's position in the request
+    (`indices`), so keys do not shift when an earlier scenario fails. Two-sided
+    scenarios get one entry per side, suffixed with `_buy` and `_sell`.
+    """
     if len(results) < 2:
         return {}
 
+    if indices is None:
+        indices = range(len(results))
+
     metrics = {}
-    for i, result in enumerate(results):
-        key = f"{result['ticker']}_{i}"
-        metrics[key] = {
-            'total_cost': result['risk_metrics']['total_slippage_cost'],
-            'max_allocation': result['risk_metrics']['max_allocation'],
-            'allocation_variance': result['risk_metrics']['allocation_variance']
-        }
+    for i, result in zip(indices, results):
+        if 'sides' in result:
+            sides = {f"{result['ticker']}_{i}_{side}": analysis
+                     for side, analysis in result['sides'].items() if analysis is not None}
+        else:
+            sides = {f"{result['ticker']}_{i}": result}
+        for key, analysis in sides.items():
+            metrics[key] = {
+                'total_cost': analysis['risk_metrics']['total_slippage_cost'],
+                'max_allocation': analysis['risk_metrics']['max_allocation'],
+                'allocation_variance': analysis['risk_metrics']['allocation_variance']
+            }
 
     return metrics
 
-@app.route('/api/export', methods=['POST'])
+@app.route('/api/backtest', methods=['POST'])
+def backtest_schedules():
+    """
+    Replay allocation schedules against the ticker's recorded order book.
+    
+    Takes an `/api/analyze` body plus `schedules` (names from `SCHEDULES`, or
+    `{"name": ..., "allocations": [...]}` with one share count per interval) and
+    `execution` ('average' or 'first', see `replay_schedules`). The day is split
+    into `trading_intervals` windows, and every schedule is executed against the
+    real ask book of each window in one vectorized replay. Each schedule reports
+    the realized slippage cost next to the cost predicted by the fitted power law.
+    """
+    params = request.json or {}
+    try:
+        inputs = scenario_inputs(params)
+        execution = params.get('execution', 'average')
+        if execution not in EXECUTION_MODES:
+            raise ValueError(f"execution must be one of {', '.join(EXECUTION_MODES)}")
+        requested = params.get('schedules', list(SCHEDULES))
+        if not isinstance(requested, list) or not requested:
+            raise ValueError('schedules must be a non-empty list')
+        if inputs['num_intervals'] < 1:
+            raise ValueError('trading_intervals must be a positive integer')
+        if inputs['side'] != 'buy':
+            raise ValueError("Backtests replay the ask book, so side must be 'buy'")
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if inputs['file_path'] is None:
+        return jsonify({'error': data_not_found(inputs['ticker'], inputs['date'])}), 404
+    
+    fit = cached_fit(inputs['file_path'], inputs['sample_rows'], inputs['order_size_points'],
+                     inputs['book_depth_pct'], sampling=inputs['sampling'], stride=inputs['stride'],
+                     seed=inputs['seed'])
+    if fit is None:
+        return jsonify({'error': 'Insufficient data to fit models'}), 400
+    popt_power = fit['popt_power']
+    total_shares, num_intervals = inputs['total_shares'], inputs['num_intervals']
+    optimal, _ = cached_allocation(total_shares, num_intervals, popt_power)
+    
+    names, allocations = [], []
+    try:
+        for schedule in requested:
+            if isinstance(schedule, dict):
+                name = schedule.get('name', f'custom_{len(names)}')
+                shares = np.asarray(schedule.get('allocations'), dtype=float)
+                if shares.shape != (num_intervals,) or np.any(shares < 0) or not np.all(np.isfinite(shares)):
+                    raise ValueError(f'allocations of schedule {name!r} must be {num_intervals} non-negative share counts')
+            else:
+                name, shares = schedule, schedule_allocations(schedule, total_shares, num_intervals, optimal)
+            names.append(str(name))
+            allocations.append(shares)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    allocations = np.array(allocations)
+    
+    with metrics.timed('replay'):
+        replay = replay_schedules(load_depth_index(inputs['file_path']), allocations, execution)
+    a, b = popt_power
+    predicted = power_law_model(allocations, a, b) * allocations
+    
+    schedules = []
+    for i, name in enumerate(names):
+        realized = replay['costs'][i]
+        unfilled = np.flatnonzero(np.isnan(realized))
+        schedules.append({
+            'name': name,
+            'allocations': allocations[i].tolist(),
+            'predicted_cost': float(predicted[i].sum()),
+            # Only intervals the visible book could fill are included in the realized total
+            'realized_cost': float(np.nansum(realized)),
+            'predicted_interval_costs': predicted[i].tolist(),
+            'realized_interval_costs': nan_to_none(realized),
+            'fillable_fraction': replay['fillable'][i].tolist(),
+            'unfilled_intervals': unfilled.tolist()
+        })
+    
+    return jsonify({
+        'ticker': inputs['ticker'],
+        'date': inputs['date'],
+        'execution': execution,
+        'model_params': {'power_law': {'a': float(a), 'b': float(b)}},
+        'intervals': {
+            'bounds': format_bounds(replay['bounds']),
+            'snapshots': replay['snapshots'].tolist()
+        },
+        'schedules': schedules
+    })
+
+@app.route('/api/intraday', methods=['POST'])
+def intraday_allocation():
+    """
+    Fit the impact model per time-of-day bucket and allocate with each interval's own (a, b).
+    
+    Takes an `/api/analyze` body (with `side` 'buy' or 'sell'; every snapshot is
+    used, so the sampling options do not apply) plus `bucket_minutes` (default 30)
+    and an optional `start`/`end` execution window, the file's time range by
+    default. The window is split into `trading_intervals` equal-duration intervals,
+    each priced with the fit of the bucket its midpoint falls in (the whole-day
+    fit if that bucket has too few snapshots). The bucket statistics of a file are
+    kept between requests and only rows appended since the last one are added, so
+    an intraday refit costs O(buckets) rather than a pass over the day.
+    """
+    params = request.json or {}
+    try:
+        inputs = scenario_inputs(params)
+        side = parse_side_param(params, two_sided=False)
+        bucket_minutes = float(params.get('bucket_minutes', 30))
+        if not 1 <= bucket_minutes <= 1440:
+            raise ValueError('bucket_minutes must be between 1 and 1440')
+        start = parse_timestamp(params['start']) if params.get('start') else None
+        end = parse_timestamp(params['end']) if params.get('end') else None
+        if inputs['num_intervals'] < 1:
+            raise ValueError('trading_intervals must be a positive integer')
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if inputs['file_path'] is None:
+        return jsonify({'error': data_not_found(inputs['ticker'], inputs['date'])}), 404
+    
+    with intraday_lock:
+        with metrics.timed('intraday'):
+            model, update = intraday_model(inputs['file_path'], inputs['order_size_points'],
+                                           inputs['book_depth_pct'], side, bucket_minutes)
+        if model.day is None:
+            return jsonify({'error': 'Insufficient data to fit models'}), 400
+        start = model.time_range[0] if start is None else start
+        end = model.time_range[1] if end is None else end
+        if end <= start:
+            return jsonify({'error': 'end must be after start'}), 400
+        num_intervals = inputs['num_intervals']
+        bounds = np.linspace(start, end, num_intervals + 1).astype(np.int64)
+        bounds[-1] = end
+        buckets, a, b, whole_day = model.interval_params(bounds)
+        day, bucket_fits = model.day, model.buckets()
+        interval_buckets = [time_of_day(bucket * model.bucket_ns) for bucket in buckets]
+    
+    total_shares = inputs['total_shares']
+    with metrics.timed('allocate'):
+        allocations = solve_trade_allocation(total_shares, num_intervals, (a, b))
+    single, _ = cached_allocation(total_shares, num_intervals, (day['a'], day['b']))
+    
+    return jsonify({
+        'ticker': inputs['ticker'],
+        'date': inputs['date'],
+        'side': side,
+        'bucket_minutes': bucket_minutes,
+        'update': update,
+        'day_model': day,
+        'buckets': bucket_fits,
+        'intervals': {
+            'bounds': format_bounds(bounds),
+            'bucket': interval_buckets,
+            'a': a.tolist(),
+            'b': b.tolist(),
+            'whole_day_fit': whole_day.tolist()
+        },
+        'allocation': allocations.tolist(),
+        'interval_costs': (power_law_model(allocations, a, b) * allocations).tolist(),
+        'risk_metrics': calculate_risk_metrics(allocations, (a, b)),
+        # The whole-day model's allocation, costed with the bucket fits for comparison
+        'whole_day_allocation': {
+            'allocation': single.tolist(),
+            'total_slippage_cost': float(np.sum(power_law_model(single, a, b) * single))
+        }
+    })
+
+def intraday_model(file_path, order_size_points, book_depth_pct, side, bucket_minutes):
+    """
+    Return the time-bucketed impact model of a file, brought up to date, and a summary of the update.
+    
+    Only rows added to the file since the model was last updated are walked, and
+    only the buckets they fall in are refitted; a file that was rewritten rather
+    than appended to gets a new model. Call with `intraday_lock` held.
+    """
+    book, timestamps = load_timestamped_book(file_path)
+    key = (os.path.abspath(file_path), int(order_size_points), round(float(book_depth_pct), 10), side,
+           float(bucket_minutes))
+    model = intraday_models.get(key)
+    rebuilt = model is None or not model.extends(timestamps)
+    if rebuilt:
+        model = BucketedImpactModel(bucket_minutes, order_size_points, book_depth_pct, side)
+    added = model.update(book, timestamps)
+    refit = model.refit()
+    intraday_models.put(key, model, model.nbytes)
+    return model, {'rows': model.rows, 'rows_added': added, 'buckets_refit': refit, 'rebuilt': rebuilt}
+
+def parse_interval_limits(value, num_intervals, name):
+    """Read a per-interval limit given as one number or a list (null for no limit), as an array."""
+    if value is None:
+        return None
+    limits = np.array([np.inf if item is None else float(item) for item in
+                       (value if isinstance(value, list) else [value] * num_intervals)])
+    if len(limits) != num_intervals or np.any(limits <= 0):
+        raise ValueError(f'{name} must be one positive number or a list of {num_intervals}')
+    return limits
+
+@app.route('/api/portfolio', methods=['POST'])
+def portfolio_allocation():
+    """
+    Allocate a basket of orders across intervals jointly, under shared per-interval limits.
+    
+    The body lists `orders`, each with a `ticker` and `total_shares` and optionally
+    its power-law `a` and `b` (fitted from the ticker's data with the request's
+    `/api/analyze` parameters if omitted), a `price` (the day's mean mid price if
+    omitted) and `max_shares_per_interval`. `interval_share_limit` caps the shares
+    of the whole basket and `interval_cash_limit` its notional in each of the
+    `trading_intervals`, given as one number or a list with one entry per interval.
+    """
+    params = request.json or {}
+    orders = params.get('orders')
+    try:
+        if not isinstance(orders, list) or not orders:
+            raise ValueError('orders must be a non-empty list')
+        num_intervals = int(params.get('trading_intervals', 10))
+        if num_intervals < 1:
+            raise ValueError('trading_intervals must be a positive integer')
+        share_limit = parse_interval_limits(params.get('interval_share_limit'), num_intervals, 'interval_share_limit')
+        cash_limit = parse_interval_limits(params.get('interval_cash_limit'), num_intervals, 'interval_cash_limit')
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = []
+    try:
+        for order in orders:
+            inputs = scenario_inputs({**params, **order})
+            if inputs['side'] == 'both':
+                raise ValueError("side of a basket order must be 'buy' or 'sell'")
+            row = {'ticker': inputs['ticker'], 'total_shares': float(order.get('total_shares', 0)),
+                   'cap': float(order.get('max_shares_per_interval', np.inf))}
+            if 'a' in order and 'b' in order:
+                row['a'], row['b'] = float(order['a']), float(order['b'])
+            else:
+                if inputs['file_path'] is None:
+                    return jsonify({'error': data_not_found(inputs['ticker'], inputs['date'])}), 404
+                fit = cached_fit(inputs['file_path'], inputs['sample_rows'], inputs['order_size_points'],
+                                 inputs['book_depth_pct'], sampling=inputs['sampling'], stride=inputs['stride'],
+                                 seed=inputs['seed'], side=inputs['side'])
+                if fit is None:
+                    return jsonify({'error': f"Insufficient data to fit models for {inputs['ticker']}"}), 400
+                row['a'], row['b'] = (float(value) for value in fit['popt_power'])
+            if 'price' in order:
+                row['price'] = float(order['price'])
+            elif cash_limit is not None:
+                if inputs['file_path'] is None:
+                    raise ValueError(f"price is required for {inputs['ticker']} with interval_cash_limit")
+                row['price'] = float(np.nanmean(load_depth_index(inputs['file_path']).mid_prices))
+            rows.append(row)
+        
+        coupling, names = [], []
+        if share_limit is not None:
+            coupling.append((np.ones(len(rows)), share_limit))
+            names.append('shares')
+        if cash_limit is not None:
+            coupling.append((np.array([row['price'] for row in rows]), cash_limit))
+            names.append('cash')
+        with metrics.timed('portfolio'):
+            solution = solve_portfolio_allocation(
+                [row['total_shares'] for row in rows], [row['a'] for row in rows], [row['b'] for row in rows],
+                num_intervals, np.array([row['cap'] for row in rows])[:, None], coupling)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not solution['converged']:
+        return jsonify({'error': 'The per-interval limits could not be met; the basket may be infeasible',
+                        'max_violation': solution['max_violation'], 'iterations': solution['iterations']}), 400
+    
+    allocations = solution['allocations']
+    intervals = {}
+    for name, (weights, limit), multipliers in zip(names, coupling, solution['multipliers']):
+        intervals[name] = {'limit': nan_to_none(np.where(np.isinf(limit), np.nan, limit)),
+                           'usage': (weights @ allocations).tolist(),
+                           'shadow_price': multipliers.tolist()}
+    
+    return jsonify({
+        'orders': [{**{key: value for key, value in row.items() if key != 'cap'},
+                    'allocations': allocations[i].tolist(),
+                    'predicted_cost': float(solution['costs'][i])}
+                   for i, row in enumerate(rows)],
+        'total_cost': float(solution['costs'].sum()),
+        'intervals': intervals,
+        'solver': {'iterations': solution['iterations'], 'max_violation': solution['max_violation']}
+    })
+
+def parse_sweep_axis(params, name, default, parse, minimum):
+    """
+    Read one axis of a sweep: a single value, a list, or a {"start", "stop", "step"} range (stop included).
+    
+    Returns:
+        list: The distinct values in increasing order.
+    """
+    value = params.get(name, default)
+    if isinstance(value, dict):
+        if not {'start', 'stop', 'step'} <= set(value):
+            raise ValueError(f'{name} range needs start, stop and step')
+        start, stop, step = (float(value[key]) for key in ('start', 'stop', 'step'))
+        if step <= 0 or stop < start:
+            raise ValueError(f'{name} range needs step > 0 and stop >= start')
+        value = [start + i * step for i in range(int(np.floor((stop - start) / step + 1e-9)) + 1)]
+    elif not isinstance(value, list):
+        value = [value]
+    values = sorted({parse(item) for item in value})
+    if not values or values[0] < minimum:
+        raise ValueError(f'{name} needs at least one value, all at least {minimum}')
+    return values
+
+def sweep_inputs(params):
+    """
+    Normalize a sweep request (raises ValueError if invalid); `file_path` is None when there is no data file.
+    """
+    ticker = params.get('ticker')
+    data_file = catalog.resolve(ticker, params.get('date'))
+    axes = {
+        'sample_size': parse_sweep_axis(params, 'sample_size', 1000, int, 1),
+        'order_size_points': parse_sweep_axis(params, 'order_size_points', 20, int, 2),
+        'book_depth_pct': parse_sweep_axis(params, 'book_depth_pct', 50, float, 1e-9),
+        'trading_intervals': parse_sweep_axis(params, 'trading_intervals', 10, int, 1),
+        'total_shares': parse_sweep_axis(params, 'total_shares', 50000, int, 1)
+    }
+    if int(np.prod([len(values) for values in axes.values()])) > MAX_SWEEP_CELLS:
+        raise ValueError(f'The sweep has more than {MAX_SWEEP_CELLS} grid points')
+    if len(axes['sample_size']) * len(axes['order_size_points']) * len(axes['book_depth_pct']) > MAX_SWEEP_FITS:
+        raise ValueError(f'The sweep needs more than {MAX_SWEEP_FITS} model fits')
+    return {
+        'ticker': ticker,
+        'date': data_file['date'] if data_file else params.get('date'),
+        'file_path': data_file['path'] if data_file else None,
+        'axes': axes,
+        'side': parse_side_param(params, two_sided=False),
+        **parse_sampling_params(params)
+    }
+
+@app.route('/api/sweep', methods=['POST'])
+def parameter_sweep():
+    """
+    Analyze a ticker over a grid of parameters in one request.
+    
+    `sample_size`, `order_size_points`, `book_depth_pct`, `trading_intervals` and
+    `total_shares` each take one value, a list or a {"start", "stop", "step"}
+    range; the other `/api/analyze` options apply to every grid point. See
+    `run_sweep` for how work is shared across the grid.
+    """
+    try:
+        inputs = sweep_inputs(request.json or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if inputs['file_path'] is None:
+        return jsonify({'error': data_not_found(inputs['ticker'], inputs['date'])}), 404
+    
+    result = run_sweep(inputs)
+    if profile_requested():
+        result['profile'] = stop_profile()
+    return jsonify(result)
+
+def run_sweep(inputs, progress=None):
+    """
+    Run a parameter sweep, computing every intermediate result once.
+    
+    The grid is planned as a dependency graph: a fit depends on its slippage points,
+    which depend on (sample rows, order_size_points, book_depth_pct), which depend
+    on the sampled rows. Fits already in the fit cache are reused. For 'head'
+    sampling the largest sample is read once and every smaller one is a prefix of
+    it; 'reservoir' reads one sample per size; 'stride' and 'full' (which ignore
+    `sample_size`) stream the file once for every order-size grid together. The
+    allocations of every (fit, trading_intervals, total_shares) are then solved in
+    one batch.
+    
+    Returns:
+        dict: The axes, (sample_size x order_size_points x book_depth_pct) fit
+        arrays, (... x trading_intervals x total_shares) allocation metric arrays,
+        null where a fit failed, and how often each stage ran.
+    """
+    file_path, axes = inputs['file_path'], inputs['axes']
+    sampling, stride, seed, side = inputs['sampling'], inputs['stride'], inputs['seed'], inputs['side']
+    stages = {'loads': 0, 'walks': 0, 'fits': 0, 'fit_cache_hits': 0, 'allocations': 0, 'allocation_cache_hits': 0}
+    
+    def report(stage, **counts):
+        if progress is not None:
+            progress(stage=stage, **counts)
+    
+    # Plan: every fit cell maps to a fit key; cells sharing a key share all work
+    cells = {}
+    for i, sample_rows in enumerate(axes['sample_size']):
+        for j, points in enumerate(axes['order_size_points']):
+            for k, depth_pct in enumerate(axes['book_depth_pct']):
+                cells[i, j, k] = (fit_cache_key(file_path, sample_rows, points, depth_pct / 100,
+                                                sampling, stride, seed, side),
+                                  sample_rows, points, depth_pct / 100)
+    fits, missing = {}, {}
+    for key, sample_rows, points, depth in cells.values():
+        if key in fits or key in missing:
+            continue
+        fit = fit_cache.get(key, default=key)
+        if fit is key:
+            missing[key] = (sample_rows, points, depth)
+        else:
+            fits[key] = fit
+            stages['fit_cache_hits'] += 1
+    
+    done = 0
+    report('sample', fits_done=done, fits_total=len(missing))
+    def store(key, sample):
+        nonlocal done
+        fit = fit_sample(sample)
+        record_fit_outcome(fit)
+        fit_cache.put(key, fit, fit_size(fit))
+        fits[key] = fit
+        stages['fits'] += 1
+        done += 1
+        report('fit', fits_done=done, fits_total=len(missing))
+    
+    if missing and sampling in ('head', 'reservoir'):
+        sizes = sorted({sample_rows for sample_rows, _, _ in missing.values()})
+        books = {}
+        with metrics.timed('load'):
+            if sampling == 'head':
+                chunks = list(head_sample(iter_book_chunks(file_path), sizes[-1]))
+                largest = OrderBook(*(np.concatenate(columns) for columns in zip(*chunks))) if chunks else None
+                stages['loads'] += 1
+                for size in sizes:
+                    books[size] = None if largest is None else OrderBook(*(column[:size] for column in largest))
+            else:
+                for size in sizes:
+                    books[size] = reservoir_sample(iter_book_chunks(file_path), size, seed)
+                    stages['loads'] += 1
+        for key, (sample_rows, points, depth) in missing.items():
+            with metrics.timed('sample'):
+                sample = book_slippage(books[sample_rows], points, depth, (side,))[side]
+            stages['walks'] += 1
+            store(key, sample)
+    elif missing:
+        grids = [(points, depth) for _, points, depth in missing.values()]
+        with metrics.timed('sample'):
+            chunks = metrics.timed_iter(iter_book_chunks(file_path), 'load')
+            samples = [sample[side] for sample in aggregate_slippage(chunks, grids, sampling, stride, (side,))]
+            chunks.close()
+        stages['loads'] += 1
+        stages['walks'] += len(grids)
+        for key, sample in zip(missing, samples):
+            store(key, sample)
+    
+    # Allocations of every distinct (total_shares, intervals, a, b), solved together
+    report('allocate', fits_done=done, fits_total=len(missing))
+    allocations, problems = {}, []
+    for fit in {id(fit): fit for fit in fits.values() if fit is not None}.values():
+        a, b = (float(value) for value in fit['popt_power'])
+        for intervals in axes['trading_intervals']:
+            for shares in axes['total_shares']:
+                key = (int(shares), int(intervals), a, b)
+                if key in allocations:
+                    continue
+                cached = allocation_cache.get(key)
+                if cached is None:
+                    problems.append(key)
+                    allocations[key] = None
+                else:
+                    allocations[key] = cached
+                    stages['allocation_cache_hits'] += 1
+    if problems:
+        with metrics.timed('allocate'):
+            solved = solve_trade_allocation_batch([(shares, intervals, a, b) for shares, intervals, a, b in problems])
+            for key, allocation in zip(problems, solved):
+                shares, intervals, a, b = key
+                if allocation is None:
+                    metrics.inc('slippage_allocation_fallbacks_total')
+                    allocation = np.full(intervals, shares / intervals)
+                allocations[key] = (allocation, calculate_risk_metrics(allocation, (a, b)))
+                allocation_cache.put(key, allocations[key], allocation.nbytes + 1024)
+        stages['allocations'] = len(problems)
+    
+    fit_shape = tuple(len(axes[name]) for name in ('sample_size', 'order_size_points', 'book_depth_pct'))
+    grid_shape = fit_shape + (len(axes['trading_intervals']), len(axes['total_shares']))
+    fit_arrays = {name: np.full(fit_shape, np.nan) for name in ('a', 'b', 'beta', 'rmse')}
+    metric_arrays = {name: np.full(grid_shape, np.nan) for name in ('total_slippage_cost', 'max_allocation',
+                                                                    'allocation_std')}
+    for cell, (key, _, _, _) in cells.items():
+        fit = fits[key]
+        if fit is None:
+            continue
+        a, b = (float(value) for value in fit['popt_power'])
+        fit_arrays['a'][cell], fit_arrays['b'][cell] = a, b
+        fit_arrays['beta'][cell] = float(fit['popt_linear'][0])
+        fit_arrays['rmse'][cell] = fit['diagnostics']['power_law']['rmse']
+        for m, intervals in enumerate(axes['trading_intervals']):
+            for n, shares in enumerate(axes['total_shares']):
+                risk_metrics = allocations[int(shares), int(intervals), a, b][1]
+                for name in metric_arrays:
+                    metric_arrays[name][cell + (m, n)] = risk_metrics[name]
+    
+    return {
+        'ticker': inputs['ticker'],
+        'date': inputs['date'],
+        'sampling': sampling,
+        'side': side,
+        'axes': axes,
+        'fits': {name: nan_to_none(values) for name, values in fit_arrays.items()},
+        'allocations': {name: nan_to_none(values) for name, values in metric_arrays.items()},
+        'stages': stages
+    }
+
+@app.route('/api/jobs', methods=['GET', 'POST'])
+def analysis_jobs():
+    """
+    Start an analysis in the background, or list the current jobs on GET.
+    
+    The body is an `/api/analyze` request, or an `/api/compare` or `/api/sweep`
+    request with `"type": "compare"` or `"type": "sweep"`. Responds 202 with the
+    job id right away; poll
+    `/api/jobs/<id>`, stream `/api/jobs/<id>/events` and fetch `/api/jobs/<id>/result`.
+    """
+    if request.method == 'GET':
+        return jsonify([job.snapshot() for job in job_manager.jobs()])
+    
+    params = request.json or {}
+    kind = params.get('type', 'analyze')
+    try:
+        if kind == 'analyze':
+            inputs = scenario_inputs(params)
+            if inputs['file_path'] is None:
+                return jsonify({'error': data_not_found(inputs['ticker'], inputs['date'])}), 404
+            function = run_analyze_job
+        elif kind == 'compare':
+            inputs = {'scenarios': params.get('scenarios', []),
+                      'timeout': float(params.get('timeout', COMPARE_TIMEOUT_S))}
+            if not isinstance(inputs['scenarios'], list):
+                raise ValueError('scenarios must be a list')
+            function = run_compare_job
+        elif kind == 'sweep':
+            inputs = sweep_inputs(params)
+            if inputs['file_path'] is None:
+                return jsonify({'error': data_not_found(inputs['ticker'], inputs['date'])}), 404
+            function = run_sweep_job
+        else:
+            raise ValueError("type must be 'analyze', 'compare' or 'sweep'")
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        job = job_manager.submit(kind, function, inputs)
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    response = jsonify(job.snapshot())
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+def run_analyze_job(job):
+    """Run an analyze job, reporting progress to it."""
+    s = job.params
+    # Keyed before the fit, so an export refuses the result if the file changes while it runs
+    fit_key = fit_cache_key(s['file_path'], s['sample_rows'], s['order_size_points'], s['book_depth_pct'],
+                            s['sampling'], s['stride'], s['seed'], s['side'])
+    result = process_ticker_data_dynamic(
+        s['file_path'], s['ticker'], s['sample_rows'], s['order_size_points'], s['book_depth_pct'],
+        s['total_shares'], s['num_intervals'], s['sampling'], s['stride'], s['seed'],
+        s['slippage_format'], s['max_points'], progress=job.report, date=s['date'],
+        bootstrap=s['bootstrap'], confidence=s['confidence'], side=s['side']
+    )
+    if result is None:
+        raise ValueError('Insufficient data to fit models')
+    pinned = pin_inputs(s, fit_key)
+    result['result_id'] = remember_result(pinned)
+    # Exports of the job read the inputs from here, however long `recent_results` keeps them
+    job.params['exports'] = [(0, pinned)]
+    return result
+
+def run_compare_job(job):
+    """Run a compare job, reporting progress to it."""
+    exports = []
+    result = compare_results(job.params['scenarios'], job.params['timeout'], progress=job.report, exports=exports)
+    job.params['exports'] = exports
+    return result
+
+def run_sweep_job(job):
+    """Run a sweep job, reporting progress to it."""
+    return run_sweep(job.params, progress=job.report)
+
+@app.route('/api/jobs/<job_id>', methods=['GET', 'DELETE'])
+def analysis_job(job_id):
+    """Report a job's status and progress, or cancel it (or discard it once finished) on DELETE."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found or expired'}), 404
+    if request.method == 'DELETE':
+        if job.done:
+            job_manager.remove(job_id)
+        else:
+            job.cancel()
+    return jsonify(job.snapshot())
+
+@app.route('/api/jobs/<job_id>/result')
+def analysis_job_result(job_id):
+    """Return a finished job's result; 202 while it is still queued or running."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found or expired'}), 404
+    snapshot = job.snapshot()
+    if snapshot['status'] == 'succeeded':
+        return jsonify(job.result)
+    if snapshot['status'] in FINISHED_STATES:
+        return jsonify(snapshot), 409
+    return jsonify(snapshot), 202
+
+@app.route('/api/jobs/<job_id>/events')
+def analysis_job_events(job_id):
+    """Stream a job's progress as Server-Sent Events until it finishes."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found or expired'}), 404
+    
+    def events():
+        version = None
+        while True:
+            current = job.wait_for_change(version, JOB_HEARTBEAT_S)
+            if current == version:
+                yield ': keep-alive\n\n'
+                continue
+            version = current
+            snapshot = job.snapshot()
+            finished = snapshot['status'] in FINISHED_STATES
+            yield f"event: {'done' if finished else 'progress'}\ndata: {json.dumps(snapshot)}\n\n"
+            if finished:
+                return
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/export', methods=['GET', 'POST'])
 def export_results():
-    """Export analysis results in various formats."""
+    """
+    Export analysis results as a streamed file, or in the legacy JSON-wrapped form.
+    
+    With a `result_id` (from `/api/analyze` or `/api/compare`) or a `job_id`, as
+    query parameters or in a JSON body, the server rebuilds the results from its
+    analysis caches and streams one `table` ('slippage': every fitted point,
+    'allocations': shares and predicted cost per interval, 'summary': one row per
+    result and side) as `format` 'csv' or 'parquet', gzip-compressed with
+    `compress=gzip`. The fitted points are already held in memory by the cached
+    fit; only their encoding is done and sent in chunks, so the encoded file is
+    never held whole. A result whose data file has changed or gone since it was
+    computed answers 410 or 404 instead of being recomputed from other data.
+    Without either id, a POST body's `results` are converted as before.
+    """
+    params = request.args if request.method == 'GET' else (request.json or {})
+    if 'result_id' not in params and 'job_id' not in params:
+        if request.method == 'GET':
+            return jsonify({'error': 'result_id or job_id is required'}), 400
+        return export_posted_results(params)
+    
+    table = params.get('table', 'summary')
+    export_format = params.get('format', 'csv')
+    compress = params.get('compress') == 'gzip'
+    try:
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"table must be one of {', '.join(EXPORT_TABLES)}")
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        name, source = export_source(params)
+        columns, batches = export_batches(table, source)
+        chunks = stream_table(columns, batches, export_format, compress)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ResultSourceChanged as e:
+        return jsonify({'error': str(e)}), 410
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except JobNotFinished as e:
+        return jsonify(e.snapshot), 409 if e.snapshot['status'] in FINISHED_STATES else 202
+    
+    filename = f'{name}_{table}.{export_format}' + ('.gz' if compress and export_format == 'csv' else '')
+    return Response(metrics.timed_iter(chunks, 'export'),
+                    mimetype='application/gzip' if compress and export_format == 'csv' else MIMETYPES[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+class JobNotFinished(Exception):
+    """Raised by `export_source` for a job without a result; carries the job's snapshot."""
+    
+    def __init__(self, snapshot):
+        super().__init__(snapshot['status'])
+        self.snapshot = snapshot
+
+class ResultSourceChanged(Exception):
+    """Raised by `export_source` when the data file of a result was modified after it was computed."""
+
+def export_source(params):
+    """
+    Resolve the results an export refers to.
+    
+    Returns:
+        tuple: (file name stem, source), where the source is either a list of
+        (position, inputs, fit) for analysis results or a finished sweep result dict.
+        Fits are looked up (or, while the data file is unchanged, recomputed) before
+        streaming starts, so a failure is reported with a status code instead of
+        cutting the file short.
+    """
+    if 'result_id' in params:
+        pinned = recent_results.get(params['result_id'])
+        if pinned is None:
+            raise LookupError(f"Result {params['result_id']} not found or expired")
+        name, exports = f"{pinned['ticker']}_{params['result_id']}", [(0, pinned)]
+    else:
+        job = job_manager.get(params['job_id'])
+        if job is None:
+            raise LookupError(f"Job {params['job_id']} not found or expired")
+        snapshot = job.snapshot()
+        if snapshot['status'] != 'succeeded':
+            raise JobNotFinished(snapshot)
+        name = f'{job.kind}_{job.id}'
+        if job.kind == 'sweep':
+            return name, job.result
+        exports = job.params['exports']
+    return name, [(position, pinned, pinned_fit(pinned)) for position, pinned in exports]
+
+def pinned_fit(pinned):
+    """
+    The fit of a result from its pinned inputs (see `pin_inputs`).
+    
+    Raises:
+        LookupError: If the data file no longer exists.
+        ResultSourceChanged: If the data file was modified since the result was computed.
+    """
+    key = pinned['fit_key']
+    label = f"{pinned['ticker']} on {pinned['date']}"
+    try:
+        fingerprint = source_fingerprint(pinned['file_path'])
+    except FileNotFoundError:
+        raise LookupError(f'Data file of {label} no longer exists') from None
+    if (fingerprint['size'], fingerprint['mtime_ns']) != key[1:3]:
+        raise ResultSourceChanged(f'Data file of {label} changed since the result was computed')
+    fit = fit_cache.get(key, default=key)
+    if fit is key:
+        # Evicted from the cache; the data is unchanged, so the refit is the same fit
+        fit = cached_fit(pinned['file_path'], pinned['sample_rows'], pinned['order_size_points'],
+                         pinned['book_depth_pct'], sampling=pinned['sampling'], stride=pinned['stride'],
+                         seed=pinned['seed'], side=pinned['side'])
+    return fit
+
+def export_batches(table, source):
+    """
+    Lay out one export table of a resolved export source.
+    
+    Returns:
+        tuple: (column names, iterator of column batches of at most EXPORT_CHUNK_ROWS rows)
+    """
+    if isinstance(source, dict):
+        if table != 'summary':
+            raise ValueError("Sweep results only have a 'summary' table")
+        return sweep_export_batches(source)
+    
+    if table == 'slippage':
+        columns = ['result', 'ticker', 'date', 'side', 'order_size', 'slippage', 'count']
+    elif table == 'allocations':
+        columns = ['result', 'ticker', 'date', 'side', 'interval', 'shares', 'predicted_cost']
+    else:
+        columns = ['result', 'ticker', 'date', 'side', 'sampling', 'sample_size', 'order_size_points',
+                   'book_depth_pct', 'a', 'b', 'beta', 'rmse', 'converged', 'total_shares', 'intervals',
+                   'total_slippage_cost', 'max_allocation', 'min_allocation', 'allocation_variance']
+    
+    def batches():
+        summary = {name: [] for name in columns}
+        for position, inputs, fit in source:
+            for side, one_sided in side_fits(fit, inputs['side']).items():
+                if one_sided is None:
+                    continue
+                labels = {'result': position, 'ticker': inputs['ticker'], 'date': inputs['date'], 'side': side}
+                a, b = (float(value) for value in one_sided['popt_power'])
+                if table == 'slippage':
+                    order_sizes = one_sided['slippage_df']['order_size'].to_numpy()
+                    counts = one_sided['counts']
+                    yield from chunk_columns({
+                        **labels, 'order_size': order_sizes,
+                        'slippage': one_sided['slippage_df']['slippage'].to_numpy(),
+                        'count': np.ones(len(order_sizes), dtype=np.int64) if counts is None else counts
+                    }, len(order_sizes))
+                    continue
+                allocations, risk_metrics = cached_allocation(inputs['total_shares'], inputs['num_intervals'], (a, b))
+                if table == 'allocations':
+                    yield from chunk_columns({
+                        **labels, 'interval': np.arange(1, len(allocations) + 1), 'shares': allocations,
+                        'predicted_cost': power_law_model(allocations, a, b) * allocations
+                    }, len(allocations))
+                    continue
+                row = {
+                    **labels, 'sampling': inputs['sampling'], 'sample_size': inputs['sample_rows'],
+                    'order_size_points': inputs['order_size_points'],
+                    'book_depth_pct': inputs['book_depth_pct'] * 100, 'a': a, 'b': b,
+                    'beta': float(one_sided['popt_linear'][0]),
+                    'rmse': one_sided['diagnostics']['power_law']['rmse'],
+                    'converged': one_sided['diagnostics']['power_law']['converged'],
+                    'total_shares': inputs['total_shares'], 'intervals': inputs['num_intervals'],
+                    **{name: risk_metrics[name] for name in ('total_slippage_cost', 'max_allocation',
+                                                             'min_allocation', 'allocation_variance')}
+                }
+                for name in columns:
+                    summary[name].append(row[name])
+        if table == 'summary' and summary['result']:
+            yield {name: np.array(values) for name, values in summary.items()}
+    
+    return columns, batches()
+
+def sweep_export_batches(result):
+    """Lay out a sweep result as one summary row per grid point."""
+    axes = result['axes']
+    names = ['sample_size', 'order_size_points', 'book_depth_pct', 'trading_intervals', 'total_shares']
+    grid = np.meshgrid(*(np.asarray(axes[name]) for name in names), indexing='ij')
+    columns = ['ticker', 'date', 'side'] + names + ['a', 'b', 'beta', 'rmse', 'total_slippage_cost',
+                                                    'max_allocation', 'allocation_std']
+    values = {'ticker': result['ticker'], 'date': result['date'], 'side': result['side'],
+              **{name: values.ravel() for name, values in zip(names, grid)}}
+    shape = grid[0].shape
+    for name in ('a', 'b', 'beta', 'rmse'):
+        fit_values = np.array(result['fits'][name], dtype=float)
+        values[name] = np.broadcast_to(fit_values[..., None, None], shape).ravel()
+    for name in ('total_slippage_cost', 'max_allocation', 'allocation_std'):
+        values[name] = np.array(result['allocations'][name], dtype=float).ravel()
+    return columns, chunk_columns(values, grid[0].size)
+
+def export_posted_results(data):
+    """Legacy export: convert a POSTed `results` object to CSV or JSON text wrapped in a JSON response."""
     try:
-        data = request.json
         format_type = data.get('format', 'json')
         results = data.get('results')
 
         if format_type == 'csv':
             # Convert to CSV format
-            csv_data = convert_to_csv(results)
+            with metrics.timed('export'):
+                csv_data = convert_to_csv(results)
             return jsonify({'data': csv_data, 'filename': f'analysis_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'})
         else:
             # Return JSON format
-            return jsonify({'data': json.dumps(results, indent=2), 'filename': f'analysis_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'})
+            with metrics.timed('export'):
+                json_data = json.dumps(results, indent=2)
+            return jsonify({'data': json_data, 'filename': f'analysis_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -297,4 +1914,5 @@ def convert_to_csv(results):
     return '\n'.join(lines)
 
 if __name__ == '__main__':
+    warm_up(parse_list(PRELOAD_TICKERS, str))
     app.run(debug=True, port=5000)
@@ -0,0 +1,228 @@
+"""
+Benchmarks for the analysis hot paths.
+
+Generates synthetic order books at several scales and times each stage of an
+analysis separately: loading (CSV parse, cache build, cache load), the order
+book walk, the time-bucketed intraday model, model fitting, trade allocation and
+response serialization. Results
+include throughput and peak traced memory and are written as JSON, so that a
+run can be compared against a saved baseline:
+
+    python benchmarks/run_benchmarks.py --rows 10000 100000 --output bench.json
+    python benchmarks/run_benchmarks.py --rows 10000 100000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from book_cache import convert_to_cache, iter_book_chunks, load_book, load_timestamped_book
+from intraday import BucketedImpactModel
+from order_book import BOOK_SIDES, compute_slippage_points, iter_csv_book, side_slippage_points
+from payload import SLIPPAGE_FORMATS, encode_slippage_data
+from slippage_model import calculate_slippage, fit_impact_models
+from streaming import sample_slippage
+from synthetic_book import BOOK_LEVELS, write_book
+from trade_allocation import solve_trade_allocation, solve_trade_allocation_batch
+
+ORDER_SIZE_POINTS = 20
+BOOK_DEPTH_PCT = 0.5
+FIT_SAMPLE_ROWS = 50_000
+SCALAR_BASELINE_ROWS = 200
+ALLOCATION_INTERVALS = (10, 100, 500)
+
+
+def measure(function, repeat=1):
+    """
+    Runs `function` `repeat` times untraced for timing, then once under tracemalloc.
+
+    Tracing slows allocation-heavy code considerably, so peak memory is measured
+    in a separate run rather than alongside the timings.
+
+    Returns:
+        tuple: (best wall time in seconds, peak traced memory in bytes, last return value)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    value = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, value
+
+
+def benchmark_book(csv_path, rows, levels, repeat):
+    """Times every stage for one synthetic book and returns one record per stage."""
+    records = []
+
+    def record(stage, function, items, unit):
+        seconds, peak, value = measure(function, repeat)
+        records.append({
+            'stage': stage, 'rows': rows, 'levels': levels, 'seconds': seconds,
+            'items': items(value) if callable(items) else items, 'unit': unit,
+            'peak_mb': peak / 2**20
+        })
+        records[-1]['throughput'] = records[-1]['items'] / seconds if seconds > 0 else float('inf')
+        print(f"  {stage:<24} {seconds * 1000:10.1f} ms  {records[-1]['throughput']:14,.0f} {unit}/s"
+              f"  peak {records[-1]['peak_mb']:8.1f} MB")
+        return value
+
+    cache_dir = tempfile.mkdtemp(prefix='book_cache_')
+
+    # Load
+    record('load_csv', lambda: sum(len(chunk.bid_top) for chunk in iter_csv_book(csv_path)), rows, 'rows')
+    record('load_cache_build', lambda: convert_to_cache(csv_path, cache_dir), rows, 'rows')
+    record('load_cache', lambda: float(np.nansum(load_book(csv_path, cache_dir=cache_dir).ask_sizes)), rows, 'rows')
+
+    # Book walk over every snapshot, in chunks
+    def walk():
+        points = 0
+        for chunk in iter_book_chunks(csv_path, cache_dir=cache_dir):
+            points += len(compute_slippage_points(chunk, ORDER_SIZE_POINTS, BOOK_DEPTH_PCT)[0])
+        return points
+    record('book_walk', walk, rows * ORDER_SIZE_POINTS, 'walks')
+
+    def two_sided_walk():
+        points = 0
+        for chunk in iter_book_chunks(csv_path, cache_dir=cache_dir):
+            points += sum(len(side[0]) for side in
+                          side_slippage_points(chunk, BOOK_SIDES, ORDER_SIZE_POINTS, BOOK_DEPTH_PCT).values())
+        return points
+    record('book_walk_two_sided', two_sided_walk, 2 * rows * ORDER_SIZE_POINTS, 'walks')
+
+    def scalar_walk():
+        book = load_book(csv_path, nrows=SCALAR_BASELINE_ROWS, cache_dir=cache_dir)
+        for bid, prices, sizes in zip(book.bid_top, book.ask_prices, book.ask_sizes):
+            valid = ~(np.isnan(prices) | np.isnan(sizes))
+            mid = (bid + prices[0]) / 2
+            for x in np.linspace(1, np.nansum(sizes) * BOOK_DEPTH_PCT, ORDER_SIZE_POINTS):
+                calculate_slippage(x, prices[valid].tolist(), sizes[valid].tolist(), mid)
+    record('book_walk_scalar', scalar_walk, min(rows, SCALAR_BASELINE_ROWS) * ORDER_SIZE_POINTS, 'walks')
+
+    record('stream_full_day', lambda: sample_slippage(iter_book_chunks(csv_path, cache_dir=cache_dir), 'full',
+                                                      order_size_points=ORDER_SIZE_POINTS,
+                                                      book_depth_pct=BOOK_DEPTH_PCT).snapshots,
+           rows, 'rows')
+
+    # Time-of-day bucketed model: fold in every row, then refit all buckets from their statistics
+    def bucket_model():
+        model = BucketedImpactModel(1, ORDER_SIZE_POINTS, BOOK_DEPTH_PCT)
+        model.update(*load_timestamped_book(csv_path, cache_dir=cache_dir))
+        return model
+    model = record('intraday_update', bucket_model, rows, 'rows')
+    def bucket_refit():
+        model.dirty[model.snapshots > 0] = True
+        return model.refit()
+    record('intraday_refit', bucket_refit, lambda refit: max(refit, 1), 'buckets')
+
+    # Fit
+    sample = sample_slippage(iter_book_chunks(csv_path, cache_dir=cache_dir), 'head', min(rows, FIT_SAMPLE_ROWS),
+                             ORDER_SIZE_POINTS, BOOK_DEPTH_PCT)
+    fit = record('fit', lambda: fit_impact_models(sample.order_sizes, sample.slippage),
+                 len(sample.order_sizes), 'points')
+    a, b = fit['popt_power']
+
+    # Allocate (fitted parameters, plus a non-convex case that needs SLSQP)
+    for intervals in ALLOCATION_INTERVALS:
+        record(f'allocate_{intervals}', lambda: solve_trade_allocation_batch(
+            [(shares, intervals, a, b) for shares in (10_000, 50_000, 100_000)]), 3, 'problems')
+    record('allocate_bucketed_100', lambda: solve_trade_allocation(
+        50_000, 100, (a * np.linspace(0.5, 2, 100), b * np.linspace(0.8, 1.2, 100))), 1, 'problems')
+    record('allocate_slsqp_100', lambda: solve_trade_allocation_batch(
+        [(shares, 100, a, -abs(b) / 2) for shares in (10_000, 50_000, 100_000)]), 3, 'problems')
+
+    # Serialize
+    for slippage_format in SLIPPAGE_FORMATS:
+        record(f'serialize_{slippage_format}',
+               lambda: len(json.dumps(encode_slippage_data(sample.order_sizes, sample.slippage, slippage_format))),
+               len(sample.order_sizes), 'points')
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return records
+
+
+def compare(records, baseline_path, threshold, min_seconds):
+    """
+    Prints each stage's time relative to the baseline and returns the number of regressions.
+
+    A stage regresses when it is more than `threshold` times slower and took at least
+    `min_seconds`, so sub-millisecond stages do not report timer noise.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r['stage'], r['rows'], r['levels']): r for r in json.load(f)['results']}
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (threshold {threshold:.2f}x):")
+    for r in records:
+        before = baseline.get((r['stage'], r['rows'], r['levels']))
+        if before is None:
+            continue
+        ratio = r['seconds'] / before['seconds'] if before['seconds'] > 0 else float('inf')
+        flag = 'REGRESSION' if ratio > threshold and r['seconds'] >= min_seconds else ''
+        regressions += bool(flag)
+        print(f"  {r['stage']:<24} rows={r['rows']:<9} {ratio:6.2f}x  "
+              f"peak {before['peak_mb']:.1f} -> {r['peak_mb']:.1f} MB  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis hot paths on synthetic order books.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000],
+                        help='Book sizes (snapshots) to benchmark')
+    parser.add_argument('--levels', type=int, nargs='+', default=[BOOK_LEVELS],
+                        help='Populated book levels per side')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage; the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'slippage_benchmarks'),
+                        help='Where synthetic CSVs are generated (and reused between runs)')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Slowdown ratio reported as a regression when comparing')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='Stages faster than this are never reported as regressions')
+    args = parser.parse_args()
+
+    records = []
+    for levels in args.levels:
+        for rows in args.rows:
+            csv_path = os.path.join(args.workdir, f'synthetic_{rows}_{levels}_{args.seed}.csv')
+            if not os.path.exists(csv_path):
+                print(f"Generating {csv_path}")
+                write_book(csv_path, rows, levels, args.seed)
+            print(f"{rows:,} rows, {levels} levels:")
+            records.extend(benchmark_book(csv_path, rows, levels, args.repeat))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': records
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        return 1 if compare(records, args.compare, args.threshold, args.min_seconds) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
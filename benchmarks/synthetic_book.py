@@ -0,0 +1,74 @@
+"""
+Synthetic order book generator for benchmarks.
+
+Writes CSV files with the same columns the analysis reads from the market data
+files (`ts_event`, `bid_px_NN`, `bid_sz_NN`, `ask_px_NN`, `ask_sz_NN` for
+NN = 00..09), so every stage can be timed at any scale without real data.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+BOOK_LEVELS = 10
+
+
+def generate_book(rows, levels=BOOK_LEVELS, seed=0, start_price=50.0, tick=0.01,
+                  missing_level_rate=0.05, start='2025-05-02 13:30:00'):
+    """
+    Generates a synthetic level-10 order book as a DataFrame.
+
+    The mid price follows a random walk on a tick grid, the spread is one to three
+    ticks, each deeper level is one or more ticks further out, and level sizes are
+    lognormal round lots. Levels beyond `levels` are empty, and each populated level
+    below the top is missing with probability `missing_level_rate`.
+    """
+    rng = np.random.default_rng(seed)
+    mid = start_price + tick * np.cumsum(rng.choice([-1, 0, 0, 0, 1], size=rows))
+    half_spread = tick * rng.integers(1, 4, size=rows) / 2
+    start = pd.Timestamp(start)
+    if start.tzinfo is None:
+        start = start.tz_localize('UTC')
+    timestamps = start + pd.to_timedelta(
+        np.cumsum(rng.exponential(20_000_000, size=rows)).astype(np.int64), unit='ns')
+
+    data = {'ts_event': timestamps.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
+    for side, sign in (('bid', -1), ('ask', 1)):
+        offset = half_spread.copy()
+        for level in range(BOOK_LEVELS):
+            if level > 0:
+                offset = offset + tick * rng.integers(1, 3, size=rows)
+            prices = np.round(mid + sign * offset, 2)
+            sizes = (np.ceil(rng.lognormal(5.0, 1.0, size=rows) / 100) * 100).astype(float)
+            if level >= levels:
+                prices[:], sizes[:] = np.nan, np.nan
+            elif level > 0:
+                missing = rng.random(rows) < missing_level_rate
+                prices[missing], sizes[missing] = np.nan, np.nan
+            data[f'{side}_px_{level:02d}'] = prices
+            data[f'{side}_sz_{level:02d}'] = sizes
+    return pd.DataFrame(data)
+
+
+def write_book(path, rows, levels=BOOK_LEVELS, seed=0, chunk_rows=250_000):
+    """Writes a synthetic order book CSV in chunks, so any row count fits in memory."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    start = '2025-05-02 13:30:00'
+    for index, first_row in enumerate(range(0, rows, chunk_rows)):
+        chunk = generate_book(min(chunk_rows, rows - first_row), levels, seed=seed + index, start=start)
+        chunk.to_csv(path, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+        # Continue the clock where this chunk ended
+        start = pd.Timestamp(chunk['ts_event'].iloc[-1]) + pd.Timedelta(microseconds=1)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic order book CSV.')
+    parser.add_argument('path', help='Output CSV path, e.g. Data/SYN/SYN_2025-05-02 00_00_00+00_00.csv')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--levels', type=int, default=BOOK_LEVELS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_book(args.path, args.rows, args.levels, args.seed)
+    print(f"Wrote {args.rows} rows to {args.path}")
@@ -0,0 +1,127 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from app import PRELOAD_TICKERS, app, parse_list, warm_up
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # optional: a built-in pre-fork server is used instead
+    BaseApplication = None
+
+
+def create_app(tickers=None):
+    """
+    Warm up the app in the current process and return it, ready to be forked.
+
+    Usable as a gunicorn app factory: `gunicorn --preload "serve:create_app()"`.
+    `tickers` defaults to PRELOAD_TICKERS.
+    """
+    warm_up(parse_list(PRELOAD_TICKERS, str) if tickers is None else tickers)
+    # Keep the warmed-up objects out of the collector, so that garbage collection
+    # in the workers does not touch (and copy) the pages they share with the parent
+    gc.freeze()
+    return app
+
+
+def run_gunicorn(application, bind, workers, threads, timeout):
+    """Serve a preloaded app with gunicorn's pre-fork workers."""
+    class PreloadedApplication(BaseApplication):
+        def load_config(self):
+            for name, value in {'bind': bind, 'workers': workers, 'threads': threads,
+                                'timeout': timeout, 'preload_app': True}.items():
+                self.cfg.set(name, value)
+
+        def load(self):
+            return application
+
+    PreloadedApplication().run()
+
+
+def exit_with_parent(parent, interval=1.0):
+    """Exit this worker once its parent process has gone, so that workers never outlive the server."""
+    while os.getppid() == parent:
+        time.sleep(interval)
+    os._exit(0)
+
+
+def run_prefork(application, bind, workers, threads):
+    """
+    Serve a preloaded app from `workers` forked processes sharing one listening socket.
+
+    The kernel hands each connection to one of the workers, and each worker serves
+    requests on up to `threads` threads. Workers that exit are replaced; SIGINT or
+    SIGTERM stops them all, and workers exit by themselves if the parent dies.
+    """
+    from werkzeug.serving import make_server
+
+    host, _, port = bind.rpartition(':')
+    listener = socket.create_server((host or '0.0.0.0', int(port)), backlog=2048)
+    listener.set_inheritable(True)
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid:
+            children.add(pid)
+            return
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        threading.Thread(target=exit_with_parent, args=(os.getppid(),), daemon=True).start()
+        server = make_server(host, int(port), application, threaded=threads > 1, fd=listener.fileno())
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    print(f'Serving on http://{bind} with {workers} workers (pid {os.getpid()})', file=sys.stderr)
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            spawn()
+    listener.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the API with preloaded books from forked worker processes.')
+    parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:5000'), help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVE_WORKERS', os.cpu_count() or 1)),
+                        help='Worker processes (default: SERVE_WORKERS or CPU count)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SERVE_THREADS', 4)),
+                        help='Request threads per worker')
+    parser.add_argument('--timeout', type=int, default=300, help='gunicorn worker timeout in seconds')
+    parser.add_argument('--preload', nargs='*', default=None,
+                        help="Tickers to preload, or '*' for all (default: PRELOAD_TICKERS)")
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'prefork'), default='auto',
+                        help='gunicorn if installed (auto), or the built-in pre-fork server')
+    args = parser.parse_args()
+
+    if args.server == 'gunicorn' and BaseApplication is None:
+        parser.error('gunicorn is not installed')
+    application = create_app(args.preload)
+    if args.server != 'prefork' and BaseApplication is not None:
+        run_gunicorn(application, args.bind, args.workers, args.threads, args.timeout)
+    else:
+        run_prefork(application, args.bind, args.workers, args.threads)
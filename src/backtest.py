@@ -0,0 +1,123 @@
+import numpy as np
+
+from order_book import fill_prices, snapshot_rows
+
+SCHEDULES = ('equal', 'optimal', 'front_loaded', 'back_loaded')
+EXECUTION_MODES = ('average', 'first')
+
+# Snapshots priced per vectorized step of a replay
+REPLAY_CHUNK_ROWS = 65_536
+
+
+def schedule_allocations(name, total_shares, num_intervals, optimal=None):
+    """
+    Shares per interval of a named schedule.
+
+    'equal' splits the order evenly, 'front_loaded' and 'back_loaded' scale linearly
+    from num_intervals down to 1 (or up from 1), and 'optimal' is the allocation
+    passed as `optimal`.
+
+    Returns:
+        np.array: (num_intervals,) shares per interval, summing to `total_shares`.
+    """
+    if name == 'optimal':
+        return np.asarray(optimal, dtype=float)
+    if name == 'equal':
+        weights = np.ones(num_intervals)
+    elif name == 'front_loaded':
+        weights = np.arange(num_intervals, 0, -1, dtype=float)
+    elif name == 'back_loaded':
+        weights = np.arange(1, num_intervals + 1, dtype=float)
+    else:
+        raise ValueError(f"schedule must be one of {', '.join(SCHEDULES)}")
+    return total_shares * weights / weights.sum()
+
+
+def interval_windows(timestamps, num_intervals):
+    """
+    Splits a day's snapshots into consecutive trading intervals.
+
+    Intervals have equal duration between the first and last timestamp; if the
+    file has no timestamps, they have an equal number of snapshots instead.
+
+    Returns:
+        tuple: (rows, windows, bounds) — the snapshot rows in time order, the interval
+        of each of them, and the (num_intervals + 1) interval boundaries in
+        nanoseconds (None without timestamps).
+    """
+    rows = snapshot_rows(timestamps)
+    if len(rows) == 0:
+        rows = np.arange(len(timestamps))
+        windows = np.arange(len(rows)) * num_intervals // max(len(rows), 1)
+        return rows, windows, None
+
+    ordered = timestamps[rows]
+    bounds = np.linspace(ordered[0], ordered[-1], num_intervals + 1).astype(np.int64)
+    bounds[-1] = ordered[-1]
+    windows = np.minimum(np.searchsorted(bounds, ordered, side='right') - 1, num_intervals - 1)
+    return rows, windows, bounds
+
+
+def replay_schedules(index, allocations, execution='average', chunk_rows=REPLAY_CHUNK_ROWS):
+    """
+    Executes allocation schedules against the recorded book.
+
+    Each interval's shares of every schedule are bought as one market order
+    against the snapshots of that interval, all schedules and snapshots at once in
+    row chunks. With 'average' execution the cost of an interval is the mean over
+    its snapshots, i.e. the expected cost of trading at a random time in it; with
+    'first' it is the cost at the interval's first quoted snapshot.
+
+    Args:
+        index (DepthIndex): The day's depth index, from `load_depth_index`.
+        allocations (np.array): (schedules x intervals) shares per interval.
+        execution (str): 'average' or 'first'.
+
+    Returns:
+        dict: 'costs' (schedules x intervals) realized slippage cost, NaN where no
+        snapshot of the interval had enough visible depth; 'fillable' (schedules x
+        intervals) fraction of the interval's snapshots that could fill it;
+        'snapshots' per interval; and 'bounds' as in `interval_windows`.
+    """
+    if execution not in EXECUTION_MODES:
+        raise ValueError(f"execution must be one of {', '.join(EXECUTION_MODES)}")
+    allocations = np.atleast_2d(np.asarray(allocations, dtype=float))
+    schedules, intervals = allocations.shape
+    rows, windows, bounds = interval_windows(index.timestamps, intervals)
+
+    if execution == 'first':
+        # Snapshots without a top of book cannot be traded against, so the next one is used
+        quoted = ~np.isnan(index.mid_prices[rows])
+        rows, windows = rows[quoted], windows[quoted]
+        first = np.flatnonzero(np.r_[True, windows[1:] != windows[:-1]]) if len(rows) else np.empty(0, dtype=int)
+        rows, windows = rows[first], windows[first]
+
+    snapshots = np.bincount(windows, minlength=intervals)
+    cost_sums = np.zeros((schedules, intervals))
+    filled = np.zeros((schedules, intervals))
+    for start in range(0, len(rows), chunk_rows):
+        chunk, chunk_windows = rows[start:start + chunk_rows], windows[start:start + chunk_rows]
+        shares = allocations.T[chunk_windows]
+        avg_price = fill_prices(shares, index.level_prices[chunk], index.cum_size[chunk],
+                                index.cum_notional[chunk])
+        cost = (avg_price - index.mid_prices[chunk][:, None]) * shares
+        # An interval with nothing to trade costs nothing, whatever the book
+        cost = np.where(shares > 0, cost, 0.0)
+        ok = ~np.isnan(cost)
+        for schedule in range(schedules):
+            cost_sums[schedule] += np.bincount(chunk_windows, weights=np.where(ok[:, schedule], cost[:, schedule], 0),
+                                               minlength=intervals)
+            filled[schedule] += np.bincount(chunk_windows, weights=ok[:, schedule], minlength=intervals)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        costs = np.where(filled > 0, cost_sums / filled, np.nan)
+        fillable = np.where(snapshots > 0, filled / snapshots, 0.0)
+    costs[:, snapshots == 0] = np.where(allocations[:, snapshots == 0] > 0, np.nan, 0.0)
+    return {'costs': costs, 'fillable': fillable, 'snapshots': snapshots, 'bounds': bounds}
+
+
+def format_bounds(bounds):
+    """ISO 8601 (UTC) strings of interval boundaries in nanoseconds, or None."""
+    if bounds is None:
+        return None
+    return np.datetime_as_string(bounds.view('datetime64[ns]'), timezone='UTC').tolist()
@@ -0,0 +1,398 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from order_book import (BOOK_COLUMNS, BOOK_LEVELS, TIMESTAMP_COLUMN, DepthIndex, OrderBook, depth_index,
+                        frame_book_arrays, frame_timestamps)
+
+CACHE_VERSION = 5
+CACHE_DIR_NAME = '.book_cache'
+CONVERT_CHUNK_ROWS = 200_000
+
+# Array file name -> dtype. Prices stay float64 so slippage numbers are unchanged;
+# sizes are whole share counts and fit exactly in float32 (which also carries NaN).
+# Both ladders are stored so buy and sell analyses share one cache and one read.
+# The ask_level_prices/ask_cum_* arrays are the precomputed DepthIndex of each row.
+CACHE_ARRAYS = {
+    'bid_prices': np.float64,
+    'bid_sizes': np.float32,
+    'ask_prices': np.float64,
+    'ask_sizes': np.float32,
+    'ts_event': np.int64,
+    'ask_level_prices': np.float64,
+    'ask_cum_size': np.float64,
+    'ask_cum_notional': np.float64,
+}
+ROW_ARRAYS = ('ts_event',)
+
+# Every version of a cache's arrays is written to its own `data-*` directory,
+# which the manifest names; files in a published directory are never modified
+DATA_DIR_PREFIX = 'data-'
+
+# Block size in which the parsed part of a source CSV is re-read and hashed
+# before rows appended after it are added to the cache
+DIGEST_BLOCK_BYTES = 1 << 24
+
+
+def source_fingerprint(file_path):
+    """Returns the (size, mtime_ns) pair used to detect changes to a source CSV."""
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def cache_dir_for(file_path):
+    """Returns the directory holding the columnar cache of a source CSV."""
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, CACHE_DIR_NAME, os.path.splitext(name)[0])
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _writer_lock(cache_dir):
+    """
+    Holds the exclusive lock of a cache directory, so only one thread or process writes it at a time.
+
+    Without `fcntl` (Windows) writers are not serialized.
+    """
+    with open(os.path.join(cache_dir, '.lock'), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def write_atomic(path, write):
+    """Writes a file through `write(f)` under a temporary name and renames it into place."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class _RowRange:
+    """
+    Read-only file object over a CSV header line followed by the bytes [start, end) of a file.
+
+    The bytes read from the file are added to the `digest` hash object.
+    """
+
+    def __init__(self, f, header, start, end, digest):
+        self.f = f
+        self.pending = header
+        self.position = start
+        self.end = end
+        self.digest = digest
+        f.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.end - self.position + len(self.pending)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        if len(data) < size and self.position < self.end:
+            block = self.f.read(min(size - len(data), self.end - self.position))
+            self.position += len(block)
+            self.digest.update(block)
+            data += block
+        return data
+
+
+def _prefix_digest(f, offset):
+    """Returns a SHA-1 hash object of the first `offset` bytes of a file."""
+    digest = hashlib.sha1()
+    f.seek(0)
+    remaining = offset
+    while remaining > 0:
+        block = f.read(min(remaining, DIGEST_BLOCK_BYTES))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    return digest
+
+
+def _line_end(f, start, end):
+    """Returns the position after the last newline in bytes [start, end) of a file, or `start` if there is none."""
+    while end > start:
+        block_start = max(start, end - (1 << 20))
+        f.seek(block_start)
+        newline = f.read(end - block_start).rfind(b'\n')
+        if newline >= 0:
+            return block_start + newline + 1
+        end = block_start
+    return start
+
+
+def _cache_chunks(source):
+    """Parses CSV text into chunks of cache arrays, one dict of array name -> rows per chunk."""
+    wanted = set(BOOK_COLUMNS + [TIMESTAMP_COLUMN])
+    for frame in pd.read_csv(source, usecols=lambda c: c in wanted, chunksize=CONVERT_CHUNK_ROWS):
+        book = frame_book_arrays(frame)
+        index = depth_index(book, frame_timestamps(frame))
+        yield {'bid_prices': book.bid_prices, 'bid_sizes': book.bid_sizes,
+               'ask_prices': book.ask_prices, 'ask_sizes': book.ask_sizes,
+               'ts_event': index.timestamps, 'ask_level_prices': index.level_prices,
+               'ask_cum_size': index.cum_size, 'ask_cum_notional': index.cum_notional}
+
+
+def _write_arrays(cache_dir, chunks, current=None, existing_rows=0):
+    """
+    Writes the cache arrays of parsed chunks into a new data directory.
+
+    With `current`, the data directory of the published cache, the first
+    `existing_rows` rows of its arrays are copied ahead of the new rows. The
+    directory is assembled under a temporary name and renamed when complete.
+
+    Returns:
+        tuple: (name of the new data directory, number of rows in its arrays)
+    """
+    staging = tempfile.mkdtemp(dir=cache_dir, prefix='tmp-')
+    try:
+        # First pass: append each chunk to raw scratch files
+        rows = existing_rows
+        scratch = {name: open(os.path.join(staging, f'{name}.raw'), 'w+b') for name in CACHE_ARRAYS}
+        try:
+            for chunk in chunks:
+                for name, dtype in CACHE_ARRAYS.items():
+                    scratch[name].write(np.ascontiguousarray(chunk[name], dtype=dtype).tobytes())
+                rows += len(chunk['ts_event'])
+
+            # Second pass: copy the raw data into .npy files now that the shape is known
+            for name, dtype in CACHE_ARRAYS.items():
+                shape = (rows,) if name in ROW_ARRAYS else (rows, BOOK_LEVELS)
+                scratch[name].seek(0)
+                with ExitStack() as stack:
+                    sources = [scratch[name]]
+                    if existing_rows:
+                        previous = stack.enter_context(open(os.path.join(cache_dir, current, f'{name}.npy'), 'rb'))
+                        np.lib.format.read_magic(previous)
+                        np.lib.format.read_array_header_1_0(previous)
+                        sources.insert(0, previous)
+                    f = stack.enter_context(open(os.path.join(staging, f'{name}.npy'), 'wb'))
+                    np.lib.format.write_array_header_1_0(f, {'descr': np.dtype(dtype).str,
+                                                             'fortran_order': False, 'shape': shape})
+                    for source in sources:
+                        shutil.copyfileobj(source, f, 1 << 24)
+        finally:
+            for name, f in scratch.items():
+                f.close()
+                os.unlink(os.path.join(staging, f'{name}.raw'))
+
+        data_dir = DATA_DIR_PREFIX + os.path.basename(staging)[len('tmp-'):]
+        os.chmod(staging, 0o755)
+        os.rename(staging, os.path.join(cache_dir, data_dir))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return data_dir, rows
+
+
+def _publish(cache_dir, manifest):
+    """
+    Writes the manifest of a cache, then removes the data directories it no longer uses.
+
+    Readers that still map arrays of a removed directory keep their pages; a reader
+    that read the previous manifest but had not opened its arrays yet retries.
+    """
+    write_atomic(os.path.join(cache_dir, 'manifest.json'), lambda f: f.write(json.dumps(manifest).encode()))
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry.startswith(DATA_DIR_PREFIX) and entry != manifest['arrays']:
+            shutil.rmtree(path, ignore_errors=True)
+        elif entry.endswith('.npy'):
+            # Arrays of the cache versions before data directories
+            os.unlink(path)
+    return manifest
+
+
+def convert_to_cache(file_path, cache_dir=None):
+    """
+    Converts the book columns of an order book CSV into memory-mappable .npy files.
+
+    The CSV is parsed in chunks, so peak memory does not depend on the file size.
+    The arrays go to a new data directory and the manifest naming it is written
+    last, with an atomic rename, so readers never see a partial cache or arrays
+    of different versions. The manifest records how far the CSV was parsed and
+    the SHA-1 of the parsed bytes, so that rows appended to it later can be added
+    with `append_to_cache`.
+
+    Returns:
+        dict: The manifest of the written cache.
+    """
+    cache_dir = cache_dir or cache_dir_for(file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    fingerprint = source_fingerprint(file_path)
+
+    with open(file_path, 'rb') as f:
+        end = fingerprint['size']
+        source = _RowRange(f, b'', 0, end, hashlib.sha1())
+        data_dir, rows = _write_arrays(cache_dir, _cache_chunks(source))
+        # Only a file ending in a complete line, and read to its end, can be extended row by row
+        f.seek(max(end - 1, 0))
+        complete = f.read(1) == b'\n' and source.position == end
+
+    manifest = {'version': CACHE_VERSION, 'source': fingerprint, 'rows': rows, 'arrays': data_dir}
+    if complete:
+        manifest.update(offset=end, digest=source.digest.hexdigest())
+    return _publish(cache_dir, manifest)
+
+
+def append_to_cache(file_path, manifest, cache_dir=None):
+    """
+    Adds the rows appended to an order book CSV since its cache was written.
+
+    Only the complete lines after the parsed end recorded in `manifest` are parsed;
+    the existing arrays are copied, not parsed again, into a new data directory
+    that is published like a full conversion. The bytes before the recorded end
+    are re-read and hashed (without parsing) and must match the manifest's
+    digest; a CSV that did not grow, or whose earlier bytes changed anywhere, is
+    converted from scratch instead.
+
+    Returns:
+        dict: The manifest of the updated cache.
+    """
+    cache_dir = cache_dir or cache_dir_for(file_path)
+    fingerprint = source_fingerprint(file_path)
+    offset = manifest.get('offset')
+    with open(file_path, 'rb') as f:
+        if offset is None or fingerprint['size'] <= offset:
+            return convert_to_cache(file_path, cache_dir)
+        digest = _prefix_digest(f, offset)
+        if digest.hexdigest() != manifest.get('digest'):
+            return convert_to_cache(file_path, cache_dir)
+        # A last line still being written is left for the next update
+        end = _line_end(f, offset, fingerprint['size'])
+        data_dir, rows = manifest['arrays'], manifest['rows']
+        if end > offset:
+            f.seek(0)
+            header = f.readline()
+            source = _RowRange(f, header, offset, end, digest)
+            data_dir, rows = _write_arrays(cache_dir, _cache_chunks(source), manifest['arrays'], rows)
+            if source.position != end:
+                # The parser stopped early, so the digest would not cover [0, end)
+                digest = _prefix_digest(f, end)
+
+    return _publish(cache_dir, {'version': CACHE_VERSION, 'source': fingerprint, 'rows': rows,
+                                'arrays': data_dir, 'offset': end, 'digest': digest.hexdigest()})
+
+
+def load_book(file_path, nrows=None, cache_dir=None):
+    """
+    Loads the order book of a CSV file from its columnar cache.
+
+    The cache is (re)built when missing or written by another cache version, and
+    extended with the new rows (or rebuilt) when the source file's size or mtime
+    changed. Arrays are memory-mapped read-only, so
+    repeat loads do no parsing and worker processes share the same pages.
+
+    Args:
+        file_path (str): Path to the source order book CSV.
+        nrows (int): If given, only the first `nrows` snapshots are returned.
+        cache_dir (str): Overrides the default cache location next to the CSV.
+
+    Returns:
+        OrderBook: Memory-mapped views of the book columns.
+    """
+    arrays = _load_arrays(file_path, ('bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes'), nrows, cache_dir)
+    return OrderBook(arrays['bid_prices'][:, 0], arrays['ask_prices'][:, 0], arrays['ask_prices'], arrays['ask_sizes'],
+                     arrays['bid_prices'], arrays['bid_sizes'])
+
+
+def load_depth_index(file_path, cache_dir=None):
+    """
+    Loads the timestamps and precomputed cumulative ask depth of a CSV file from its cache.
+
+    The cache is (re)built as in `load_book`. Everything except the mid prices is
+    memory-mapped.
+
+    Returns:
+        DepthIndex: One row per snapshot, in file order.
+    """
+    arrays = _load_arrays(file_path, ('bid_prices', 'ask_prices', 'ts_event', 'ask_level_prices',
+                                      'ask_cum_size', 'ask_cum_notional'), None, cache_dir)
+    return DepthIndex(arrays['ts_event'], (arrays['bid_prices'][:, 0] + arrays['ask_prices'][:, 0]) / 2,
+                      arrays['ask_level_prices'], arrays['ask_cum_size'], arrays['ask_cum_notional'])
+
+
+def load_timestamped_book(file_path, cache_dir=None):
+    """
+    Loads the order book of a CSV file and the `ts_event` of every snapshot from one version of its cache.
+
+    Returns:
+        tuple: (OrderBook, int64 timestamps), memory-mapped and of equal length.
+    """
+    arrays = _load_arrays(file_path, ('bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes', 'ts_event'),
+                          None, cache_dir)
+    book = OrderBook(arrays['bid_prices'][:, 0], arrays['ask_prices'][:, 0], arrays['ask_prices'],
+                     arrays['ask_sizes'], arrays['bid_prices'], arrays['bid_sizes'])
+    return book, arrays['ts_event']
+
+
+def _is_current(file_path, cache_dir, manifest):
+    return (manifest is not None and manifest.get('version') == CACHE_VERSION
+            and manifest.get('source') == source_fingerprint(file_path)
+            and os.path.isdir(os.path.join(cache_dir, manifest['arrays'])))
+
+
+def _refresh(file_path, cache_dir):
+    """
+    Builds or extends a stale cache under the writer lock and returns its manifest.
+
+    The manifest is read again once the lock is held, so writers that found the
+    same stale cache reuse the result of the first instead of each rebuilding it
+    (and deleting the arrays the others are copying from).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with _writer_lock(cache_dir):
+        manifest = _read_manifest(cache_dir)
+        if _is_current(file_path, cache_dir, manifest):
+            return manifest
+        if (manifest is None or manifest.get('version') != CACHE_VERSION
+                or not os.path.isdir(os.path.join(cache_dir, manifest['arrays']))):
+            return convert_to_cache(file_path, cache_dir)
+        return append_to_cache(file_path, manifest, cache_dir)
+
+
+def _load_arrays(file_path, names, nrows=None, cache_dir=None):
+    """Memory-maps arrays of one published version of a file's cache, building or extending it first if stale."""
+    cache_dir = cache_dir or cache_dir_for(file_path)
+    manifest = _read_manifest(cache_dir)
+    for attempt in range(3):
+        if not _is_current(file_path, cache_dir, manifest):
+            manifest = _refresh(file_path, cache_dir)
+        data_dir = os.path.join(cache_dir, manifest['arrays'])
+        try:
+            return {name: np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r')[:nrows] for name in names}
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+            # Superseded by a newer cache in the meantime, or its arrays were deleted
+            manifest = None
+
+
+def iter_book_chunks(file_path, chunk_rows=50_000, cache_dir=None):
+    """Yields consecutive row slices of a cached order book as OrderBook chunks."""
+    book = load_book(file_path, cache_dir=cache_dir)
+    for start in range(0, len(book.bid_top), chunk_rows):
+        yield OrderBook(*(column[start:start + chunk_rows] for column in book))
@@ -0,0 +1,171 @@
+import numpy as np
+
+from streaming import BIN_EDGES
+
+# Upper bound on the (replicates x snapshots) resampling matrix built at once
+MAX_BATCH_CELLS = 4_000_000
+
+
+def snapshot_bin_sums(order_sizes, slippage, rows):
+    """
+    Sums the slippage points of each snapshot per order-size bin.
+
+    Returns:
+        tuple: (counts, order size sums, slippage sums), each (snapshots x bins) over
+        the snapshots and bins that have at least one point.
+    """
+    _, rows = np.unique(rows, return_inverse=True)
+    used_bins, bins = np.unique(np.searchsorted(BIN_EDGES, order_sizes, side='right'), return_inverse=True)
+    cells = rows.max() + 1 if len(rows) else 0, len(used_bins)
+    flat = np.ravel_multi_index((rows, bins), cells)
+    size = cells[0] * cells[1]
+    return tuple(np.bincount(flat, weights=weights, minlength=size).reshape(cells)
+                 for weights in (None, order_sizes, slippage))
+
+
+def batched_power_law_fit(x, y, w, iterations=100, tolerance=1e-10):
+    """
+    Fits slippage = a * order_size ** b to many weighted point sets at once.
+
+    Each row of `x`, `y`, `w` is one problem, and entries with zero weight are
+    ignored. Like `fit_impact_models`, every problem is seeded with the weighted
+    log-log least-squares fit and then minimizes sum(w * (y - a * x ** b) ** 2),
+    here with Levenberg-Marquardt steps vectorized across all problems.
+
+    Returns:
+        tuple: (a, b, converged) arrays with one entry per problem; a and b are NaN
+        where there were fewer than two distinct order sizes.
+    """
+    used = w > 0
+    log_x = np.log(np.where(used, x, 1.0))
+    log_y = np.log(np.where(used, y, 1.0))
+
+    # Log-log seed
+    total = w.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = (w * log_x).sum(axis=1) / total
+        mean_y = (w * log_y).sum(axis=1) / total
+        dx = log_x - mean_x[:, None]
+        variance = (w * dx ** 2).sum(axis=1)
+        valid = (used.sum(axis=1) >= 2) & (variance > 0)
+        b = np.where(valid, (w * dx * (log_y - mean_y[:, None])).sum(axis=1) / variance, np.nan)
+        a = np.exp(mean_y - b * mean_x)
+
+    def cost(a, b):
+        return (w * (y - a[:, None] * np.exp(b[:, None] * log_x)) ** 2).sum(axis=1)
+
+    current = cost(a, b)
+    damping = np.full(len(a), 1e-3)
+    converged = ~valid
+    for _ in range(iterations):
+        active = ~converged
+        if not active.any():
+            break
+        power = np.exp(b[:, None] * log_x)
+        fitted = a[:, None] * power
+        residual = y - fitted
+        jac_b = fitted * log_x
+        h_aa = (w * power ** 2).sum(axis=1)
+        h_ab = (w * power * jac_b).sum(axis=1)
+        h_bb = (w * jac_b ** 2).sum(axis=1)
+        g_a = (w * power * residual).sum(axis=1)
+        g_b = (w * jac_b * residual).sum(axis=1)
+
+        d_aa, d_bb = h_aa * (1 + damping), h_bb * (1 + damping)
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            determinant = d_aa * d_bb - h_ab ** 2
+            step_a = (g_a * d_bb - h_ab * g_b) / determinant
+            step_b = (d_aa * g_b - h_ab * g_a) / determinant
+            trial = cost(a + step_a, b + step_b)
+        accept = active & np.isfinite(trial) & (trial <= current)
+
+        small = (np.abs(step_a) <= tolerance * np.abs(a)) & (np.abs(step_b) <= tolerance * (np.abs(b) + tolerance))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            flat = (current - trial) <= tolerance * current
+        converged |= accept & (small | flat)
+        a = np.where(accept, a + step_a, a)
+        b = np.where(accept, b + step_b, b)
+        current = np.where(accept, trial, current)
+        damping = np.where(accept, np.maximum(damping / 10, 1e-12), np.minimum(damping * 10, 1e12))
+        # A step that cannot shrink any further means the minimum has been reached
+        converged |= active & ~accept & (damping >= 1e12)
+    return a, b, converged & valid
+
+
+def bootstrap_power_law(order_sizes, slippage, rows, replicates=1000, seed=0):
+    """
+    Bootstrap distribution of the power-law parameters, resampling snapshots.
+
+    Every replicate draws as many snapshots as the sample has, with replacement,
+    and refits the binned power law to all the points of the drawn snapshots. Each
+    snapshot's points are pre-summed per order-size bin, so a batch of replicates
+    reduces to one matrix product of resampling counts with those sums, followed by
+    `batched_power_law_fit` on the resulting bin means.
+
+    Args:
+        order_sizes, slippage (np.array): Raw slippage points.
+        rows (np.array): Snapshot each point came from.
+
+    Returns:
+        tuple: (a, b, converged) arrays with one entry per replicate.
+    """
+    counts, sum_x, sum_y = snapshot_bin_sums(np.asarray(order_sizes, dtype=float),
+                                             np.asarray(slippage, dtype=float), np.asarray(rows))
+    snapshots, bins = counts.shape
+    stacked = np.hstack([counts, sum_x, sum_y])
+    rng = np.random.default_rng(seed)
+    batch = max(1, min(replicates, MAX_BATCH_CELLS // max(snapshots, 1)))
+
+    results = []
+    for start in range(0, replicates, batch):
+        size = min(batch, replicates - start)
+        draws = rng.integers(0, snapshots, size=(size, snapshots))
+        offsets = np.arange(size)[:, None] * snapshots
+        weights = np.bincount((draws + offsets).ravel(), minlength=size * snapshots).reshape(size, snapshots)
+        totals = weights.astype(float) @ stacked
+        w, x, y = totals[:, :bins], totals[:, bins:2 * bins], totals[:, 2 * bins:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            results.append(batched_power_law_fit(x / np.where(w > 0, w, 1), y / np.where(w > 0, w, 1), w))
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def interval(values, estimate, confidence):
+    """Percentile interval of bootstrap `values` around a point estimate, as a dict."""
+    tail = (1 - confidence) / 2
+    low, high = np.quantile(values, [tail, 1 - tail]) if len(values) else (np.nan, np.nan)
+    return {'estimate': float(estimate), 'low': float(low), 'high': float(high),
+            'std': float(np.std(values, ddof=1)) if len(values) > 1 else float('nan')}
+
+
+def bootstrap_intervals(order_sizes, slippage, rows, popt_power, allocations,
+                        replicates=1000, confidence=0.95, seed=0):
+    """
+    Bootstrap confidence intervals for the power-law fit and the cost of an allocation.
+
+    Args:
+        popt_power (tuple): The fitted (a, b), reported as the point estimates.
+        allocations (np.array): Shares per interval of the chosen allocation; its
+            total slippage cost is re-evaluated under every replicate's (a, b).
+
+    Returns:
+        dict: Percentile intervals ('estimate', 'low', 'high', 'std') for 'a', 'b'
+        and 'total_slippage_cost', plus the replicate counts.
+    """
+    a, b, converged = bootstrap_power_law(order_sizes, slippage, rows, replicates, seed)
+    a, b = a[converged], b[converged]
+    allocations = np.asarray(allocations, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        costs = (a[:, None] * allocations ** b[:, None] * allocations).sum(axis=1)
+        estimate_cost = np.sum(popt_power[0] * allocations ** popt_power[1] * allocations)
+    costs = costs[np.isfinite(costs)]
+    return {
+        'method': 'percentile',
+        'resampled': 'snapshots',
+        'confidence': confidence,
+        'replicates': int(replicates),
+        'converged': int(converged.sum()),
+        'snapshots': int(len(np.unique(rows))),
+        'a': interval(a, popt_power[0], confidence),
+        'b': interval(b, popt_power[1], confidence),
+        'total_slippage_cost': interval(costs, estimate_cost, confidence)
+    }
@@ -0,0 +1,225 @@
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+from book_cache import write_atomic
+from order_book import TIMESTAMP_COLUMN
+
+# Market data files are named <TICKER>_<YYYY-MM-DD>...csv inside a <TICKER> directory
+DATE_PATTERN = re.compile(r'_(\d{4}-\d{2}-\d{2})')
+INDEX_FILE_NAME = '.catalog.json'
+INDEX_VERSION = 1
+TAIL_BYTES = 1 << 16
+
+
+def parse_file_date(ticker, file_name):
+    """Returns the trading date ('YYYY-MM-DD') of a ticker's data file, or None if it is not a dated CSV."""
+    if not file_name.endswith('.csv') or not file_name.startswith(f'{ticker}_'):
+        return None
+    match = DATE_PATTERN.match(file_name, len(ticker))
+    return match.group(1) if match else None
+
+
+def _iso_timestamp(value):
+    try:
+        timestamp = pd.Timestamp(value)
+    except ValueError:
+        return None
+    if pd.isna(timestamp):
+        return None
+    return (timestamp if timestamp.tzinfo else timestamp.tz_localize('UTC')).isoformat()
+
+
+def scan_file(path):
+    """
+    Reads the catalog metadata of a data file without parsing it.
+
+    Rows are counted from line breaks, and the time range is taken from the
+    `ts_event` field of the first and last data lines.
+
+    Returns:
+        dict: 'bytes', 'mtime_ns', 'rows', 'start' and 'end' (ISO 8601, or None if
+        the file has no timestamps).
+    """
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        header = f.readline().decode().rstrip('\r\n').split(',')
+        first = f.readline().decode().rstrip('\r\n')
+        f.seek(0)
+        newlines, last_byte = 0, b'\n'
+        while True:
+            block = f.read(1 << 24)
+            if not block:
+                break
+            newlines += block.count(b'\n')
+            last_byte = block[-1:]
+        rows = max(0, newlines - 1 + (last_byte != b'\n'))
+
+        f.seek(max(0, stat.st_size - TAIL_BYTES))
+        tail = [line for line in f.read().decode(errors='replace').splitlines() if line.strip()]
+        last = tail[-1] if tail and rows else ''
+
+    start = end = None
+    if TIMESTAMP_COLUMN in header and rows:
+        column = header.index(TIMESTAMP_COLUMN)
+        fields = first.split(','), last.split(',')
+        if all(len(line) > column for line in fields):
+            start, end = (_iso_timestamp(line[column]) for line in fields)
+    return {'bytes': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rows': rows, 'start': start, 'end': end}
+
+
+class DataCatalog:
+    """
+    Index of the market data files under a root directory: ticker -> date -> file.
+
+    The index is built on first use and refreshed at most every `refresh_interval`
+    seconds; lookups in between do not touch the filesystem. A refresh only lists
+    directories whose mtime changed and only rescans files whose size or mtime
+    changed. The metadata is also saved to `<root>/.catalog.json`, so a restart
+    does not rescan unchanged files.
+    """
+
+    def __init__(self, root, refresh_interval=5.0, persist=True):
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.persist = persist
+        self._tickers = {}
+        self._root_mtime = None
+        self._refreshed = None
+        self._lock = threading.Lock()
+        self._loaded_index = False
+
+    def _index_path(self):
+        return os.path.join(self.root, INDEX_FILE_NAME)
+
+    def _load_index(self):
+        # Seeds file metadata from a previous run; directory mtimes are not trusted
+        # across runs, so every directory is listed once more.
+        self._loaded_index = True
+        try:
+            with open(self._index_path()) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get('version') == INDEX_VERSION:
+            self._tickers = {ticker: {'mtime_ns': None, 'dates': dates}
+                             for ticker, dates in index.get('tickers', {}).items()}
+
+    def _save_index(self):
+        index = {'version': INDEX_VERSION,
+                 'tickers': {ticker: entry['dates'] for ticker, entry in self._tickers.items() if entry['dates']}}
+        try:
+            write_atomic(self._index_path(), lambda f: f.write(json.dumps(index).encode()))
+        except OSError:
+            pass
+
+    def refresh(self, force=False):
+        """
+        Brings the index up to date if it is older than `refresh_interval` (or always with `force`).
+
+        Returns:
+            bool: Whether any ticker or file changed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._refreshed is not None and now - self._refreshed < self.refresh_interval:
+                return False
+            self._refreshed = now
+            if self.persist and not self._loaded_index:
+                self._load_index()
+
+            try:
+                root_mtime = os.stat(self.root).st_mtime_ns
+            except OSError:
+                changed = bool(self._tickers)
+                self._tickers, self._root_mtime = {}, None
+                return changed
+
+            tickers = dict(self._tickers)
+            changed = False
+            if root_mtime != self._root_mtime:
+                names = {name for name in os.listdir(self.root)
+                         if not name.startswith('.') and os.path.isdir(os.path.join(self.root, name))}
+                for name in set(tickers) - names:
+                    del tickers[name]
+                    changed = True
+                for name in names - set(tickers):
+                    tickers[name] = {'mtime_ns': None, 'dates': {}}
+                self._root_mtime = root_mtime
+
+            for ticker, entry in list(tickers.items()):
+                directory = os.path.join(self.root, ticker)
+                try:
+                    mtime = os.stat(directory).st_mtime_ns
+                except OSError:
+                    del tickers[ticker]
+                    changed = True
+                    continue
+                if mtime == entry['mtime_ns']:
+                    continue
+                dates = self._scan_directory(ticker, directory, entry['dates'])
+                changed |= dates != entry['dates']
+                tickers[ticker] = {'mtime_ns': mtime, 'dates': dates}
+
+            # Readers use whichever dict is current, so it is replaced rather than mutated
+            self._tickers = dict(sorted(tickers.items()))
+            if changed and self.persist:
+                self._save_index()
+            return changed
+
+    def _scan_directory(self, ticker, directory, previous):
+        dates = {}
+        for file_name in sorted(os.listdir(directory)):
+            date = parse_file_date(ticker, file_name)
+            if date is None or date in dates:
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                stat = os.stat(path)
+                known = previous.get(date)
+                if (known is not None and known['file'] == file_name and known['bytes'] == stat.st_size
+                        and known['mtime_ns'] == stat.st_mtime_ns):
+                    dates[date] = known
+                else:
+                    dates[date] = {'file': file_name, **scan_file(path)}
+            except OSError:
+                continue
+        return dates
+
+    def _current(self):
+        self.refresh()
+        return self._tickers
+
+    def tickers(self):
+        """
+        Lists every ticker with its dated files.
+
+        Returns:
+            list: Per ticker, 'symbol', 'latest_date' and 'dates' (one dict per date with
+            'date', 'file', 'path', 'bytes', 'rows', 'start' and 'end'), oldest date first.
+        """
+        return [{'symbol': ticker, 'latest_date': max(entry['dates']),
+                 'dates': [self._describe(ticker, date, entry['dates'][date]) for date in sorted(entry['dates'])]}
+                for ticker, entry in self._current().items() if entry['dates']]
+
+    def resolve(self, ticker, date=None):
+        """
+        Finds the file of a ticker on a date (the latest date if None).
+
+        Returns:
+            dict: The file's metadata including its 'path', or None if there is no such file.
+        """
+        entry = self._current().get(ticker)
+        if entry is None or not entry['dates']:
+            return None
+        date = date or max(entry['dates'])
+        file = entry['dates'].get(date)
+        return None if file is None else self._describe(ticker, date, file)
+
+    def _describe(self, ticker, date, file):
+        return {'date': date, 'file': file['file'], 'path': os.path.join(self.root, ticker, file['file']),
+                'bytes': file['bytes'], 'rows': file['rows'], 'start': file['start'], 'end': file['end']}
@@ -0,0 +1,122 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for Parquet exports
+    pa = pq = None
+
+EXPORT_TABLES = ('slippage', 'allocations', 'summary')
+EXPORT_FORMATS = ('csv', 'parquet')
+
+# Rows converted and written per step of an export
+EXPORT_CHUNK_ROWS = 65_536
+
+MIMETYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+
+def chunk_columns(columns, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Splits equal-length columns into batches of at most `chunk_rows` rows.
+
+    Scalar values are broadcast to the length of each batch, so per-result
+    fields such as the ticker can be passed once.
+
+    Yields:
+        dict: Column name -> array of one batch.
+    """
+    for start in range(0, rows, chunk_rows):
+        stop = min(start + chunk_rows, rows)
+        yield {name: values[start:stop] if isinstance(values, np.ndarray)
+               else np.full(stop - start, values, dtype=object) for name, values in columns.items()}
+
+
+def csv_chunks(columns, batches):
+    """Encodes column batches as CSV, yielding the header and then one bytes chunk per batch."""
+    yield (','.join(columns) + '\n').encode()
+    for batch in batches:
+        yield pd.DataFrame(batch, columns=columns).to_csv(header=False, index=False).encode()
+
+
+class _ChunkSink:
+    """Write-only file object collecting what the Parquet writer emits until it is drained."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def parquet_chunks(columns, batches, compression='snappy'):
+    """
+    Encodes column batches as a Parquet file, yielding bytes as each row group is written.
+
+    Every batch becomes one row group and the footer is written at the end, so the
+    file is produced front to back without seeking or holding all rows. The schema
+    is inferred from the first batch and later batches are converted to it.
+    """
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        data = {name: batch[name] for name in columns}
+        if writer is None:
+            table = pa.Table.from_pydict(data)
+            writer = pq.ParquetWriter(sink, table.schema, compression=compression)
+        else:
+            table = pa.Table.from_pydict(data, schema=writer.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compresses a stream of bytes chunks into one gzip stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_table(columns, batches, export_format='csv', gzip=False):
+    """
+    Encodes column batches in an export format.
+
+    With `gzip`, CSV output is wrapped in a gzip stream and Parquet output uses
+    gzip-compressed pages instead of snappy.
+
+    Returns:
+        iterator: Consecutive bytes chunks of the file.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if export_format == 'parquet':
+        if pq is None:
+            raise ValueError('Parquet export requires pyarrow')
+        return parquet_chunks(columns, batches, 'gzip' if gzip else 'snappy')
+    chunks = csv_chunks(columns, batches)
+    return gzip_chunks(chunks) if gzip else chunks
@@ -1,86 +1,227 @@
-import pandas as pd
-import numpy as np
-from scipy.optimize import curve_fit
+import argparse
+import hashlib
 import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# --- Data Models (copied from slippage_model.py) ---
-def power_law_model(x, a, b):
-    return a * (x ** b)
-
-def calculate_slippage(order_size, book_levels_prices, book_levels_sizes, mid_price):
-    shares_remaining = order_size
-    total_cost = 0
-    for price, size in zip(book_levels_prices, book_levels_sizes):
-        if shares_remaining <= 0: break
-        volume_to_take = min(shares_remaining, size)
-        total_cost += volume_to_take * price
-        shares_remaining -= volume_to_take
-    if order_size > 0:
-        return (total_cost / order_size) - mid_price
-    return 0
-
-# --- Trade Allocation (copied from trade_allocation.py) ---
-from scipy.optimize import minimize
-
-def objective_function(x, slippage_params):
-    a, b = slippage_params
-    return np.sum(power_law_model(x, a, b) * x)
-
-def solve_trade_allocation(total_shares, num_intervals, slippage_params):
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - total_shares})
-    bounds = [(0, total_shares) for _ in range(num_intervals)]
-    initial_guess = np.full(num_intervals, total_shares / num_intervals)
-    result = minimize(objective_function, initial_guess, args=(slippage_params,), method='SLSQP', bounds=bounds, constraints=constraints)
-    return result.x if result.success else [np.nan] * num_intervals
+import pandas as pd
+import numpy as np
+from book_cache import write_atomic
+from catalog import DataCatalog
+from order_book import iter_csv_book
+from slippage_model import fit_impact_models
+from streaming import SAMPLING_MODES, sample_slippage
+from trade_allocation import solve_trade_allocation_batch
 
 # --- Main Data Processing ---
-def process_ticker_data(file_path, sample_rows=1000):
-    """Processes a single ticker's data to get slippage model and allocation examples."""
-    df = pd.read_csv(file_path, nrows=sample_rows)
-    df.dropna(subset=['bid_px_00', 'ask_px_00'], inplace=True)
-
-    slippage_points = []
-    for _, row in df.iterrows():
-        ask_prices = [row[f'ask_px_{i:02d}'] for i in range(10) if f'ask_px_{i:02d}' in row and pd.notna(row[f'ask_px_{i:02d}'])]
-        ask_sizes = [row[f'ask_sz_{i:02d}'] for i in range(10) if f'ask_sz_{i:02d}' in row and pd.notna(row[f'ask_sz_{i:02d}'])]
-        if not ask_prices or not ask_sizes: continue
-        mid_price = (row['bid_px_00'] + row['ask_px_00']) / 2
-        order_sizes = np.linspace(1, sum(ask_sizes) * 0.5, 20)
-        for x in order_sizes:
-            slippage = calculate_slippage(x, ask_prices, ask_sizes, mid_price)
-            if slippage > 0:
-                slippage_points.append({'order_size': x, 'slippage': slippage})
-    
-    slippage_df = pd.DataFrame(slippage_points)
-    if slippage_df.empty or len(slippage_df) < 2:
-        return None
+def process_ticker_data(file_path, sample_rows=1000, sampling='head', stride=10, seed=0):
+    """
+    Processes a single ticker's data to get slippage model and allocation examples.
+
+    See `sample_slippage` for the sampling modes; 'stride' and 'full' stream the
+    whole file with flat memory use and report per-bin mean slippage points.
+    """
+    chunks = iter_csv_book(file_path, nrows=sample_rows if sampling == 'head' else None)
+    sample = sample_slippage(chunks, sampling, sample_rows, order_size_points=20, book_depth_pct=0.5,
+                             stride=stride, seed=seed)
+    slippage_df = pd.DataFrame({'order_size': sample.order_sizes, 'slippage': sample.slippage})
 
     # Fit model
-    popt_power, _ = curve_fit(power_law_model, slippage_df['order_size'], slippage_df['slippage'], p0=[1e-5, 1.5], maxfev=5000)
-    a, b = popt_power
+    fit = fit_impact_models(sample.order_sizes, sample.slippage, sample.counts, sample.binned)
+    if fit is None:
+        return None
+    a, b = fit['popt_power']
 
     # Generate allocation examples
+    share_totals = [10000, 50000, 100000]
+    solved = solve_trade_allocation_batch([(total_shares, 10, a, b) for total_shares in share_totals])
     allocations = {}
-    for total_shares in [10000, 50000, 100000]:
-        allocations[str(total_shares)] = solve_trade_allocation(total_shares, 10, (a,b)).tolist()
+    for total_shares, allocation in zip(share_totals, solved):
+        allocations[str(total_shares)] = allocation.tolist() if allocation is not None else [np.nan] * 10
 
     return {
-        "ticker": file_path.split("/")[-2],
+        "ticker": os.path.basename(os.path.dirname(os.path.abspath(file_path))),
         "model_params": {"a": a, "b": b},
+        "fit_diagnostics": fit['diagnostics'],
         "slippage_data": slippage_df.to_dict('records'),
         "allocations": allocations
     }
 
+# --- Batch Pipeline ---
+# Bumped whenever process_ticker_data's output changes, so every shard is rebuilt
+RESULTS_VERSION = 1
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SHARD_DIR_NAME = 'results_shards'
+
+
+def file_sha256(file_path):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json(path, value, indent=None):
+    """Writes `value` as JSON to `path` atomically, creating parent directories."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, lambda f: f.write(json.dumps(value, indent=indent).encode()))
+
+
+def read_manifest(path):
+    """Returns the batch manifest at `path`, or an empty one if it is missing or unreadable."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get('entries'), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'entries': {}}
+
+
+def run_shard(file_path, params, known_sha256=None):
+    """
+    Fingerprints one input file and, unless its content matches `known_sha256`, processes it.
+
+    Runs in a pool worker, so both hashing and fitting are parallel.
+
+    Returns:
+        tuple: (content digest, result dict or None; the result is the string
+        'unchanged' when the content matched).
+    """
+    digest = file_sha256(file_path)
+    if digest == known_sha256:
+        return digest, 'unchanged'
+    return digest, process_ticker_data(file_path, **params)
+
+
+def run_batch(data_dir, output_dir, workers=None, params=None, tickers=None, dates=None, force=False):
+    """
+    Processes every ticker-day under `data_dir` whose content or parameters changed since the last run.
+
+    Each result is written to `<output_dir>/results_shards/<TICKER>/<TICKER>_<date>.json`,
+    and the manifest next to the shards records every input's size, mtime, SHA-256
+    and parameters. An input is skipped when its size and mtime are unchanged, or
+    when only they changed and its content hash still matches. Shards of inputs
+    that no longer exist are removed. Finally all shards are merged into
+    `<output_dir>/results.json`, latest date first within each ticker. Every file
+    is written atomically.
+
+    Args:
+        params (dict): Keyword arguments of `process_ticker_data`.
+        tickers, dates (iterable): Restrict the run to these tickers or dates.
+        force (bool): Reprocess every input regardless of the manifest.
+
+    Returns:
+        dict: Number of inputs 'processed', 'skipped', 'failed' and 'removed'.
+    """
+    params = dict(params or {})
+    shard_dir = os.path.join(output_dir, SHARD_DIR_NAME)
+    manifest_path = os.path.join(shard_dir, 'manifest.json')
+    manifest = read_manifest(manifest_path)
+    entries = manifest['entries']
+    summary = {'processed': 0, 'skipped': 0, 'failed': 0, 'removed': 0}
+
+    # Discover inputs
+    inputs = {}
+    for ticker in DataCatalog(data_dir, persist=False).tickers():
+        if tickers and ticker['symbol'] not in tickers:
+            continue
+        for data_file in ticker['dates']:
+            if not dates or data_file['date'] in dates:
+                inputs[f"{ticker['symbol']}/{data_file['date']}"] = (ticker['symbol'], data_file)
+
+    # Inputs that disappeared lose their shard (only within the selected tickers/dates)
+    for key in [key for key in entries if key not in inputs]:
+        ticker, date = key.split('/')
+        if (tickers and ticker not in tickers) or (dates and date not in dates):
+            continue
+        shard = entries.pop(key).get('shard')
+        if shard and os.path.exists(os.path.join(shard_dir, shard)):
+            os.remove(os.path.join(shard_dir, shard))
+        summary['removed'] += 1
+
+    # Cheap check first: identical size and mtime means the input is unchanged
+    pending = {}
+    for key, (ticker, data_file) in inputs.items():
+        known = entries.get(key)
+        reusable = (not force and known is not None and known.get('version') == RESULTS_VERSION
+                    and known.get('params') == params and known.get('status') != 'error')
+        stat = os.stat(data_file['path'])
+        if reusable and known['bytes'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            summary['skipped'] += 1
+            continue
+        pending[key] = (ticker, data_file, stat, known['sha256'] if reusable else None)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_shard, data_file['path'], params, known_sha256): key
+                   for key, (ticker, data_file, stat, known_sha256) in pending.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            ticker, data_file, stat, _ = pending[key]
+            entry = {'source': os.path.relpath(data_file['path'], data_dir), 'bytes': stat.st_size,
+                     'mtime_ns': stat.st_mtime_ns, 'version': RESULTS_VERSION, 'params': params,
+                     'updated': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            try:
+                digest, result = future.result()
+            except Exception as e:
+                entries[key] = {**entry, 'sha256': None, 'status': 'error', 'error': str(e), 'shard': None}
+                summary['failed'] += 1
+                print(f"Failed {key}: {e}")
+                continue
+
+            if result == 'unchanged':
+                # Touched or copied, but the same content: keep the shard, refresh the metadata
+                entries[key] = {**entries[key], 'bytes': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                summary['skipped'] += 1
+                continue
+
+            shard = f"{ticker}/{ticker}_{data_file['date']}.json"
+            if result is None:
+                entries[key] = {**entry, 'sha256': digest, 'status': 'insufficient_data', 'shard': None}
+                if os.path.exists(os.path.join(shard_dir, shard)):
+                    os.remove(os.path.join(shard_dir, shard))
+            else:
+                result['date'] = data_file['date']
+                write_json(os.path.join(shard_dir, shard), result)
+                entries[key] = {**entry, 'sha256': digest, 'status': 'ok', 'shard': shard}
+            summary['processed'] += 1
+            print(f"Processed {key}")
+
+    write_json(manifest_path, manifest, indent=2)
+
+    # Merge every shard, latest date first within each ticker
+    merged = []
+    by_date = sorted(entries, key=lambda key: key.split('/')[1], reverse=True)
+    for key in sorted(by_date, key=lambda key: key.split('/')[0]):
+        if entries[key].get('status') == 'ok':
+            with open(os.path.join(shard_dir, entries[key]['shard'])) as f:
+                merged.append(json.load(f))
+    write_json(os.path.join(output_dir, 'results.json'), merged, indent=4)
+    return summary
+
+
 if __name__ == '__main__':
-    files = [
-        'C:/Users/Abhij/Downloads/Data-20250729T055643Z-1-001/Data/CRWV/CRWV_2025-05-02 00_00_00+00_00.csv',
-        'C:/Users/Abhij/Downloads/Data-20250729T055643Z-1-001/Data/FROG/FROG_2025-05-02 00_00_00+00_00.csv',
-        'C:/Users/Abhij/Downloads/Data-20250729T055643Z-1-001/Data/SOUN/SOUN_2025-05-02 00_00_00+00_00.csv'
-    ]
-    
-    all_results = [process_ticker_data(f) for f in files]
-    
-    with open('C:/Users/Abhij/Downloads/Data-20250729T055643Z-1-001/results.json', 'w') as f:
-        json.dump(all_results, f, indent=4)
-        
-    print("Successfully generated results.json")
+    parser = argparse.ArgumentParser(description='Fit every ticker-day under the data directory and merge the results.')
+    parser.add_argument('--data-dir', default=os.path.join(REPO_DIR, 'Data'),
+                        help='Directory of <TICKER>/<TICKER>_<YYYY-MM-DD>*.csv files')
+    parser.add_argument('--output-dir', default=REPO_DIR,
+                        help='Where results.json and the results_shards/ directory are written')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--tickers', nargs='+', help='Only process these tickers')
+    parser.add_argument('--dates', nargs='+', help='Only process these dates (YYYY-MM-DD)')
+    parser.add_argument('--force', action='store_true', help='Reprocess inputs even if unchanged')
+    parser.add_argument('--sample-rows', type=int, default=1000)
+    parser.add_argument('--sampling', default='head', choices=SAMPLING_MODES)
+    parser.add_argument('--stride', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    params = {'sample_rows': args.sample_rows, 'sampling': args.sampling, 'stride': args.stride, 'seed': args.seed}
+    summary = run_batch(args.data_dir, args.output_dir, args.workers, params, args.tickers, args.dates, args.force)
+    print(f"Processed {summary['processed']}, skipped {summary['skipped']} unchanged, "
+          f"failed {summary['failed']}, removed {summary['removed']}; "
+          f"wrote {os.path.join(args.output_dir, 'results.json')}")
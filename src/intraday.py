@@ -0,0 +1,212 @@
+import numpy as np
+
+from bootstrap import batched_power_law_fit
+from order_book import MISSING_TIMESTAMP, OrderBook, compute_slippage_points
+from streaming import BIN_EDGES
+
+DAY_NS = 86_400 * 10**9
+
+# Snapshots a bucket needs before it is fitted, as for a whole-file fit
+MIN_BUCKET_SNAPSHOTS = 10
+
+
+class BucketedImpactModel:
+    """
+    Slippage sufficient statistics per time-of-day bucket, kept up to date as snapshots are appended.
+
+    For every bucket (UTC time of day, `bucket_minutes` wide) and log-spaced
+    order-size bin it keeps the point count and the sums of order size and
+    slippage, and per bucket the sums for a log-log least-squares fit. Adding rows
+    costs one bincount over their points, and refitting the buckets they touched
+    is one batched Levenberg-Marquardt solve over those buckets' bins, so it
+    costs O(buckets x bins) however many rows the buckets hold.
+    """
+
+    def __init__(self, bucket_minutes=30, order_size_points=20, book_depth_pct=0.5, side='buy'):
+        self.bucket_ns = int(bucket_minutes * 60 * 10**9)
+        self.order_size_points = order_size_points
+        self.book_depth_pct = book_depth_pct
+        self.side = side
+        buckets, bins = -(-DAY_NS // self.bucket_ns), len(BIN_EDGES) + 1
+        self.counts = np.zeros((buckets, bins), dtype=np.int64)
+        self.sum_x = np.zeros((buckets, bins))
+        self.sum_y = np.zeros((buckets, bins))
+        self.loglog = np.zeros((buckets, 5))  # sums of lx, ly, lx^2, lx*ly, ly^2
+        self.snapshots = np.zeros(buckets, dtype=np.int64)
+        self.params = np.full((buckets, 4), np.nan)  # a, b, beta, rmse
+        self.converged = np.zeros(buckets, dtype=bool)
+        self.dirty = np.zeros(buckets, dtype=bool)
+        self.day = None
+        self.rows = 0
+        self.first_timestamp = self.last_timestamp = None
+        self.time_range = None
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ('counts', 'sum_x', 'sum_y', 'loglog', 'snapshots',
+                                                           'params', 'converged', 'dirty'))
+
+    def bucket_of(self, timestamps):
+        """Bucket of each timestamp (int64 nanoseconds since the epoch)."""
+        return (np.asarray(timestamps) % DAY_NS) // self.bucket_ns
+
+    def extends(self, timestamps):
+        """Whether `timestamps`, all the rows of a book, start with the rows already added."""
+        if self.rows == 0:
+            return True
+        return (len(timestamps) >= self.rows and timestamps[0] == self.first_timestamp
+                and timestamps[self.rows - 1] == self.last_timestamp)
+
+    def add_rows(self, book, timestamps):
+        """Folds the slippage points of new snapshots into their buckets; rows without a timestamp are skipped."""
+        timestamped = timestamps != MISSING_TIMESTAMP
+        buckets = self.bucket_of(timestamps)
+        order_sizes, slippage, rows = compute_slippage_points(book, self.order_size_points, self.book_depth_pct,
+                                                              return_rows=True, side=self.side)
+        keep = timestamped[rows]
+        order_sizes, slippage, point_buckets = order_sizes[keep], slippage[keep], buckets[rows[keep]]
+
+        shape = self.counts.shape
+        flat = point_buckets * shape[1] + np.searchsorted(BIN_EDGES, order_sizes, side='right')
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(shape)
+        self.sum_x += np.bincount(flat, weights=order_sizes, minlength=self.counts.size).reshape(shape)
+        self.sum_y += np.bincount(flat, weights=slippage, minlength=self.counts.size).reshape(shape)
+        log_x, log_y = np.log(order_sizes), np.log(slippage)
+        for column, values in enumerate((log_x, log_y, log_x ** 2, log_x * log_y, log_y ** 2)):
+            self.loglog[:, column] += np.bincount(point_buckets, weights=values, minlength=shape[0])
+
+        quoted = timestamped & ~(np.isnan(book.bid_top) | np.isnan(book.ask_top))
+        self.snapshots += np.bincount(buckets[quoted], minlength=shape[0])
+        self.dirty[buckets[quoted]] = True
+
+        if self.rows == 0 and len(timestamps):
+            self.first_timestamp = timestamps[0]
+        self.rows += len(timestamps)
+        if len(timestamps):
+            self.last_timestamp = timestamps[-1]
+        if timestamped.any():
+            low, high = timestamps[timestamped].min(), timestamps[timestamped].max()
+            self.time_range = (low, high) if self.time_range is None else (
+                min(self.time_range[0], low), max(self.time_range[1], high))
+
+    def update(self, book, timestamps, chunk_rows=50_000):
+        """
+        Adds the rows of a book beyond those already added, in chunks.
+
+        Returns:
+            int: The number of rows added.
+        """
+        added = len(timestamps) - self.rows
+        for start in range(self.rows, len(timestamps), chunk_rows):
+            stop = min(start + chunk_rows, len(timestamps))
+            self.add_rows(OrderBook(*(column[start:stop] for column in book)), np.asarray(timestamps[start:stop]))
+        return added
+
+    def refit(self):
+        """
+        Refits the buckets whose statistics changed since the last refit, and the whole-day model.
+
+        Returns:
+            int: The number of buckets refitted.
+        """
+        changed = np.flatnonzero(self.dirty)
+        if len(changed) == 0:
+            return 0
+        params, converged = fit_bins(self.counts[changed], self.sum_x[changed], self.sum_y[changed])
+        enough = self.snapshots[changed] >= MIN_BUCKET_SNAPSHOTS
+        self.params[changed] = np.where(enough[:, None], params, np.nan)
+        self.converged[changed] = converged & enough
+        self.dirty[changed] = False
+
+        params, converged = fit_bins(*(getattr(self, name).sum(axis=0, keepdims=True)
+                                       for name in ('counts', 'sum_x', 'sum_y')))
+        self.day = None
+        if self.snapshots.sum() >= MIN_BUCKET_SNAPSHOTS and not np.isnan(params[0, 0]):
+            self.day = dict(zip(('a', 'b', 'beta', 'rmse'), params[0].tolist()), converged=bool(converged[0]))
+        return len(changed)
+
+    def loglog_fit(self, bucket):
+        """
+        Closed-form least-squares fit of log(slippage) = log(a) + b * log(order size) to one bucket's raw points.
+
+        Returns:
+            tuple: (a, b), or (nan, nan) when fewer than two distinct order sizes were seen.
+        """
+        n = self.counts[bucket].sum()
+        sum_lx, sum_ly, sum_lxx, sum_lxy, _ = self.loglog[bucket]
+        denominator = n * sum_lxx - sum_lx ** 2
+        if n < 2 or denominator <= 0:
+            return np.nan, np.nan
+        b = (n * sum_lxy - sum_lx * sum_ly) / denominator
+        return float(np.exp((sum_ly - b * sum_lx) / n)), float(b)
+
+    def buckets(self):
+        """
+        The buckets holding snapshots, in time-of-day order.
+
+        Returns:
+            list: One dict per bucket with its 'start'/'end' time of day (HH:MM, UTC),
+            fitted 'a', 'b', 'beta' and 'rmse' (None if it had too few snapshots),
+            the raw-point log-log 'loglog_a'/'loglog_b', 'converged', 'points' and 'snapshots'.
+        """
+        result = []
+        for bucket in np.flatnonzero(self.snapshots):
+            fitted = ~np.isnan(self.params[bucket, 0])
+            loglog_a, loglog_b = self.loglog_fit(bucket)
+            result.append({
+                'bucket': int(bucket),
+                'start': time_of_day(bucket * self.bucket_ns),
+                'end': time_of_day(min((bucket + 1) * self.bucket_ns, DAY_NS)),
+                **{name: float(value) if fitted else None
+                   for name, value in zip(('a', 'b', 'beta', 'rmse'), self.params[bucket])},
+                'loglog_a': None if np.isnan(loglog_a) else loglog_a,
+                'loglog_b': None if np.isnan(loglog_b) else loglog_b,
+                'converged': bool(self.converged[bucket]),
+                'points': int(self.counts[bucket].sum()),
+                'snapshots': int(self.snapshots[bucket])
+            })
+        return result
+
+    def interval_params(self, bounds):
+        """
+        Power-law parameters of trading intervals from the bucket their midpoint falls in.
+
+        Intervals in a bucket without a fit use the whole-day fit.
+
+        Args:
+            bounds (np.array): (intervals + 1) interval boundaries in nanoseconds.
+
+        Returns:
+            tuple: (buckets, a, b, whole_day) arrays with one entry per interval.
+        """
+        bounds = np.asarray(bounds, dtype=np.int64)
+        buckets = self.bucket_of(bounds[:-1] + (bounds[1:] - bounds[:-1]) // 2)
+        a, b = self.params[buckets, 0].copy(), self.params[buckets, 1].copy()
+        whole_day = np.isnan(a)
+        a[whole_day], b[whole_day] = self.day['a'], self.day['b']
+        return buckets, a, b, whole_day
+
+
+def fit_bins(counts, sum_x, sum_y):
+    """
+    Fits the power law and linear models to rows of per-bin sums at once.
+
+    Returns:
+        tuple: ((rows x 4) a, b, beta, rmse with NaN rows where fewer than two bins
+        are filled, converged flags).
+    """
+    w = counts.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        x, y = sum_x / np.where(w > 0, w, 1), sum_y / np.where(w > 0, w, 1)
+        a, b, converged = batched_power_law_fit(x, y, w)
+        beta = (w * x * y).sum(axis=1) / (w * x ** 2).sum(axis=1)
+        rmse = np.sqrt((w * (y - a[:, None] * np.where(w > 0, x, 1) ** b[:, None]) ** 2).sum(axis=1) / w.sum(axis=1))
+    params = np.column_stack([a, b, beta, rmse])
+    params[np.isnan(a)] = np.nan
+    return params, converged
+
+
+def time_of_day(nanoseconds):
+    """Formats nanoseconds since midnight as HH:MM."""
+    minutes = int(nanoseconds // (60 * 10**9))
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
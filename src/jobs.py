@@ -0,0 +1,176 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_STATES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled')
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a job when cancellation was requested.
+
+    Derives from BaseException, like KeyboardInterrupt, so that `except Exception`
+    blocks in the analysis code do not swallow it.
+    """
+
+
+class QueueFull(Exception):
+    """Raised by JobManager.submit when the maximum number of unfinished jobs is reached."""
+
+
+class Job:
+    """
+    State of one background job, shared between its worker thread and request threads.
+
+    The worker calls `report` to publish progress, which is also where a requested
+    cancellation takes effect. Every change bumps `version`, so that watchers can
+    block in `wait_for_change` instead of polling.
+    """
+
+    def __init__(self, kind, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self.future = None
+        self._cancel_requested = threading.Event()
+        self._changed = threading.Condition()
+
+    def _update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def report(self, **progress):
+        """Merges `progress` into the job's progress; raises JobCancelled if the job was cancelled."""
+        if self._cancel_requested.is_set():
+            raise JobCancelled()
+        if progress:
+            self._update(progress={**self.progress, **progress})
+
+    def cancel(self):
+        """Requests cancellation. A queued job is cancelled at once, a running one at its next `report`."""
+        self._cancel_requested.set()
+        if self.future is not None and self.future.cancel():
+            self._update(status='cancelled', finished=time.time())
+
+    @property
+    def done(self):
+        return self.status in FINISHED_STATES
+
+    def wait_for_change(self, version, timeout):
+        """Blocks until the job's version differs from `version` or `timeout` seconds pass; returns the version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def snapshot(self):
+        """Returns the job's status, progress and timings (without its result) as a dict."""
+        with self._changed:
+            snapshot = {
+                'job_id': self.id,
+                'type': self.kind,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished
+            }
+            if self.error is not None:
+                snapshot['error'] = self.error
+            return snapshot
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded pool of worker threads and keeps their results for a while.
+
+    At most `max_pending` jobs may be queued or running at once. Finished jobs, with
+    their results, are dropped `ttl` seconds after they finish, so memory stays
+    bounded however many jobs are submitted.
+    """
+
+    def __init__(self, workers, ttl, max_pending):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, function, params=None):
+        """
+        Queues `function(job)`; its return value becomes the job's result.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            QueueFull: If `max_pending` jobs are already unfinished.
+        """
+        job = Job(kind, params)
+        with self._lock:
+            self._purge_expired()
+            if sum(not other.done for other in self._jobs.values()) >= self.max_pending:
+                raise QueueFull(f'{self.max_pending} jobs are already queued or running')
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, function)
+        return job
+
+    def _run(self, job, function):
+        if job._cancel_requested.is_set():
+            job._update(status='cancelled', finished=time.time())
+            return
+        job._update(status='running', started=time.time())
+        try:
+            result = function(job)
+        except JobCancelled:
+            job._update(status='cancelled', finished=time.time())
+        except Exception as e:
+            job._update(status='failed', error=str(e) or type(e).__name__, finished=time.time())
+        else:
+            job._update(status='succeeded', result=result, finished=time.time())
+
+    def get(self, job_id):
+        """Returns the job with this id, or None if it is unknown or has expired."""
+        with self._lock:
+            self._purge_expired()
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id):
+        """Forgets a job, cancelling it first if it has not finished."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None and not job.done:
+            job.cancel()
+        return job
+
+    def jobs(self):
+        """Returns the current jobs, oldest first."""
+        with self._lock:
+            self._purge_expired()
+            return sorted(self._jobs.values(), key=lambda job: job.created)
+
+    def counts(self):
+        """Returns the number of retained jobs in each state."""
+        counts = dict.fromkeys(JOB_STATES, 0)
+        for job in self.jobs():
+            counts[job.status] += 1
+        return counts
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done and job.finished is not None and now - job.finished > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,162 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Per-thread stage breakdown of the request being profiled, if any
+_profile = threading.local()
+
+
+def start_profile():
+    """Starts collecting a per-stage breakdown of the work done on this thread."""
+    _profile.stages = {}
+    _profile.started = time.perf_counter()
+
+
+def stop_profile():
+    """
+    Stops profiling on this thread and returns the breakdown, or None if it was not profiling.
+
+    Returns:
+        dict: 'stages' maps each stage, in the order first seen, to its total seconds
+        and number of calls; 'total_seconds' is the time since `start_profile`.
+    """
+    stages = getattr(_profile, 'stages', None)
+    if stages is None:
+        return None
+    _profile.stages = None
+    return {'stages': stages, 'total_seconds': time.perf_counter() - _profile.started}
+
+
+def format_labels(labels, extra=()):
+    """Formats a label tuple as a Prometheus label set, e.g. {stage="fit"}."""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """
+    Thread-safe latency histograms and counters, rendered in the Prometheus text format.
+
+    Series are created on first use and identified by a metric name plus keyword
+    labels. `timed` and `timed_iter` record the duration of an analysis stage into
+    the `stage_metric` histogram and into the breakdown of a profiled request.
+    """
+
+    def __init__(self, stage_metric='stage_seconds', buckets=LATENCY_BUCKETS):
+        self.stage_metric = stage_metric
+        self.buckets = tuple(buckets)
+        self._help = {}
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        """Sets the HELP text of a metric."""
+        self._help[name] = help_text
+
+    def observe(self, name, value, **labels):
+        """Adds one observation to a histogram series."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, _, _ = entry = series[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def inc(self, name, amount=1, **labels):
+        """Increments a counter series."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def record_stage(self, stage, seconds):
+        """Records the duration of a stage, including it in the breakdown if this thread is profiling."""
+        self.observe(self.stage_metric, seconds, stage=stage)
+        stages = getattr(_profile, 'stages', None)
+        if stages is not None:
+            totals = stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            totals['seconds'] += seconds
+            totals['calls'] += 1
+
+    @contextmanager
+    def timed(self, stage):
+        """Context manager recording the time spent in its body as `stage`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - started)
+
+    def timed_iter(self, iterable, stage):
+        """
+        Yields from `iterable`, recording the time spent producing its items as `stage`.
+
+        The time the consumer spends between items is not included, so a lazily loaded
+        stream can be timed separately from the work done on each chunk.
+        """
+        elapsed = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - started
+                    return
+                elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            self.record_stage(stage, elapsed)
+
+    def reset(self):
+        """Drops every recorded observation and counter, keeping the HELP texts."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, gauges=()):
+        """
+        Renders every series in the Prometheus text exposition format.
+
+        Args:
+            gauges (iterable): Extra (name, type, help, {label tuple: value}) metrics
+                computed at scrape time, such as cache occupancy.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f'# HELP {name} {self._help.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f'# HELP {name} {self._help.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, (counts, total, count) in sorted(series.items()):
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        lines.append(f'{name}_bucket{format_labels(labels, [("le", repr(float(bound)))])} {bucket_count}')
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {total!r}')
+                    lines.append(f'{name}_count{format_labels(labels)} {count}')
+        for name, kind, help_text, series in gauges:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{format_labels(labels)} {value!r}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,307 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+BOOK_LEVELS = 10
+ASK_PRICE_COLUMNS = [f'ask_px_{i:02d}' for i in range(BOOK_LEVELS)]
+ASK_SIZE_COLUMNS = [f'ask_sz_{i:02d}' for i in range(BOOK_LEVELS)]
+BID_PRICE_COLUMNS = [f'bid_px_{i:02d}' for i in range(BOOK_LEVELS)]
+BID_SIZE_COLUMNS = [f'bid_sz_{i:02d}' for i in range(BOOK_LEVELS)]
+BOOK_COLUMNS = BID_PRICE_COLUMNS + BID_SIZE_COLUMNS + ASK_PRICE_COLUMNS + ASK_SIZE_COLUMNS
+TIMESTAMP_COLUMN = 'ts_event'
+
+# Timestamps that are missing or unparseable are stored as this int64 value (NaT)
+MISSING_TIMESTAMP = np.iinfo(np.int64).min
+
+# Sides of the book an order can trade against: buy orders walk the asks and
+# sell orders walk the bids
+BOOK_SIDES = ('buy', 'sell')
+
+# Column arrays of a loaded book; ask_top is ask_prices[:, 0] and bid_top is bid_prices[:, 0]
+OrderBook = namedtuple('OrderBook', ['bid_top', 'ask_top', 'ask_prices', 'ask_sizes', 'bid_prices', 'bid_sizes'])
+
+# Per-snapshot cumulative ask depth, for answering point slippage queries without
+# walking the book: `level_prices` are the usable ask levels shifted to the front
+# (0 after the last one), and `cum_size`/`cum_notional` their running size and
+# price * size totals. Timestamps are int64 nanoseconds since the epoch (UTC).
+DepthIndex = namedtuple('DepthIndex', ['timestamps', 'mid_prices', 'level_prices', 'cum_size', 'cum_notional'])
+
+
+def compact_levels(values):
+    """
+    Shifts the non-NaN levels of each row to the front, keeping their order.
+
+    This mirrors the list comprehensions the row loop used to build
+    `ask_prices`/`ask_sizes`, where missing levels are simply dropped.
+
+    Returns:
+        tuple: (compacted (rows x levels) array with NaN padding, count of valid levels per row)
+    """
+    missing = np.isnan(values)
+    order = np.argsort(missing, axis=1, kind='stable')
+    return np.take_along_axis(values, order, axis=1), (~missing).sum(axis=1)
+
+
+def frame_book_arrays(df):
+    """
+    Extracts the top of book and both ladders from an order book DataFrame.
+
+    Columns missing from the frame are treated as empty levels.
+
+    Returns:
+        OrderBook: float arrays, with the ladders shaped (rows x BOOK_LEVELS).
+    """
+    def level_matrix(columns):
+        matrix = np.full((len(df), len(columns)), np.nan)
+        for i, column in enumerate(columns):
+            if column in df.columns:
+                matrix[:, i] = df[column].to_numpy(dtype=float)
+        return matrix
+
+    ask_prices = level_matrix(ASK_PRICE_COLUMNS)
+    bid_prices = level_matrix(BID_PRICE_COLUMNS)
+    return OrderBook(bid_prices[:, 0], ask_prices[:, 0], ask_prices, level_matrix(ASK_SIZE_COLUMNS),
+                     bid_prices, level_matrix(BID_SIZE_COLUMNS))
+
+
+def frame_timestamps(df):
+    """Returns the `ts_event` column as int64 nanoseconds since the epoch, MISSING_TIMESTAMP where absent."""
+    if TIMESTAMP_COLUMN not in df.columns:
+        return np.full(len(df), MISSING_TIMESTAMP, dtype=np.int64)
+    timestamps = pd.to_datetime(df[TIMESTAMP_COLUMN], utc=True, errors='coerce')
+    return timestamps.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def iter_csv_frames(file_path, chunk_rows=50_000, nrows=None, columns=BOOK_COLUMNS):
+    """Reads the given columns of an order book CSV in chunks, yielding one DataFrame per chunk."""
+    wanted = set(columns)
+    return pd.read_csv(file_path, usecols=lambda c: c in wanted, chunksize=chunk_rows, nrows=nrows)
+
+
+def iter_csv_book(file_path, chunk_rows=50_000, nrows=None):
+    """Reads the book columns of an order book CSV in chunks, yielding one OrderBook per chunk."""
+    for chunk in iter_csv_frames(file_path, chunk_rows, nrows):
+        yield frame_book_arrays(chunk)
+
+
+def valid_snapshot_count(book):
+    """Counts snapshots with both a best bid and a best ask."""
+    return int((~(np.isnan(book.bid_top) | np.isnan(book.ask_top))).sum())
+
+
+def cumulative_depth(prices, sizes):
+    """
+    Builds the cumulative size and notional of each snapshot's usable levels.
+
+    Missing levels are dropped and prices and sizes are paired positionally, like
+    zip() over the two lists in `calculate_slippage`.
+
+    Returns:
+        tuple: (level prices, cumulative size, cumulative notional), each (rows x levels)
+        with the usable levels first; after the last usable level prices are 0 and
+        the cumulative totals stay flat.
+    """
+    prices, price_count = compact_levels(np.asarray(prices, dtype=float))
+    sizes, size_count = compact_levels(np.asarray(sizes, dtype=float))
+
+    usable = np.arange(prices.shape[1]) < np.minimum(price_count, size_count)[:, None]
+    prices = np.where(usable, prices, 0.0)
+    sizes = np.where(usable, sizes, 0.0)
+    return prices, np.cumsum(sizes, axis=1), np.cumsum(prices * sizes, axis=1)
+
+
+def levels_filled(cum_size, order_sizes):
+    """
+    Counts the levels each order consumes completely, by binary search of the cumulative depth.
+
+    All rows are searched together, so this takes ceil(log2(levels + 1)) vectorized steps.
+    The cumulative sizes are padded with +inf to a power-of-two width, so every step
+    is one gather and compare over the flattened array with no bounds checks.
+
+    Args:
+        cum_size (np.array): (rows x levels) non-decreasing cumulative level sizes.
+        order_sizes (np.array): (rows x K) order sizes.
+
+    Returns:
+        np.array: (rows x K) number of levels with cumulative size <= the order size.
+    """
+    rows, levels = cum_size.shape
+    width = 1 << int(levels).bit_length()
+    padded = np.full((rows, width), np.inf)
+    padded[:, 1:levels + 1] = cum_size
+    flat = padded.ravel()
+
+    # Positions in `flat`: each row's column 0 plus the levels counted so far
+    row_starts = np.arange(rows)[:, None] * width
+    position = row_starts + np.zeros(np.shape(order_sizes), dtype=np.intp)
+    step = width >> 1
+    while step:
+        position += step * (flat[position + step] <= order_sizes)
+        step >>= 1
+    return position - row_starts
+
+
+def fill_prices(order_sizes, level_prices, cum_size, cum_notional):
+    """
+    Average fill price of market orders against precomputed cumulative depth.
+
+    Each price comes from a binary search for the last fully consumed level plus
+    one linear step into the next level, instead of a level-by-level walk.
+
+    Args:
+        order_sizes (np.array): (K,) order sizes applied to every snapshot, or (rows x K).
+        level_prices, cum_size, cum_notional (np.array): (rows x levels) depth index,
+            as returned by `cumulative_depth`.
+
+    Returns:
+        np.array: (rows x K) average fill price; NaN where the order size is not
+        positive or exceeds the visible depth.
+    """
+    order_sizes = np.broadcast_to(np.asarray(order_sizes, dtype=float), (len(cum_size), np.shape(order_sizes)[-1]))
+    levels = cum_size.shape[1]
+    filled = levels_filled(cum_size, order_sizes)
+
+    pad = np.zeros((len(cum_size), 1))
+    filled_size = np.take_along_axis(np.hstack([pad, cum_size]), filled, axis=1)
+    filled_notional = np.take_along_axis(np.hstack([pad, cum_notional]), filled, axis=1)
+    next_price = np.take_along_axis(level_prices, np.minimum(filled, levels - 1), axis=1)
+
+    total = filled_notional + (order_sizes - filled_size) * next_price
+    available = (order_sizes > 0) & (order_sizes <= cum_size[:, -1:])
+    return np.divide(total, order_sizes, out=np.full(order_sizes.shape, np.nan), where=available)
+
+
+def snapshot_rows(timestamps, start=None, end=None, at=None):
+    """
+    Selects snapshots by time using binary search over their sorted timestamps.
+
+    Args:
+        timestamps (np.array): int64 nanosecond timestamps of every snapshot.
+        start, end (int): Inclusive time range in nanoseconds; open-ended if None.
+        at (np.array): If given, point-in-time lookups instead of a range.
+
+    Returns:
+        np.array: Row indices of the snapshots with start <= timestamp <= end in time
+        order or, with `at`, the last snapshot at or before each time (-1 if there is
+        none). Snapshots without a timestamp are never selected.
+    """
+    rows = np.flatnonzero(timestamps != MISSING_TIMESTAMP)
+    ordered = timestamps[rows]
+    if not np.all(ordered[1:] >= ordered[:-1]):
+        order = np.argsort(ordered, kind='stable')
+        rows, ordered = rows[order], ordered[order]
+
+    if at is not None:
+        position = np.searchsorted(ordered, at, side='right') - 1
+        return np.where(position >= 0, rows[np.maximum(position, 0)] if len(rows) else -1, -1)
+    low = 0 if start is None else np.searchsorted(ordered, start, side='left')
+    high = len(ordered) if end is None else np.searchsorted(ordered, end, side='right')
+    return rows[low:high]
+
+
+def depth_index(book, timestamps):
+    """Builds the DepthIndex of an OrderBook chunk and its int64 timestamps."""
+    return DepthIndex(np.asarray(timestamps, dtype=np.int64), (book.bid_top + book.ask_top) / 2,
+                      *cumulative_depth(book.ask_prices, book.ask_sizes))
+
+
+def walk_book(order_sizes, prices, sizes, mid_prices):
+    """
+    Calculates slippage for a batch of order sizes against a batch of book snapshots.
+
+    Equivalent to calling `calculate_slippage` for every (row, order size) pair, but
+    computed in one pass from the cumulative depth and notional of each snapshot.
+    Rows may come from either side of the book; the result is the average fill
+    price minus the mid, so it is negative for orders that walk down the bids.
+
+    Args:
+        order_sizes (np.array): (rows x K) order sizes.
+        prices (np.array): (rows x levels) level prices, NaN for missing levels.
+        sizes (np.array): (rows x levels) level sizes, NaN for missing levels.
+        mid_prices (np.array): (rows,) mid price of each snapshot.
+
+    Returns:
+        np.array: (rows x K) slippage per share; 0 where the order size is not positive.
+    """
+    order_sizes = np.asarray(order_sizes, dtype=float)
+    prices, cum_size, cum_cost = cumulative_depth(prices, sizes)
+    levels = prices.shape[1]
+
+    # Number of levels the order consumes completely
+    filled = levels_filled(cum_size, order_sizes)
+
+    pad = np.zeros((len(prices), 1))
+    filled_size = np.take_along_axis(np.hstack([pad, cum_size]), filled, axis=1)
+    filled_cost = np.take_along_axis(np.hstack([pad, cum_cost]), filled, axis=1)
+    next_price = np.take_along_axis(prices, np.minimum(filled, levels - 1), axis=1)
+    partial_cost = np.where(filled < levels, (order_sizes - filled_size) * next_price, 0.0)
+
+    total_cost = filled_cost + partial_cost
+    avg_price = np.divide(total_cost, order_sizes, out=np.zeros_like(total_cost), where=order_sizes > 0)
+    return np.where(order_sizes > 0, avg_price - mid_prices[:, None], 0.0)
+
+
+def compute_slippage_points(book, order_size_points, book_depth_pct, return_rows=False, side='buy'):
+    """
+    Computes empirical slippage points for every snapshot of one side of a book.
+
+    Returns:
+        tuple: As in `side_slippage_points`, for `side` ('buy' or 'sell').
+    """
+    return side_slippage_points(book, (side,), order_size_points, book_depth_pct, return_rows)[side]
+
+
+def side_slippage_points(book, sides, order_size_points, book_depth_pct, return_rows=False):
+    """
+    Computes empirical slippage points of several sides of a book in one batched walk.
+
+    For each row and side, `order_size_points` order sizes are spread from 1 share up
+    to `book_depth_pct` of that side's visible depth, and only positive slippage
+    (paying above the mid when buying, receiving below it when selling) is kept.
+    Rows with a missing top of book or no sizes on the side are skipped, and so are
+    orders larger than the side's usable depth. The ladders of all requested sides
+    are stacked and walked together, so two-sided points cost one walk instead of two.
+
+    Args:
+        book (OrderBook): The snapshots.
+        sides (tuple): Names from BOOK_SIDES; 'buy' walks the asks and 'sell' the bids.
+
+    Returns:
+        dict: Side -> (order sizes, slippage) as flat arrays in row-major order, plus
+        the row of the book each point came from if `return_rows`.
+    """
+    ladders = {'buy': (book.ask_prices, book.ask_sizes, 1.0), 'sell': (book.bid_prices, book.bid_sizes, -1.0)}
+    quoted = ~(np.isnan(book.bid_top) | np.isnan(book.ask_top))
+    mid_prices = (book.bid_top + book.ask_top) / 2
+
+    parts = []
+    for side in sides:
+        prices, sizes, sign = ladders[side]
+        rows = quoted & ~np.isnan(sizes).all(axis=1)
+        prices, sizes = prices[rows], sizes[rows]
+
+        # Sequential sum keeps the same rounding as sum() over the size list
+        depth = np.zeros(len(sizes))
+        for level in range(sizes.shape[1]):
+            depth += np.nan_to_num(sizes[:, level])
+
+        order_sizes = np.linspace(1, depth * book_depth_pct, order_size_points, axis=1)
+        parts.append((rows, order_sizes, prices, sizes, np.full(len(sizes), sign)))
+
+    side_rows, order_sizes, prices, sizes, signs = zip(*parts)
+    # Orders beyond a ladder's usable depth price to NaN and are dropped with the non-positive points,
+    # instead of pricing the unfilled rest at 0, which turns into a large bogus slippage on the bids
+    avg_price = fill_prices(np.concatenate(order_sizes), *cumulative_depth(np.concatenate(prices),
+                                                                         np.concatenate(sizes)))
+    slippage = avg_price - np.concatenate([mid_prices[rows] for rows in side_rows])[:, None]
+    slippage *= np.concatenate(signs)[:, None]
+    slippage = np.split(slippage, np.cumsum([len(rows) for rows in order_sizes])[:-1])
+
+    points = {}
+    for side, rows, side_sizes, side_slippage in zip(sides, side_rows, order_sizes, slippage):
+        keep = side_slippage > 0
+        points[side] = (side_sizes[keep], side_slippage[keep])
+        if return_rows:
+            points[side] += (np.broadcast_to(np.flatnonzero(rows)[:, None], keep.shape)[keep],)
+    return points
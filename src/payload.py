@@ -0,0 +1,118 @@
+import base64
+
+import numpy as np
+
+from streaming import BIN_EDGES
+
+SLIPPAGE_FORMATS = ('records', 'columns', 'base64', 'lttb', 'binned')
+BINNED_QUANTILES = (0.1, 0.5, 0.9)
+
+
+def lttb(x, y, max_points):
+    """
+    Downsamples a series for plotting with Largest-Triangle-Three-Buckets.
+
+    Points are sorted by x. The first and last points are always kept, and from
+    each of `max_points - 2` equal buckets in between the point forming the
+    largest triangle with the previously kept point and the next bucket's mean
+    is selected, which preserves the visual shape of the series. `max_points` must
+    be at least 3; series no longer than it are returned whole.
+
+    Returns:
+        tuple: (x, y) of the selected points, sorted by x.
+    """
+    if max_points < 3:
+        raise ValueError('max_points must be at least 3')
+    order = np.argsort(x, kind='stable')
+    x, y = x[order], y[order]
+    n = len(x)
+    if max_points >= n:
+        return x, y
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / np.diff(edges)
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / np.diff(edges)
+    # The bucket after the last one is the final point itself
+    mean_x, mean_y = np.append(mean_x, x[-1]), np.append(mean_y, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x, next_y = mean_x[bucket + 1], mean_y[bucket + 1]
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return x[selected], y[selected]
+
+
+def binned_summary(order_sizes, slippage):
+    """
+    Summarizes raw slippage points per log-spaced order-size bin.
+
+    Returns:
+        dict: Per non-empty bin, the mean order size and slippage, the point count
+        and the slippage quantiles in BINNED_QUANTILES (keyed 'p10', 'p50', ...).
+    """
+    bins = np.searchsorted(BIN_EDGES, order_sizes, side='right')
+    order = np.lexsort((slippage, bins))
+    bins, x, y = bins[order], order_sizes[order], slippage[order]
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]]) if len(bins) else np.empty(0, dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(bins)])
+
+    summary = {
+        'order_size': (np.add.reduceat(x, starts) / counts).tolist() if len(starts) else [],
+        'slippage': (np.add.reduceat(y, starts) / counts).tolist() if len(starts) else [],
+        'count': counts.tolist()
+    }
+    # Values are sorted within each bin, so quantiles are interpolated positions
+    for q in BINNED_QUANTILES:
+        position = starts + q * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, starts + counts - 1)
+        fraction = position - lower
+        summary[f'p{round(q * 100)}'] = (y[lower] * (1 - fraction) + y[upper] * fraction).tolist()
+    return summary
+
+
+def encode_slippage_data(order_sizes, slippage, slippage_format='records', max_points=1000, counts=None):
+    """
+    Encodes slippage points for an analysis response.
+
+    Args:
+        order_sizes (np.array): Order size of each point.
+        slippage (np.array): Slippage of each point.
+        slippage_format (str): 'records' (list of {order_size, slippage} dicts, the
+            default), 'columns' (one list per field), 'base64' (little-endian float32
+            arrays, base64 encoded), 'lttb' (at most `max_points` points chosen for
+            charting) or 'binned' (per order-size bin means, counts and quantiles).
+        counts (np.array): If the points are already bin means, the number of raw
+            points behind each; 'binned' then returns them without quantiles.
+
+    Returns:
+        list or dict: The encoded points; every format except 'records' is a dict
+        whose 'format' key names the encoding.
+    """
+    order_sizes = np.asarray(order_sizes, dtype=float)
+    slippage = np.asarray(slippage, dtype=float)
+
+    if slippage_format == 'records':
+        return [{'order_size': x, 'slippage': y} for x, y in zip(order_sizes.tolist(), slippage.tolist())]
+    if slippage_format == 'columns':
+        return {'format': 'columns', 'order_size': order_sizes.tolist(), 'slippage': slippage.tolist()}
+    if slippage_format == 'base64':
+        def encode(values):
+            return base64.b64encode(values.astype('<f4').tobytes()).decode('ascii')
+        return {'format': 'base64', 'dtype': 'float32', 'byteorder': 'little', 'length': len(order_sizes),
+                'order_size': encode(order_sizes), 'slippage': encode(slippage)}
+    if slippage_format == 'lttb':
+        x, y = lttb(order_sizes, slippage, max_points)
+        return {'format': 'lttb', 'source_points': len(order_sizes), 'order_size': x.tolist(), 'slippage': y.tolist()}
+    if slippage_format == 'binned':
+        if counts is not None:
+            return {'format': 'binned', 'order_size': order_sizes.tolist(), 'slippage': slippage.tolist(),
+                    'count': np.asarray(counts).tolist()}
+        return {'format': 'binned', **binned_summary(order_sizes, slippage)}
+    raise ValueError(f"Unknown slippage format {slippage_format!r}, expected one of {SLIPPAGE_FORMATS}")
@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
 from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
+from order_book import iter_csv_book
+from streaming import SlippageAggregate, sample_slippage
 
 def linear_model(x, beta):
     """A linear model for market impact."""
@@ -32,47 +33,113 @@ def calculate_slippage(order_size, book_levels_prices, book_levels_sizes, mid_pr
         return slippage
     return 0
 
-def analyze_slippage_from_data(file_path, sample_rows=1000):
+def loglog_initial_guess(order_sizes, slippage, weights):
     """
-    Analyzes slippage from order book data in a CSV file.
+    Weighted least-squares fit of log(slippage) = log(a) + b * log(order size).
+
+    Returns:
+        tuple: (a, b), or (nan, nan) if fewer than two distinct order sizes are given.
     """
-    df = pd.read_csv(file_path, nrows=sample_rows)
+    log_x, log_y = np.log(order_sizes), np.log(slippage)
+    mean_x, mean_y = np.average(log_x, weights=weights), np.average(log_y, weights=weights)
+    variance = np.sum(weights * (log_x - mean_x) ** 2)
+    if len(order_sizes) < 2 or variance <= 0:
+        return np.nan, np.nan
+    b = np.sum(weights * (log_x - mean_x) * (log_y - mean_y)) / variance
+    return float(np.exp(mean_y - b * mean_x)), float(b)
 
-    # We are interested in the state of the book, which is present in each row.
-    # We will filter out rows where the top-of-book is missing.
-    df.dropna(subset=['bid_px_00', 'ask_px_00'], inplace=True)
-
-    slippage_results = []
-    for index, row in df.iterrows():
-        # Construct the ask book from the columns
-        ask_prices = [row[f'ask_px_{i:02d}'] for i in range(10) if f'ask_px_{i:02d}' in row and pd.notna(row[f'ask_px_{i:02d}'])]
-        ask_sizes = [row[f'ask_sz_{i:02d}'] for i in range(10) if f'ask_sz_{i:02d}' in row and pd.notna(row[f'ask_sz_{i:02d}'])]
-        
-        if not ask_prices or not ask_sizes:
-            continue
+def fit_impact_models(order_sizes, slippage, counts=None, binned=False):
+    """
+    Fits the linear and power law impact models to slippage points.
 
-        mid_price = (row['bid_px_00'] + row['ask_px_00']) / 2
-        
-        # Use a range of order sizes to calculate slippage
-        order_sizes = np.linspace(1, sum(ask_sizes) * 0.5, 20) # up to 50% of book depth
-        for x in order_sizes:
-            slippage = calculate_slippage(x, ask_prices, ask_sizes, mid_price)
-            if slippage > 0:
-                slippage_results.append({'order_size': x, 'slippage': slippage})
+    Raw points are first collapsed into log-spaced order-size bins, so the cost of
+    the fit depends on the number of bins rather than the number of points. The
+    power law is seeded from a closed-form log-log fit of the bin means and then
+    refined with `curve_fit`, weighting each bin by its point count; the linear
+    model has a closed-form weighted least-squares solution.
+
+    Args:
+        order_sizes (np.array): Order sizes, or bin mean order sizes if `binned`.
+        slippage (np.array): Positive slippage values, or bin means if `binned`.
+        counts (np.array): Number of raw points behind each entry when `binned`.
+        binned (bool): Whether the points are already bin means.
+
+    Returns:
+        dict: 'popt_linear', 'popt_power' and 'diagnostics', or None if the points
+        span fewer than two bins.
+    """
+    if not binned:
+        aggregate = SlippageAggregate()
+        aggregate.add_points(np.asarray(order_sizes, dtype=float), np.asarray(slippage, dtype=float))
+        order_sizes, slippage, counts = aggregate.binned_points()
+    weights = np.asarray(counts, dtype=float)
+    if len(order_sizes) < 2:
+        return None
+
+    initial_guess = loglog_initial_guess(order_sizes, slippage, weights)
+    if np.isnan(initial_guess[0]):
+        return None
+
+    beta = np.sum(weights * order_sizes * slippage) / np.sum(weights * order_sizes ** 2)
+    popt_linear = np.array([beta])
 
-    slippage_df = pd.DataFrame(slippage_results)
+    try:
+        popt_power, _, info, message, status = curve_fit(
+            power_law_model, order_sizes, slippage, p0=initial_guess,
+            sigma=1 / np.sqrt(weights), maxfev=5000, full_output=True)
+        converged = status in (1, 2, 3, 4)
+        evaluations = int(info['nfev'])
+    except RuntimeError as e:
+        # Keep the log-log estimate, but say the refinement did not converge
+        popt_power, converged, evaluations, message = np.array(initial_guess), False, 5000, str(e)
 
-    if slippage_df.empty or len(slippage_df) < 2:
+    def residual_summary(predicted):
+        residuals = slippage - predicted
+        return {
+            'rmse': float(np.sqrt(np.average(residuals ** 2, weights=weights))),
+            'residuals': residuals.tolist()
+        }
+
+    return {
+        'popt_linear': popt_linear,
+        'popt_power': np.asarray(popt_power),
+        'diagnostics': {
+            'bins': int(len(order_sizes)),
+            'points': int(weights.sum()),
+            'initial_guess': {'a': initial_guess[0], 'b': initial_guess[1]},
+            'power_law': {'converged': bool(converged), 'evaluations': evaluations, 'message': message,
+                          **residual_summary(power_law_model(order_sizes, *popt_power))},
+            'linear': residual_summary(linear_model(order_sizes, beta))
+        }
+    }
+
+def analyze_slippage_from_data(file_path, sample_rows=1000, sampling='head', stride=10, seed=0):
+    """
+    Analyzes slippage from order book data in a CSV file.
+
+    The file is read in chunks. With sampling='head' the first `sample_rows` rows are
+    used and with 'reservoir' a uniform random sample of `sample_rows` rows; 'stride'
+    (every `stride`-th row) and 'full' stream the whole file into per-bin aggregates
+    with flat memory use, and the models are fitted to the bin means.
+    """
+    # We are interested in the state of the book, which is present in each row.
+    # Rows where the top-of-book is missing are skipped. Every snapshot of the
+    # ask book is walked for a range of order sizes, up to 50% of book depth.
+    chunks = iter_csv_book(file_path, nrows=sample_rows if sampling == 'head' else None)
+    sample = sample_slippage(chunks, sampling, sample_rows, order_size_points=20, book_depth_pct=0.5,
+                             stride=stride, seed=seed)
+    slippage_df = pd.DataFrame({'order_size': sample.order_sizes, 'slippage': sample.slippage})
+
+    fit = fit_impact_models(sample.order_sizes, sample.slippage, sample.counts, sample.binned)
+    if fit is None:
         print(f"Not enough data to fit models for {file_path.split('/')[-1]}.")
         return (np.nan,), (np.nan, np.nan)
+    popt_linear, popt_power = fit['popt_linear'], fit['popt_power']
+    if not fit['diagnostics']['power_law']['converged']:
+        print(f"Power law fit did not converge: {fit['diagnostics']['power_law']['message']}")
 
-    # Fit linear model
-    popt_linear, _ = curve_fit(linear_model, slippage_df['order_size'], slippage_df['slippage'])
-    
-    # Fit power law model
-    popt_power, _ = curve_fit(power_law_model, slippage_df['order_size'], slippage_df['slippage'], p0=[1e-5, 1.5], maxfev=5000)
-    
-    # Plotting
+    # Plotting (imported here so the models can be used without a display backend)
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 6))
     plt.scatter(slippage_df['order_size'], slippage_df['slippage'], label='Empirical Slippage', color='blue', s=10, alpha=0.5)
     plt.plot(slippage_df['order_size'], linear_model(slippage_df['order_size'], *popt_linear), 'g--', label=f'Linear Fit: beta={popt_linear[0]:.6f}')
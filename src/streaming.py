@@ -0,0 +1,201 @@
+from collections import namedtuple
+
+import numpy as np
+
+from order_book import OrderBook, side_slippage_points, valid_snapshot_count
+
+SAMPLING_MODES = ('head', 'reservoir', 'stride', 'full')
+
+# Fixed log-spaced order-size bins (1 share to 1e8 shares), shared by every
+# aggregate so that partial aggregates can be merged bin by bin
+BINS_PER_DECADE = 20
+BIN_EDGES = np.logspace(0, 8, 8 * BINS_PER_DECADE + 1)
+
+# Slippage points ready for fitting; `counts` is the number of raw points behind
+# each entry (all ones unless the points are bin means), and `rows` the sampled
+# snapshot each raw point came from (None for bin means)
+SlippageSample = namedtuple('SlippageSample', ['order_sizes', 'slippage', 'counts', 'snapshots', 'binned', 'rows'])
+
+
+class SlippageAggregate:
+    """
+    Running sufficient statistics of a stream of slippage points.
+
+    Keeps per-order-size-bin sums and counts, from which weighted bin means can be
+    fitted. Memory use is fixed regardless of how many points are added.
+    """
+
+    def __init__(self):
+        bins = len(BIN_EDGES) + 1
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.sum_x = np.zeros(bins)
+        self.sum_y = np.zeros(bins)
+        self.snapshots = 0
+
+    @property
+    def points(self):
+        return int(self.counts.sum())
+
+    def add_points(self, order_sizes, slippage):
+        """Folds a batch of (positive) slippage points into the aggregates."""
+        bins = np.searchsorted(BIN_EDGES, order_sizes, side='right')
+        n = len(self.counts)
+        self.counts += np.bincount(bins, minlength=n)
+        self.sum_x += np.bincount(bins, weights=order_sizes, minlength=n)
+        self.sum_y += np.bincount(bins, weights=slippage, minlength=n)
+
+    def binned_points(self):
+        """
+        Returns the mean point of every non-empty order-size bin.
+
+        Returns:
+            tuple: (mean order size, mean slippage, point count) arrays.
+        """
+        filled = self.counts > 0
+        counts = self.counts[filled]
+        return self.sum_x[filled] / counts, self.sum_y[filled] / counts, counts
+
+
+def head_sample(chunks, rows):
+    """Yields the first `rows` snapshots of a chunk stream."""
+    remaining = rows
+    for chunk in chunks:
+        if remaining <= 0:
+            return
+        yield OrderBook(*(column[:remaining] for column in chunk))
+        remaining -= len(chunk.bid_top)
+
+
+def stride_sample(chunks, stride):
+    """Yields every `stride`-th snapshot of a chunk stream, counted across chunk boundaries."""
+    offset = 0
+    for chunk in chunks:
+        start = -offset % stride
+        yield OrderBook(*(column[start::stride] for column in chunk))
+        offset += len(chunk.bid_top)
+
+
+def reservoir_sample(chunks, size, seed=0):
+    """
+    Draws a uniform random sample of `size` snapshots from a chunk stream in one pass.
+
+    Vectorized reservoir sampling (Algorithm R): each row's replacement slot is drawn
+    for a whole chunk at once, and when several rows of a chunk hit the same slot the
+    last one wins, exactly as in the sequential algorithm.
+
+    Returns:
+        OrderBook: The sampled snapshots in their original order.
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    positions = np.full(size, -1, dtype=np.int64)
+    seen = 0
+    for chunk in chunks:
+        rows = len(chunk.bid_top)
+        if reservoir is None:
+            reservoir = [np.empty((size,) + column.shape[1:], dtype=column.dtype) for column in chunk]
+        index = seen + np.arange(rows)
+
+        # Fill phase: the first `size` rows go straight into the reservoir
+        fill = index < size
+        for stored, column in zip(reservoir, chunk):
+            stored[index[fill]] = column[fill]
+        positions[index[fill]] = index[fill]
+
+        # Replacement phase: row i lands in slot j ~ U[0, i] if j < size
+        candidates = np.flatnonzero(~fill)
+        slots = rng.integers(0, index[candidates] + 1)
+        accepted, slots = candidates[slots < size], slots[slots < size]
+        _, last = np.unique(slots[::-1], return_index=True)
+        winners = len(slots) - 1 - last
+        accepted, slots = accepted[winners], slots[winners]
+        for stored, column in zip(reservoir, chunk):
+            stored[slots] = column[accepted]
+        positions[slots] = index[accepted]
+        seen += rows
+
+    if reservoir is None:
+        return None
+    order = np.argsort(positions[positions >= 0])
+    return OrderBook(*(stored[:min(seen, size)][order] for stored in reservoir))
+
+
+def sample_slippage(chunks, sampling='head', sample_rows=1000, order_size_points=20,
+                    book_depth_pct=0.5, stride=10, seed=0, side='buy'):
+    """
+    Computes the slippage points of one side of a chunked order book under a sampling mode.
+
+    Returns:
+        SlippageSample: As in `sample_sides`, for `side` ('buy' or 'sell').
+    """
+    return sample_sides(chunks, (side,), sampling, sample_rows, order_size_points, book_depth_pct,
+                        stride, seed)[side]
+
+
+def sample_sides(chunks, sides, sampling='head', sample_rows=1000, order_size_points=20,
+                 book_depth_pct=0.5, stride=10, seed=0):
+    """
+    Computes the slippage points of a chunked order book under a sampling mode.
+
+    Every requested side is computed from the same sampled snapshots in the same
+    pass, so a two-sided sample reads the book once.
+
+    Args:
+        chunks (iterable): OrderBook chunks in file order.
+        sides (tuple): Names from BOOK_SIDES.
+        sampling (str): 'head' takes the first `sample_rows` snapshots and 'reservoir'
+            a uniform random sample of `sample_rows` snapshots; both return raw points.
+            'full' streams every snapshot and 'stride' every `stride`-th one into
+            running per-bin aggregates, so memory stays flat and bin means are returned.
+
+    Returns:
+        dict: Side -> SlippageSample with the points to fit and the number of valid
+        snapshots used.
+    """
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode {sampling!r}, expected one of {SAMPLING_MODES}")
+
+    if sampling in ('head', 'reservoir'):
+        if sampling == 'head':
+            books = list(head_sample(chunks, sample_rows))
+            book = OrderBook(*(np.concatenate(columns) for columns in zip(*books))) if books else None
+        else:
+            book = reservoir_sample(chunks, sample_rows, seed)
+        return book_slippage(book, order_size_points, book_depth_pct, sides)
+
+    return aggregate_slippage(chunks, [(order_size_points, book_depth_pct)], sampling, stride, sides)[0]
+
+
+def book_slippage(book, order_size_points, book_depth_pct, sides=('buy',)):
+    """Computes the raw slippage points of an in-memory OrderBook (None for no rows) as side -> SlippageSample."""
+    if book is None:
+        return {side: SlippageSample(np.empty(0), np.empty(0), np.empty(0, dtype=np.int64), 0, False,
+                                     np.empty(0, dtype=np.int64)) for side in sides}
+    snapshots = valid_snapshot_count(book)
+    points = side_slippage_points(book, sides, order_size_points, book_depth_pct, return_rows=True)
+    return {side: SlippageSample(order_sizes, slippage, np.ones(len(order_sizes), dtype=np.int64),
+                                 snapshots, False, rows)
+            for side, (order_sizes, slippage, rows) in points.items()}
+
+
+def aggregate_slippage(chunks, grids, sampling='full', stride=10, sides=('buy',)):
+    """
+    Streams a chunked order book into binned slippage aggregates for several order-size grids at once.
+
+    Each chunk is read once and walked for every (order_size_points, book_depth_pct)
+    pair in `grids`, with all `sides` of a pair in one batched walk, so a sweep over
+    grids and sides costs one pass over the file.
+
+    Returns:
+        list: One dict of side -> binned SlippageSample per entry of `grids`.
+    """
+    aggregates = [{side: SlippageAggregate() for side in sides} for _ in grids]
+    for chunk in stride_sample(chunks, stride) if sampling == 'stride' else chunks:
+        snapshots = valid_snapshot_count(chunk)
+        for by_side, (order_size_points, book_depth_pct) in zip(aggregates, grids):
+            points = side_slippage_points(chunk, sides, order_size_points, book_depth_pct)
+            for side, aggregate in by_side.items():
+                aggregate.snapshots += snapshots
+                aggregate.add_points(*points[side])
+    return [{side: SlippageSample(*aggregate.binned_points(), aggregate.snapshots, True, None)
+             for side, aggregate in by_side.items()} for by_side in aggregates]
@@ -1,5 +1,5 @@
 import numpy as np
-from scipy.optimize import minimize
+from scipy.optimize import Bounds, brentq, minimize
 from slippage_model import power_law_model # Assuming power law is a better fit
 
 def objective_function(x, slippage_params):
@@ -8,32 +8,90 @@ def objective_function(x, slippage_params):
     a, b = slippage_params
     return np.sum(power_law_model(x, a, b) * x)
 
+def objective_gradient(x, slippage_params):
+    """The analytic gradient of the objective: a * (b + 1) * x^b per interval."""
+    a, b = slippage_params
+    # x^b is unbounded at zero for b < 0; evaluate just inside the bound instead
+    return a * (b + 1) * np.power(np.maximum(x, 1e-12), b)
+
+def _shares_constraint(x, total_shares):
+    return np.sum(x) - total_shares
+
+def _shares_constraint_jacobian(x, total_shares):
+    return np.ones_like(x)
+
+def is_convex(slippage_params):
+    """
+    Whether the power-law objective is convex for non-negative allocations.
+
+    The second derivative of a * x^(b + 1) is a * (b + 1) * b * x^(b - 1),
+    so the objective is convex exactly when a * b * (b + 1) >= 0.
+    """
+    a, b = slippage_params
+    return a * b * (b + 1) >= 0
+
+def marginal_cost_allocation(total_shares, a, b):
+    """
+    Closed-form optimum of a convex allocation with per-interval parameters (a > 0, b > 0).
+    
+    At the optimum every interval has the same marginal cost a_i * (b_i + 1) * x_i^b_i,
+    so x_i = (lambda / (a_i * (b_i + 1)))^(1 / b_i); the common log(lambda) is found
+    by a one-dimensional root search on the total.
+    """
+    log_scale = np.log(a * (b + 1))
+    def excess(log_marginal):
+        return np.exp((log_marginal - log_scale) / b).sum() - total_shares
+    # At `low` every interval takes at most total_shares / n, at `high` one takes all of them
+    low = np.min(log_scale + b * np.log(total_shares / len(a)))
+    high = np.max(log_scale + b * np.log(total_shares))
+    allocations = np.exp((brentq(excess, low, high, xtol=1e-12) - log_scale) / b)
+    return allocations * (total_shares / allocations.sum())
+
 def solve_trade_allocation(total_shares, num_intervals, slippage_params):
     """
     Solves the optimal trade allocation problem.
     
+    When the objective is convex with one (a, b) for all intervals it is also
+    symmetric across intervals, so the equal split satisfies the optimality
+    conditions and is returned directly. Per-interval parameters with a, b > 0
+    are solved in closed form up to one scalar root search. Otherwise SLSQP is
+    used with the analytic gradient and constraint Jacobian.
+    
     Args:
         total_shares (float): The total number of shares to be executed.
         num_intervals (int): The number of trading intervals.
-        slippage_params (tuple): The fitted parameters (a, b) for the power law model.
+        slippage_params (tuple): The fitted parameters (a, b) for the power law model,
+            either floats or arrays with one entry per interval.
         
     Returns:
         np.array: The optimal allocation of shares for each interval.
     """
+    # Initial guess: an equal allocation across all intervals
+    equal_split = np.full(num_intervals, total_shares / num_intervals)
+    a, b = (np.asarray(value, dtype=float) for value in slippage_params)
+    if a.ndim or b.ndim:
+        a, b = np.broadcast_to(a, num_intervals), np.broadcast_to(b, num_intervals)
+        if np.all(a == a[0]) and np.all(b == b[0]):
+            a, b = a[0], b[0]
+        elif total_shares > 0 and np.all(a > 0) and np.all(b > 0):
+            return marginal_cost_allocation(total_shares, a, b)
+        slippage_params = (a, b)
+    if not a.ndim and is_convex((a, b)):
+        return equal_split
+    
     # Constraint: the sum of shares in all intervals must equal the total shares
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - total_shares})
+    constraints = {'type': 'eq', 'fun': _shares_constraint,
+                   'jac': _shares_constraint_jacobian, 'args': (total_shares,)}
     
     # Bounds: the number of shares in each interval must be non-negative
-    bounds = [(0, total_shares) for _ in range(num_intervals)]
-    
-    # Initial guess: an equal allocation across all intervals
-    initial_guess = np.full(num_intervals, total_shares / num_intervals)
+    bounds = Bounds(0, total_shares)
     
     # Solve the optimization problem
     result = minimize(
         objective_function,
-        initial_guess,
+        equal_split,
         args=(slippage_params,),
+        jac=objective_gradient,
         method='SLSQP',
         bounds=bounds,
         constraints=constraints
@@ -44,6 +102,231 @@ def solve_trade_allocation(total_shares, num_intervals, slippage_params):
     else:
         raise ValueError("Optimization failed: " + result.message)
 
+def solve_trade_allocation_batch(problems):
+    """
+    Solves many trade allocation problems at once.
+    
+    Convex problems are resolved together: one vectorized convexity test, and
+    their equal splits are cut from one repeated array. Only the non-convex
+    remainder goes through the numerical solver, one problem at a time.
+    
+    Args:
+        problems (list): (total_shares, num_intervals, a, b) tuples.
+        
+    Returns:
+        list: One allocation array per problem, or None where the optimization failed.
+    """
+    if not problems:
+        return []
+    total_shares, num_intervals, a, b = (np.asarray(column, dtype=float) for column in zip(*problems))
+    num_intervals = num_intervals.astype(int)
+    convex = is_convex((a, b))
+    
+    allocations = [None] * len(problems)
+    equal_splits = np.repeat(total_shares[convex] / num_intervals[convex], num_intervals[convex])
+    splits = np.split(equal_splits, np.cumsum(num_intervals[convex])[:-1])
+    for i, split in zip(np.flatnonzero(convex), splits):
+        allocations[i] = split
+    for i in np.flatnonzero(~convex):
+        try:
+            allocations[i] = solve_trade_allocation(total_shares[i], num_intervals[i], (a[i], b[i]))
+        except ValueError:
+            pass
+    return allocations
+
+class _CouplingSystem:
+    """
+    Solves the Newton systems of the portfolio problem without forming them.
+
+    The barrier Hessian is diag(delta) + G^T diag(d) G, where G sums each interval's
+    allocations with the coupling weights, so it is diagonal plus a rank-K term per
+    interval. Its inverse is applied with the Woodbury identity through one K x K
+    system per interval, and the per-ticker share constraints are eliminated
+    through their (tickers x tickers) Schur complement, which is diagonal plus
+    rank K * intervals and is inverted the same way.
+    """
+
+    def __init__(self, delta, d, weights, active):
+        self.delta_inv = 1 / delta
+        self.weights = weights
+        self.active = active
+        K, T = active.shape
+        blocks = np.einsum('ki,li,it->tkl', weights, weights, self.delta_inv)
+        blocks *= active.T[:, :, None] * active.T[:, None, :]
+        blocks[:, np.arange(K), np.arange(K)] += np.where(active, 1 / np.where(active, d, 1.0), 1.0).T
+        self.blocks = blocks
+
+        # Schur complement of the share constraints: diag(q) - P M^-1 P^T
+        self.q = self.delta_inv.sum(axis=1)
+        P = weights[:, :, None] * self.delta_inv[None] * active[:, None, :]  # (K, N, T)
+        self.P = P.transpose(1, 2, 0).reshape(len(self.q), T * K)
+        inner = -(self.P.T / self.q) @ self.P
+        for t in range(T):
+            inner[t * K:(t + 1) * K, t * K:(t + 1) * K] += blocks[t]
+        self.inner = inner
+
+    def coupled(self, x):
+        return (self.weights @ x) * self.active
+
+    def spread(self, y):
+        return self.weights.T @ (y * self.active)
+
+    def solve_hessian(self, v):
+        """Applies the inverse barrier Hessian to a (tickers x intervals) array."""
+        scaled = self.delta_inv * v
+        y = np.linalg.solve(self.blocks, self.coupled(scaled).T[:, :, None])[:, :, 0].T
+        return scaled - self.delta_inv * self.spread(y)
+
+    def solve_schur(self, v):
+        """Solves (E H^-1 E^T) nu = v, E summing each ticker's allocations."""
+        scaled = v / self.q
+        y = np.linalg.solve(self.inner, self.P.T @ scaled)
+        return scaled + (self.P @ y) / self.q
+
+def solve_portfolio_allocation(total_shares, a, b, num_intervals, caps=None, coupling=(),
+                               tolerance=1e-9, max_iterations=200):
+    """
+    Jointly allocates a basket of orders across intervals under shared per-interval limits.
+
+    Minimizes sum_i sum_t a_i * x_it^(b_i + 1) subject to sum_t x_it = total_shares_i,
+    0 <= x_it <= caps_it and, for every coupling constraint k, sum_i weights_ki * x_it
+    <= limits_kt (e.g. weights of 1 for a share limit, or prices for a cash limit).
+
+    Solved with a primal-dual interior-point method. The objective is separable, so
+    its Hessian is diagonal, and each coupling constraint only links the tickers
+    within one interval; every Newton step therefore costs O(tickers * (constraints
+    * intervals)^2) through `_CouplingSystem`, and no (tickers * intervals)-sized
+    matrix is formed.
+
+    Args:
+        total_shares, a, b (np.array): Per-ticker order sizes and power-law parameters;
+            every ticker needs a > 0 and b >= 0 (a convex cost).
+        num_intervals (int): The number of trading intervals.
+        caps (np.array): Per-interval share caps, broadcastable to (tickers x intervals).
+        coupling (list): (weights, limits) pairs, with (tickers,) weights and
+            (intervals,) limits (inf where an interval is unconstrained).
+
+    Returns:
+        dict: 'allocations' (tickers x intervals), 'costs' per ticker, 'multipliers'
+        (constraints x intervals) shadow prices of the coupling limits, 'converged',
+        'max_violation' of the coupling limits relative to their typical size, and
+        'iterations'.
+
+    Raises:
+        ValueError: If a ticker's cost is not convex, or the caps or limits cannot
+            hold the orders.
+    """
+    total_shares, a, b = (np.asarray(column, dtype=float) for column in (total_shares, a, b))
+    if np.any(a <= 0) or np.any(b < 0):
+        raise ValueError('Joint allocation needs a > 0 and b >= 0 for every ticker')
+    if np.any(total_shares <= 0):
+        raise ValueError('total_shares must be positive for every ticker')
+    N, T = len(total_shares), num_intervals
+    caps = np.broadcast_to(np.inf if caps is None else np.asarray(caps, dtype=float), (N, T))
+    if np.any(caps.sum(axis=1) < total_shares * (1 - 1e-12)):
+        raise ValueError('Per-interval caps are too small for the total shares of some tickers')
+
+    weights = np.array([np.asarray(w, dtype=float) for w, _ in coupling]).reshape(len(coupling), N)
+    limits = np.array([np.broadcast_to(np.asarray(l, dtype=float), T) for _, l in coupling]).reshape(len(coupling), T)
+    active = np.isfinite(limits)
+    if np.any((weights @ total_shares > np.where(active, limits, np.inf).sum(axis=1) * (1 + 1e-12))
+              & active.all(axis=1)):
+        raise ValueError('Per-interval limits are too small for the total basket')
+
+    # Work in units of each ticker's equal split and of each constraint's typical
+    # limit, with the cost of the equal split as the unit of cost
+    unit = total_shares / T
+    norms = np.array([np.mean(np.abs(row[np.isfinite(row)])) if np.isfinite(row).any() else 1.0 for row in limits])
+    norms = np.where(norms > 0, norms, 1.0)
+    weights = weights * unit / norms[:, None]
+    h = np.where(active, limits / norms[:, None], 0.0)
+    coefficient = a * np.power(unit, b + 1)
+    cost_unit = np.sum(coefficient) * T
+    coefficient = (coefficient / cost_unit)[:, None]
+    power = (b + 1)[:, None]
+    u = caps / unit[:, None]
+    capped = np.isfinite(u)
+    target = np.full(N, float(T))
+
+    # Infeasible start: the equal split, pulled inside the caps, with unit duals
+    x = np.minimum(1.0, np.where(capped, u / 2, 1.0))
+    s = np.where(active, np.maximum(h - (weights @ x), 0.1), 1.0)
+    r = np.where(capped, np.maximum(u - x, 0.1), 1.0)
+    z = 1 / x
+    lam = np.where(active, 1 / s, 0.0)
+    w = np.where(capped, 1 / r, 0.0)
+    nu = np.zeros(N)
+    m = x.size + active.sum() + capped.sum()
+
+    def step_limit(value, change):
+        shrinking = change < 0
+        return np.min(-value[shrinking] / change[shrinking], initial=np.inf)
+
+    converged, iterations = False, 0
+    # Steps towards the boundary can overflow on the last iterations; non-finite updates are discarded
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for iterations in range(1, max_iterations + 1):
+            gradient = coefficient * power * np.power(x, b[:, None])
+            curvature = coefficient * power * b[:, None] * np.power(x, b[:, None] - 1)
+            r_dual = gradient + nu[:, None] + weights.T @ (lam * active) - z + w
+            r_shares = x.sum(axis=1) - target
+            r_limits = np.where(active, weights @ x + s - h, 0.0)
+            r_caps = np.where(capped, x + r - u, 0.0)
+            gap = (np.sum(z * x) + np.sum(lam * s * active) + np.sum(w * r * capped)) / m
+
+            # The cost's curvature is unbounded at zero for b < 1, which limits how
+            # accurately stationarity and the share totals (rescaled exactly below)
+            # can be resolved there
+            loose = np.sqrt(tolerance)
+            if (gap < tolerance and np.max(np.abs(r_dual)) < loose * (1 + np.max(np.abs(gradient)))
+                    and np.max(np.abs(r_shares)) < loose * T and np.max(np.abs(r_limits), initial=0) < tolerance
+                    and np.max(np.abs(r_caps), initial=0) < tolerance):
+                converged = True
+                break
+
+            sigma_mu = 0.1 * gap
+            c_lam = np.where(active, (sigma_mu - lam * s + lam * r_limits) / s, 0.0)
+            c_z = (sigma_mu - z * x) / x
+            c_w = np.where(capped, (sigma_mu - w * r + w * r_caps) / r, 0.0)
+            delta = curvature + z / x + np.where(capped, w / r, 0.0)
+            try:
+                system = _CouplingSystem(delta, np.where(active, lam / s, 1.0), weights, active)
+                g = r_dual + system.spread(c_lam) - c_z + c_w
+                h_g = system.solve_hessian(g)
+                d_nu = system.solve_schur(r_shares - h_g.sum(axis=1))
+                dx = -system.solve_hessian(g + d_nu[:, None])
+            except np.linalg.LinAlgError:
+                # The Newton system degenerates when the limits cannot all be met; reported as not converged
+                break
+            ds = np.where(active, -r_limits - weights @ dx, 0.0)
+            dr = np.where(capped, -r_caps - dx, 0.0)
+            dz = c_z - z / x * dx
+            d_lam = np.where(active, c_lam + lam / s * system.coupled(dx), 0.0)
+            dw = np.where(capped, c_w + w / r * dx, 0.0)
+
+            primal = min(step_limit(x, dx), step_limit(s[active], ds[active]), step_limit(r[capped], dr[capped]))
+            dual = min(step_limit(z, dz), step_limit(lam[active], d_lam[active]), step_limit(w[capped], dw[capped]))
+            alpha_p, alpha_d = min(1.0, 0.99 * primal), min(1.0, 0.99 * dual)
+            update = (x + alpha_p * dx, s + alpha_p * ds, r + alpha_p * dr,
+                      z + alpha_d * dz, lam + alpha_d * d_lam, w + alpha_d * dw, nu + alpha_d * d_nu)
+            if not all(np.all(np.isfinite(value)) for value in update):
+                break
+            x, s, r, z, lam, w, nu = update
+
+    allocations = x * unit[:, None]
+    # Remove the remaining share residual proportionally
+    allocations *= (total_shares / allocations.sum(axis=1))[:, None]
+    usage = (weights @ x) * active
+    violation = float(np.max(np.where(active, usage - h, 0.0), initial=0.0))
+    return {
+        'allocations': allocations,
+        'costs': a * np.sum(np.power(allocations, power), axis=1),
+        'multipliers': lam * active * cost_unit / norms[:, None],
+        'converged': converged,
+        'max_violation': violation,
+        'iterations': iterations
+    }
+
 if __name__ == '__main__':
     # --- Parameters for the simulation ---
     TOTAL_SHARES_TO_BUY = 10000  # Example: 10,000 shares
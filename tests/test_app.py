@@ -0,0 +1,331 @@
+import gzip
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from book_cache import load_timestamped_book
+from catalog import DataCatalog
+from order_book import walk_book
+from synthetic_book import write_book
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    for seed, ticker in enumerate(('AAA', 'BBB')):
+        os.makedirs(tmp_path / ticker)
+        write_book(str(tmp_path / ticker / f'{ticker}_2025-05-02.csv'), 1500, seed=seed)
+    monkeypatch.setattr(app, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'catalog', DataCatalog(str(tmp_path), 0, persist=False))
+    return tmp_path
+
+
+@pytest.fixture
+def client(data_dir, monkeypatch):
+    monkeypatch.setattr(app, 'COMPARE_WORKERS', 0)
+    return app.app.test_client()
+
+
+def finished_job(client, body):
+    job_id = client.post('/api/jobs', json=body).get_json()['job_id']
+    deadline = time.monotonic() + 60
+    while app.job_manager.get(job_id).snapshot()['status'] not in app.FINISHED_STATES:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return job_id
+
+
+def export(client, **params):
+    response = client.get('/api/export', query_string=params)
+    body = response.get_data()
+    if response.status_code == 200:
+        if params.get('compress') == 'gzip':
+            body = gzip.decompress(body)
+        return response.status_code, pd.read_csv(io.BytesIO(body))
+    return response.status_code, response.get_json()
+
+
+@pytest.fixture
+def thread_pool(monkeypatch):
+    """Runs compare fits on a one-thread pool, so tests can patch what a fit does."""
+    monkeypatch.setattr(app, 'ProcessPoolExecutor', lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+    monkeypatch.setattr(app, 'COMPARE_WORKERS', 1)
+    monkeypatch.setattr(app, '_compare_pool', None)
+    yield
+    if app._compare_pool is not None:
+        app._compare_pool.shutdown()
+
+
+def test_timed_out_fit_does_not_hold_the_compare_pool(data_dir, thread_pool, monkeypatch):
+    release = threading.Event()
+
+    def fit(file_path, *args):
+        if 'AAA' in file_path:
+            release.wait(30)
+        return app.fit_slippage_models(file_path, *args), {'stages': {}}
+
+    monkeypatch.setattr(app, 'profiled_fit_slippage_models', fit)
+    try:
+        results, errors = app.run_scenarios([{'ticker': 'AAA'}, {'ticker': 'BBB'}], timeout=0.5)
+    finally:
+        release.set()
+    # BBB was queued behind the stalled fit and ran on a new pool within its own timeout
+    assert results[0] is None and 'timed out' in errors[0]['error']
+    assert results[1] is not None and results[1]['ticker'] == 'BBB'
+
+
+def test_fits_cancelled_by_another_recycle_are_resubmitted(data_dir, thread_pool, monkeypatch):
+    def fit(file_path, *args):
+        if 'AAA' in file_path:
+            # Another request gives up on the shared pool while BBB is still queued
+            app.reset_compare_pool(app._compare_pool)
+        return app.fit_slippage_models(file_path, *args), {'stages': {}}
+
+    monkeypatch.setattr(app, 'profiled_fit_slippage_models', fit)
+    results, errors = app.run_scenarios([{'ticker': 'AAA'}, {'ticker': 'BBB'}], timeout=30)
+    assert errors == []
+    assert [result['ticker'] for result in results] == ['AAA', 'BBB']
+
+
+def test_first_readiness_probe_starts_the_warm_up(client, monkeypatch):
+    monkeypatch.setattr(app, 'readiness', dict(app.readiness, ready=False, warming=False))
+    monkeypatch.setattr(app, 'PRELOAD_TICKERS', 'AAA')
+    response = client.get('/api/ready')
+    assert response.status_code == 503
+    deadline = time.monotonic() + 30
+    while response.status_code == 503 and time.monotonic() < deadline:
+        time.sleep(0.05)
+        response = client.get('/api/ready')
+    assert response.status_code == 200
+    assert [entry['ticker'] for entry in response.get_json()['preloaded']] == ['AAA']
+
+
+def test_export_round_trips_an_analysis(client):
+    analysis = client.post('/api/analyze', json={'ticker': 'AAA', 'sample_size': 500,
+                                                 'slippage_format': 'columns', 'max_points': 100_000}).get_json()
+    result_id = analysis['result_id']
+
+    status, summary = export(client, result_id=result_id)
+    assert status == 200 and len(summary) == 1
+    assert summary['a'][0] == pytest.approx(analysis['model_params']['power_law']['a'], rel=1e-12)
+    assert summary['b'][0] == pytest.approx(analysis['model_params']['power_law']['b'], rel=1e-12)
+    assert summary['total_slippage_cost'][0] == pytest.approx(analysis['risk_metrics']['total_slippage_cost'])
+
+    status, allocations = export(client, result_id=result_id, table='allocations', compress='gzip')
+    assert status == 200
+    np.testing.assert_allclose(allocations['shares'], analysis['allocation']['allocations'])
+
+    status, points = export(client, result_id=result_id, table='slippage')
+    assert status == 200
+    fit = app.fit_cache.get(app.recent_results.get(result_id)['fit_key'])
+    np.testing.assert_allclose(points['order_size'], fit['slippage_df']['order_size'])
+    np.testing.assert_allclose(points['slippage'], fit['slippage_df']['slippage'])
+
+
+def test_export_refuses_results_of_changed_or_deleted_files(client, data_dir):
+    result_id = client.post('/api/analyze', json={'ticker': 'AAA', 'sample_size': 500}).get_json()['result_id']
+    # Evicted fits are refitted while the file is unchanged
+    app.fit_cache.clear()
+    assert export(client, result_id=result_id)[0] == 200
+
+    path = str(data_dir / 'AAA' / 'AAA_2025-05-02.csv')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    status, body = export(client, result_id=result_id)
+    assert status == 410 and 'changed' in body['error']
+
+    os.unlink(path)
+    assert export(client, result_id=result_id)[0] == 404
+    assert export(client, result_id='missing')[0] == 404
+
+
+def test_compare_job_export_keeps_the_dates_it_ran_on(client, data_dir):
+    job_id = finished_job(client, {'type': 'compare', 'scenarios': [{'ticker': 'AAA', 'sample_size': 500},
+                                                                     {'ticker': 'MISSING'},
+                                                                     {'ticker': 'BBB', 'sample_size': 500}]})
+    # A newer file becomes the latest date of AAA after the job ran
+    write_book(str(data_dir / 'AAA' / 'AAA_2025-05-05.csv'), 500, seed=9)
+    app.catalog.refresh(force=True)
+
+    status, summary = export(client, job_id=job_id)
+    assert status == 200
+    assert summary['result'].tolist() == [0, 2]
+    assert summary['ticker'].tolist() == ['AAA', 'BBB']
+    assert summary['date'].tolist() == ['2025-05-02', '2025-05-02']
+
+
+def test_analysis_etag_revalidates_until_the_inputs_or_file_change(client, data_dir):
+    body = {'ticker': 'AAA', 'sample_size': 500}
+    first = client.post('/api/analyze', json=body)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+
+    repeat = client.post('/api/analyze', json=body, headers={'If-None-Match': etag})
+    assert repeat.status_code == 304 and repeat.headers['ETag'] == etag
+    assert client.post('/api/analyze', json={**body, 'total_shares': 1000},
+                       headers={'If-None-Match': etag}).status_code == 200
+
+    path = str(data_dir / 'AAA' / 'AAA_2025-05-02.csv')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    changed = client.post('/api/analyze', json=body, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    # Refitted from the touched file, whose rows are unchanged
+    assert changed.get_json()['model_params'] == first.get_json()['model_params']
+
+
+def test_delete_cancels_a_running_job(client):
+    started = threading.Event()
+
+    def run(job):
+        started.set()
+        while True:
+            job.report(stage='fit')
+            time.sleep(0.01)
+
+    job = app.job_manager.submit('analyze', run)
+    started.wait(10)
+    assert client.delete(f'/api/jobs/{job.id}').status_code == 200
+    deadline = time.monotonic() + 10
+    while not job.done:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert client.get(f'/api/jobs/{job.id}').get_json()['status'] == 'cancelled'
+    assert client.get(f'/api/jobs/{job.id}/result').status_code == 409
+    # Deleting a finished job discards it
+    client.delete(f'/api/jobs/{job.id}')
+    assert client.get(f'/api/jobs/{job.id}').status_code == 404
+
+
+def test_analyze_job_export_is_pinned_to_the_file_it_started_on(client, data_dir, monkeypatch):
+    path = str(data_dir / 'AAA' / 'AAA_2025-05-02.csv')
+    analyze = app.process_ticker_data_dynamic
+
+    def analyze_then_touch(*args, **kwargs):
+        result = analyze(*args, **kwargs)
+        # The file changes while the job is still running
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+        return result
+
+    monkeypatch.setattr(app, 'process_ticker_data_dynamic', analyze_then_touch)
+    job_id = finished_job(client, {'ticker': 'AAA', 'sample_size': 500})
+    assert app.job_manager.get(job_id).snapshot()['status'] == 'succeeded'
+    status, body = export(client, job_id=job_id)
+    assert status == 410 and 'changed' in body['error']
+
+
+PORTFOLIO_ORDERS = [{'ticker': 'AAA', 'total_shares': 6_000, 'a': 2e-5, 'b': 0.6, 'price': 50,
+                     'max_shares_per_interval': 2_500},
+                    {'ticker': 'BBB', 'total_shares': 3_000, 'a': 5e-5, 'b': 0.9, 'price': 120},
+                    {'ticker': 'CCC', 'total_shares': 9_000, 'a': 1e-5, 'b': 0.4, 'price': 20}]
+
+
+def test_portfolio_allocation_meets_the_limits(client):
+    response = client.post('/api/portfolio', json={'orders': PORTFOLIO_ORDERS, 'trading_intervals': 4,
+                                                   'interval_share_limit': [4_000, 6_000, 5_000, 6_000]})
+    assert response.status_code == 200
+    usage = response.get_json()['intervals']['shares']['usage']
+    assert max(u - limit for u, limit in zip(usage, [4_000, 6_000, 5_000, 6_000])) < 1e-3
+
+
+@pytest.mark.parametrize('limits', [
+    # Too small for the basket: rejected before solving
+    {'interval_share_limit': 1_000},
+    # Feasible one at a time but not together: the solver does not converge
+    {'interval_share_limit': 4_500, 'interval_cash_limit': [100_000, 100_000, 100_000, None]},
+])
+def test_portfolio_answers_400_when_the_solver_fails(client, limits):
+    orders = [{key: value for key, value in order.items() if key != 'max_shares_per_interval'}
+              for order in PORTFOLIO_ORDERS]
+    response = client.post('/api/portfolio', json={'orders': orders, 'trading_intervals': 4, **limits})
+    assert response.status_code == 400
+    assert ('too small' if 'interval_cash_limit' not in limits else 'infeasible') in response.get_json()['error']
+
+
+def test_point_slippage_matches_the_book_walk(client, data_dir):
+    path = str(data_dir / 'AAA' / 'AAA_2025-05-02.csv')
+    book, timestamps = load_timestamped_book(path)
+    times = pd.to_datetime(timestamps[[0, 700]]).strftime('%Y-%m-%dT%H:%M:%S.%fZ').tolist()
+    before = '2025-05-02T00:00:00Z'
+    response = client.get('/api/slippage', query_string={'ticker': 'AAA', 'sizes': '100,1000,100000000',
+                                                         'at': ','.join([before] + times)})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['snapshots'] == 2 and body['timestamp'][0] is None
+    assert body['slippage'][0] == [None, None, None]
+    for position, row in ((1, 0), (2, 700)):
+        mid = (book.bid_top[row] + book.ask_top[row]) / 2
+        assert body['mid_price'][position] == pytest.approx(mid)
+        expected = walk_book(np.array([[100.0, 1000.0]]), book.ask_prices[row:row + 1],
+                             book.ask_sizes[row:row + 1], np.array([mid]))[0]
+        assert body['slippage'][position][:2] == pytest.approx(expected.tolist(), rel=1e-9)
+        # Beyond the visible depth
+        assert body['slippage'][position][2] is None
+
+    ranged = client.get('/api/slippage', query_string={'ticker': 'AAA', 'sizes': '100', 'from': times[0],
+                                                       'to': times[1]}).get_json()
+    assert ranged['snapshots'] == 701
+
+
+@pytest.mark.parametrize('query, status', [
+    ({'ticker': 'AAA'}, 400),
+    ({'ticker': 'AAA', 'sizes': 'ten'}, 400),
+    ({'ticker': 'AAA', 'sizes': '100', 'at': 'yesterday-ish'}, 400),
+    ({'ticker': 'AAA', 'sizes': '100', 'from': 'not a time'}, 400),
+    ({'ticker': 'AAA', 'sizes': ','.join(['100'] * 11)}, 400),
+    ({'ticker': 'ZZZ', 'sizes': '100'}, 404),
+])
+def test_point_slippage_validation(client, monkeypatch, query, status):
+    monkeypatch.setattr(app, 'MAX_SLIPPAGE_QUERIES', 10_000)
+    response = client.get('/api/slippage', query_string=query)
+    assert response.status_code == status and 'error' in response.get_json()
+
+
+SWEEP = {'ticker': 'AAA', 'sample_size': [400, 200, 400], 'order_size_points': [10, 5], 'book_depth_pct': [60, 30],
+         'trading_intervals': [5, 3], 'total_shares': {'start': 1000, 'stop': 3000, 'step': 1000}}
+
+
+@pytest.mark.parametrize('sampling, walks', [('head', 8), ('stride', 4)])
+def test_sweep_shares_work_and_matches_single_analyses(client, sampling, walks):
+    app.fit_cache.clear()
+    app.allocation_cache.clear()
+    response = client.post('/api/sweep', json={**SWEEP, 'sampling': sampling, 'stride': 3})
+    assert response.status_code == 200
+    sweep = response.get_json()
+    # One load, one book walk per distinct (sample, points, depth), all allocations in one batch
+    assert sweep['stages'] == {'loads': 1, 'walks': walks, 'fits': walks, 'fit_cache_hits': 0,
+                               'allocations': walks * 6, 'allocation_cache_hits': 0}
+    assert sweep['axes'] == {'sample_size': [200, 400], 'order_size_points': [5, 10], 'book_depth_pct': [30.0, 60.0],
+                             'trading_intervals': [3, 5], 'total_shares': [1000, 2000, 3000]}
+    assert np.shape(sweep['fits']['a']) == (2, 2, 2)
+    assert np.shape(sweep['allocations']['total_slippage_cost']) == (2, 2, 2, 2, 3)
+
+    repeat = client.post('/api/sweep', json={**SWEEP, 'sampling': sampling, 'stride': 3}).get_json()
+    assert repeat['stages'] == {'loads': 0, 'walks': 0, 'fits': 0, 'fit_cache_hits': walks,
+                                'allocations': 0, 'allocation_cache_hits': walks * 6}
+    assert repeat['fits'] == sweep['fits'] and repeat['allocations'] == sweep['allocations']
+
+    # Every cell equals the analysis of its parameters run on its own, from cold caches
+    app.fit_cache.clear()
+    app.allocation_cache.clear()
+    axes = sweep['axes']
+    for i, sample_size in enumerate(axes['sample_size']):
+        for j, points in enumerate(axes['order_size_points']):
+            for k, depth in enumerate(axes['book_depth_pct']):
+                for m, intervals in enumerate(axes['trading_intervals']):
+                    for n, shares in enumerate(axes['total_shares']):
+                        analysis = client.post('/api/analyze', json={
+                            'ticker': 'AAA', 'sampling': sampling, 'stride': 3, 'sample_size': sample_size,
+                            'order_size_points': points, 'book_depth_pct': depth,
+                            'trading_intervals': intervals, 'total_shares': shares}).get_json()
+                        power_law = analysis['model_params']['power_law']
+                        assert sweep['fits']['a'][i][j][k] == pytest.approx(power_law['a'], rel=1e-9)
+                        assert sweep['fits']['b'][i][j][k] == pytest.approx(power_law['b'], rel=1e-9)
+                        assert sweep['fits']['beta'][i][j][k] == pytest.approx(
+                            analysis['model_params']['linear']['beta'], rel=1e-9)
+                        for name, values in sweep['allocations'].items():
+                            assert values[i][j][k][m][n] == pytest.approx(analysis['risk_metrics'][name], rel=1e-6)
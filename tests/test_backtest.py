@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from backtest import interval_windows, replay_schedules, schedule_allocations
+from order_book import MISSING_TIMESTAMP, OrderBook, depth_index
+
+NAN = np.nan
+
+
+@pytest.fixture
+def index():
+    """
+    Six snapshots around a mid of 100. The unstamped row is never traded, and the
+    stamped ones split 2/3 into two intervals: [0, 20) and [20, 40].
+    """
+    ask_prices = np.array([[101, 102], [101, 103], [101, 102], [102, NAN], [101, 102], [99, 99.5]])
+    ask_sizes = np.array([[10, 10], [5, 5], [10, 10], [20, NAN], [10, 10], [1000, 1000]])
+    bid_top = np.array([99, 99, NAN, 98, 99, 98])
+    book = OrderBook(bid_top, ask_prices[:, 0], ask_prices, ask_sizes, ask_prices - 2, ask_sizes)
+    # The third snapshot has no bid, so no mid price to trade against
+    return depth_index(book, np.array([0, 10, 20, 30, 40, MISSING_TIMESTAMP]))
+
+
+def test_interval_windows_split_by_time(index):
+    rows, windows, bounds = interval_windows(index.timestamps, 2)
+    np.testing.assert_array_equal(rows, [0, 1, 2, 3, 4])
+    np.testing.assert_array_equal(windows, [0, 0, 1, 1, 1])
+    np.testing.assert_array_equal(bounds, [0, 20, 40])
+
+
+def test_interval_windows_of_unsorted_timestamps():
+    rows, windows, bounds = interval_windows(np.array([30, MISSING_TIMESTAMP, 0, 100]), 3)
+    np.testing.assert_array_equal(rows, [2, 0, 3])
+    np.testing.assert_array_equal(windows, [0, 0, 2])
+    np.testing.assert_array_equal(bounds, [0, 33, 66, 100])
+
+
+def test_interval_windows_without_timestamps_split_by_rows():
+    rows, windows, bounds = interval_windows(np.full(5, MISSING_TIMESTAMP), 2)
+    np.testing.assert_array_equal(rows, np.arange(5))
+    np.testing.assert_array_equal(windows, [0, 0, 0, 1, 1])
+    assert bounds is None
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 2, 100])
+def test_average_replay_by_hand(index, chunk_rows):
+    replay = replay_schedules(index, [[10, 15], [20, 5], [0, 0]], chunk_rows=chunk_rows)
+    # 10 shares: 10 @ 101, and 5 @ 101 + 5 @ 103; 15 shares: 15 @ 102, and 10 @ 101 + 5 @ 102
+    # 20 shares: 10 @ 101 + 10 @ 102, and beyond the 10 visible; 5 shares: 5 @ 102, and 5 @ 101
+    np.testing.assert_allclose(replay['costs'], [[(10 + 20) / 2, (30 + 20) / 2],
+                                                 [30, (10 + 5) / 2],
+                                                 [0, 0]])
+    np.testing.assert_allclose(replay['fillable'], [[1, 2 / 3], [1 / 2, 2 / 3], [1, 1]])
+    np.testing.assert_array_equal(replay['snapshots'], [2, 3])
+
+
+def test_first_replay_trades_the_first_quoted_snapshot(index):
+    replay = replay_schedules(index, [[10, 15], [20, 5]], execution='first')
+    # The second interval opens on the unquoted third snapshot, so the fourth is traded
+    np.testing.assert_allclose(replay['costs'], [[10, 30], [30, 10]])
+    np.testing.assert_array_equal(replay['snapshots'], [1, 1])
+
+
+def test_replay_of_an_empty_interval(index):
+    # Six intervals with bounds [0, 6, 13, 20, 26, 33, 40]: none of the snapshots falls in [13, 20)
+    replay = replay_schedules(index, [[10] * 6, [10, 10, 0, 10, 10, 10]])
+    np.testing.assert_array_equal(replay['snapshots'], [1, 1, 0, 1, 1, 1])
+    assert np.isnan(replay['costs'][0, 2]) and replay['costs'][1, 2] == 0
+    # The unquoted snapshot alone in its interval cannot fill it
+    np.testing.assert_allclose(replay['costs'][1], [10, 20, 0, NAN, 20, 10])
+    np.testing.assert_allclose(replay['fillable'][1], [1, 1, 0, 0, 1, 1])
+
+
+def test_schedule_allocations_sum_to_the_order():
+    np.testing.assert_allclose(schedule_allocations('front_loaded', 600, 3), [300, 200, 100])
+    np.testing.assert_allclose(schedule_allocations('back_loaded', 600, 3), [100, 200, 300])
+    np.testing.assert_allclose(schedule_allocations('equal', 600, 3), [200, 200, 200])
+    with pytest.raises(ValueError):
+        schedule_allocations('twap', 600, 3)
@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import book_cache
+from book_cache import cache_dir_for, load_book, load_depth_index
+from order_book import frame_book_arrays
+from synthetic_book import write_book
+
+
+@pytest.fixture
+def book_csv(tmp_path):
+    return write_book(str(tmp_path / 'TEST_2025-05-02.csv'), 2000, seed=3)
+
+
+def manifest_of(file_path):
+    with open(os.path.join(cache_dir_for(file_path), 'manifest.json')) as f:
+        return json.load(f)
+
+
+def test_cache_matches_csv(book_csv):
+    book = load_book(book_csv)
+    expected = frame_book_arrays(pd.read_csv(book_csv))
+    for cached, parsed in zip(book, expected):
+        np.testing.assert_array_equal(np.asarray(cached, dtype=float), parsed)
+
+
+def test_cache_is_reused_until_the_file_changes(book_csv, monkeypatch):
+    load_book(book_csv)
+    manifest = manifest_of(book_csv)
+    monkeypatch.setattr(book_cache, 'convert_to_cache', lambda *args: pytest.fail('cache rebuilt'))
+    load_book(book_csv)
+    assert manifest_of(book_csv) == manifest
+
+
+def test_rewritten_file_rebuilds_the_cache(book_csv):
+    first = np.array(load_book(book_csv).ask_prices)
+    write_book(book_csv, 1500, seed=4)
+    book = load_book(book_csv)
+    assert len(book.ask_prices) == 1500
+    assert not np.array_equal(book.ask_prices[:10], first[:10])
+
+
+def test_other_cache_version_is_rebuilt(book_csv):
+    load_book(book_csv)
+    path = os.path.join(cache_dir_for(book_csv), 'manifest.json')
+    manifest = manifest_of(book_csv)
+    with open(path, 'w') as f:
+        json.dump({**manifest, 'version': manifest['version'] - 1}, f)
+    load_book(book_csv)
+    assert manifest_of(book_csv)['version'] == book_cache.CACHE_VERSION
+    assert manifest_of(book_csv)['arrays'] != manifest['arrays']
+
+
+def test_loaded_arrays_survive_a_rebuild(book_csv):
+    book = load_book(book_csv)
+    before = np.array(book.ask_prices)
+    write_book(book_csv, 1500, seed=4)
+    load_book(book_csv)
+    # The earlier mapping still reads the version it was loaded from
+    np.testing.assert_array_equal(book.ask_prices, before)
+
+
+def test_arrays_come_from_one_published_version(book_csv):
+    load_book(book_csv)
+    write_book(book_csv, 1500, seed=4)
+    index = load_depth_index(book_csv)
+    data_dirs = [entry for entry in os.listdir(cache_dir_for(book_csv)) if entry.startswith('data-')]
+    assert data_dirs == [manifest_of(book_csv)['arrays']]
+    assert len(index.timestamps) == len(index.cum_size) == len(index.mid_prices) == 1500
+
+
+def test_missing_data_directory_is_rebuilt(book_csv):
+    load_book(book_csv)
+    shutil.rmtree(os.path.join(cache_dir_for(book_csv), manifest_of(book_csv)['arrays']))
+    assert len(load_book(book_csv).bid_top) == 2000
+
+
+def split_csv(file_path):
+    with open(file_path, 'rb') as f:
+        header, *lines = f.read().splitlines(keepends=True)
+    return header, lines
+
+
+def test_appended_rows_match_a_full_rebuild(tmp_path, book_csv, monkeypatch):
+    header, lines = split_csv(book_csv)
+    growing = str(tmp_path / 'GROW_2025-05-02.csv')
+    with open(growing, 'wb') as f:
+        f.write(header + b''.join(lines[:500]))
+    load_book(growing)
+
+    # Parsing only the new lines; a line still being written is left for later
+    monkeypatch.setattr(book_cache, 'convert_to_cache', lambda *args: pytest.fail('cache rebuilt'))
+    with open(growing, 'ab') as f:
+        f.write(b''.join(lines[500:1200]) + lines[1200][:15])
+    assert len(load_book(growing).bid_top) == 1200
+    with open(growing, 'ab') as f:
+        f.write(lines[1200][15:] + b''.join(lines[1201:]))
+    appended, appended_index = load_book(growing), load_depth_index(growing)
+    monkeypatch.undo()
+
+    rebuilt, rebuilt_index = load_book(book_csv), load_depth_index(book_csv)
+    for cached, expected in zip(appended + appended_index, rebuilt + rebuilt_index):
+        np.testing.assert_array_equal(cached, expected)
+
+
+def test_edited_prefix_rebuilds_instead_of_appending(tmp_path, book_csv):
+    header, lines = split_csv(book_csv)
+    growing = str(tmp_path / 'GROW_2025-05-02.csv')
+    with open(growing, 'wb') as f:
+        f.write(header + b''.join(lines[:500]))
+    load_book(growing)
+    # Same prefix length, different first row, and more rows
+    with open(growing, 'wb') as f:
+        f.write(header + b''.join(lines[1:601]))
+    book = load_book(growing)
+    assert len(book.bid_top) == 600
+    np.testing.assert_array_equal(book.ask_prices[0], load_book(book_csv).ask_prices[1])
+
+
+def rewrite_price(file_path, row, old, new):
+    """Replaces a price in one row of a CSV in place, keeping the file size."""
+    header, lines = split_csv(file_path)
+    assert old in lines[row] and len(old) == len(new)
+    lines[row] = lines[row].replace(old, new, 1)
+    with open(file_path, 'wb') as f:
+        f.write(header + b''.join(lines))
+
+
+@pytest.mark.parametrize('appended_rows', [0, 100])
+def test_mid_file_rewrite_rebuilds_instead_of_appending(tmp_path, book_csv, appended_rows):
+    header, lines = split_csv(book_csv)
+    path = str(tmp_path / 'EDIT_2025-05-02.csv')
+    with open(path, 'wb') as f:
+        f.write(header + b''.join(lines[:1500]))
+    before = float(load_book(path).ask_prices[1000, 0])
+
+    # Far from both ends of the parsed region, and with the same size unless rows are appended
+    old = f'{before:.2f}'.encode()
+    rewrite_price(path, 1000, old, f'{before + 0.04:.2f}'.encode())
+    if appended_rows:
+        with open(path, 'ab') as f:
+            f.write(b''.join(lines[1500:1500 + appended_rows]))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+
+    book = load_book(path)
+    assert len(book.bid_top) == 1500 + appended_rows
+    assert book.ask_prices[1000, 0] == pytest.approx(before + 0.04)
+    expected = frame_book_arrays(pd.read_csv(path))
+    for cached, parsed in zip(book, expected):
+        np.testing.assert_array_equal(np.asarray(cached, dtype=float), parsed)
+
+
+def test_loads_during_appends_see_one_consistent_version(tmp_path, book_csv):
+    header, lines = split_csv(book_csv)
+    reference = load_depth_index(book_csv)
+    growing = str(tmp_path / 'GROW_2025-05-02.csv')
+    with open(growing, 'wb') as f:
+        f.write(header + b''.join(lines[:100]))
+    load_book(growing)
+
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                book = load_book(growing)
+                index = load_depth_index(growing)
+                for arrays in (book, index):
+                    assert len({len(column) for column in arrays}) == 1
+                rows = len(index.timestamps)
+                np.testing.assert_array_equal(index.timestamps, reference.timestamps[:rows])
+                np.testing.assert_array_equal(index.cum_size, reference.cum_size[:rows])
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        # Every append is picked up by whichever load sees the new file first
+        for start in range(100, len(lines), 100):
+            with open(growing, 'ab') as f:
+                f.write(b''.join(lines[start:start + 100]))
+            load_book(growing)
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+    assert not errors, errors[0]
+    assert len(load_book(growing).bid_top) == len(lines)
+
+
+def test_failed_append_closes_the_previous_arrays(tmp_path, book_csv, monkeypatch):
+    header, lines = split_csv(book_csv)
+    path = str(tmp_path / 'GROW_2025-05-02.csv')
+    with open(path, 'wb') as f:
+        f.write(header + b''.join(lines[:500]))
+    load_book(path)
+    with open(path, 'ab') as f:
+        f.write(b''.join(lines[500:600]))
+
+    def fail(source, destination, length):
+        raise OSError('disk full')
+
+    opened = []
+    real_open = open
+
+    def tracked_open(*args, **kwargs):
+        opened.append(real_open(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(book_cache.shutil, 'copyfileobj', fail)
+    monkeypatch.setattr('builtins.open', tracked_open)
+    with pytest.raises(OSError, match='disk full'):
+        load_book(path)
+    monkeypatch.undo()
+    assert opened and all(f.closed for f in opened)
+    assert not [entry for entry in os.listdir(cache_dir_for(path)) if entry.startswith('tmp-')]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import bootstrap
+from bootstrap import batched_power_law_fit, bootstrap_power_law, snapshot_bin_sums
+from slippage_model import fit_impact_models
+
+
+def binned_problem(rng, bins=12):
+    x = np.geomspace(10, 5_000, bins) * rng.uniform(0.9, 1.1, bins)
+    y = rng.uniform(1e-5, 1e-3) * x ** rng.uniform(0.3, 1.2) * rng.lognormal(0, 0.1, bins)
+    return x, y, rng.integers(1, 50, bins).astype(float)
+
+
+def cost(x, y, w, a, b):
+    return np.sum(w * (y - a * x ** b) ** 2)
+
+
+def test_batched_fit_matches_curve_fit():
+    rng = np.random.default_rng(7)
+    problems = [binned_problem(rng) for _ in range(20)]
+    a, b, converged = batched_power_law_fit(*(np.array(column) for column in zip(*problems)))
+    assert converged.all()
+    for (x, y, w), a_i, b_i in zip(problems, a, b):
+        expected = fit_impact_models(x, y, w, binned=True)['popt_power']
+        # curve_fit stops at a looser tolerance, so the batched fit is at least as good
+        assert cost(x, y, w, a_i, b_i) <= cost(x, y, w, *expected) * (1 + 1e-9)
+        np.testing.assert_allclose([a_i, b_i], expected, rtol=1e-4)
+
+
+def test_batched_fit_ignores_unweighted_bins():
+    rng = np.random.default_rng(8)
+    x, y, w = binned_problem(rng)
+    w_padded = np.where(np.arange(len(w)) % 3 == 0, 0.0, w)
+    # Rows with a single weighted bin cannot be fitted
+    single = np.zeros_like(w)
+    single[4] = 5
+    a, b, converged = batched_power_law_fit(np.array([x, x]), np.array([y, y]), np.array([w_padded, single]))
+    used = w_padded > 0
+    expected = fit_impact_models(x[used], y[used], w[used], binned=True)['popt_power']
+    np.testing.assert_allclose([a[0], b[0]], expected, rtol=1e-4)
+    assert np.isnan(a[1]) and np.isnan(b[1]) and not converged[1]
+
+
+def snapshot_points(rng, snapshots=200, per_snapshot=15):
+    rows = np.repeat(np.arange(snapshots), per_snapshot)
+    order_sizes = rng.uniform(10, 5_000, len(rows))
+    slippage = 2e-4 * order_sizes ** 0.6 * rng.lognormal(0, 0.2, len(rows))
+    return order_sizes, slippage, rows
+
+
+def test_snapshot_bin_sums_add_up_to_the_pooled_bins():
+    order_sizes, slippage, rows = snapshot_points(np.random.default_rng(9))
+    counts, sum_x, sum_y = snapshot_bin_sums(order_sizes, slippage, rows)
+    assert counts.shape[0] == 200
+    assert counts.sum() == len(order_sizes)
+    assert sum_x.sum() == pytest.approx(order_sizes.sum())
+    assert sum_y.sum() == pytest.approx(slippage.sum())
+
+
+def test_bootstrap_replicates_are_reproducible_and_centered(monkeypatch):
+    order_sizes, slippage, rows = snapshot_points(np.random.default_rng(10))
+    a, b, converged = bootstrap_power_law(order_sizes, slippage, rows, replicates=300, seed=4)
+    assert len(a) == 300 and converged.all()
+    again = bootstrap_power_law(order_sizes, slippage, rows, replicates=300, seed=4)
+    np.testing.assert_array_equal(a, again[0])
+
+    estimate = fit_impact_models(order_sizes, slippage)['popt_power']
+    assert np.quantile(a, 0.025) < estimate[0] < np.quantile(a, 0.975)
+    assert np.quantile(b, 0.025) < estimate[1] < np.quantile(b, 0.975)
+
+    # Smaller batches refit the same replicates
+    monkeypatch.setattr(bootstrap, 'MAX_BATCH_CELLS', 200 * 7)
+    batched = bootstrap_power_law(order_sizes, slippage, rows, replicates=300, seed=4)
+    np.testing.assert_allclose(batched[0], a, rtol=1e-6)
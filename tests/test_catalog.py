@@ -0,0 +1,133 @@
+import json
+import os
+
+import pytest
+
+import catalog
+from catalog import INDEX_FILE_NAME, DataCatalog, parse_file_date, scan_file
+from synthetic_book import write_book
+
+
+@pytest.mark.parametrize('ticker, file_name, date', [
+    ('AAPL', 'AAPL_2025-05-02 00_00_00+00_00.csv', '2025-05-02'),
+    ('AAPL', 'AAPL_2025-05-02.csv', '2025-05-02'),
+    ('AA', 'AA_2024-12-31_extended.csv', '2024-12-31'),
+    ('AA', 'AAPL_2025-05-02.csv', None),
+    ('AAPL', 'AAPL_2025-05-02.csv.gz', None),
+    ('AAPL', 'AAPL_20250502.csv', None),
+    ('AAPL', 'AAPL_notes_2025-05-02.csv', None),
+    ('AAPL', 'MSFT_2025-05-02.csv', None),
+])
+def test_parse_file_date(ticker, file_name, date):
+    assert parse_file_date(ticker, file_name) == date
+
+
+def test_scan_file_counts_rows_and_reads_the_time_range(tmp_path):
+    path = write_book(str(tmp_path / 'AAA_2025-05-02.csv'), 300, seed=1)
+    meta = scan_file(path)
+    assert meta['rows'] == 300 and meta['bytes'] == os.path.getsize(path)
+    assert meta['start'].startswith('2025-05-02T13:30:00') and meta['start'] < meta['end']
+
+    # A missing final line break still counts the last row
+    with open(path, 'rb+') as f:
+        f.truncate(os.path.getsize(path) - 1)
+    assert scan_file(path)['rows'] == 300
+
+    with open(path, 'w') as f:
+        f.write('ts_event,bid_px_00\n')
+    meta = scan_file(path)
+    assert (meta['rows'], meta['start'], meta['end']) == (0, None, None)
+
+
+@pytest.fixture
+def root(tmp_path):
+    for ticker, date in (('AAA', '2025-05-01'), ('AAA', '2025-05-02'), ('BBB', '2025-05-02')):
+        write_book(str(tmp_path / ticker / f'{ticker}_{date}.csv'), 100, seed=len(date))
+    (tmp_path / 'AAA' / 'README.txt').write_text('not data')
+    return tmp_path
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    scanned = []
+    def counting_scan(path):
+        scanned.append(os.path.basename(path))
+        return scan_file(path)
+    monkeypatch.setattr(catalog, 'scan_file', counting_scan)
+    return scanned
+
+
+def touch_directory(path, step):
+    """Moves a directory's mtime forward, as adding or removing a file does on a coarse-grained clock."""
+    mtime = os.stat(path).st_mtime_ns + step * 10**9
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_refresh_rescans_only_changed_directories_and_files(root, scans):
+    data = DataCatalog(str(root), refresh_interval=0, persist=False)
+    assert [(entry['symbol'], entry['latest_date']) for entry in data.tickers()] == [('AAA', '2025-05-02'),
+                                                                                    ('BBB', '2025-05-02')]
+    assert sorted(scans) == ['AAA_2025-05-01.csv', 'AAA_2025-05-02.csv', 'BBB_2025-05-02.csv']
+    assert data.resolve('AAA')['path'] == str(root / 'AAA' / 'AAA_2025-05-02.csv')
+    assert data.resolve('AAA', '2025-05-01')['rows'] == 100
+    assert data.resolve('AAA', '2025-04-30') is None and data.resolve('ZZZ') is None
+
+    # Nothing changed: no directory is listed and no file scanned
+    scans.clear()
+    assert not data.refresh(force=True) and scans == []
+
+    # A grown file is picked up once its directory's mtime moves
+    write_book(str(root / 'AAA' / 'AAA_2025-05-01.csv'), 150, seed=3)
+    write_book(str(root / 'AAA' / 'AAA_2025-05-03.csv'), 50, seed=4)
+    touch_directory(root / 'AAA', 1)
+    assert data.refresh(force=True)
+    assert sorted(scans) == ['AAA_2025-05-01.csv', 'AAA_2025-05-03.csv']
+    assert data.resolve('AAA')['date'] == '2025-05-03'
+    assert data.resolve('AAA', '2025-05-01')['rows'] == 150
+
+    # Removed tickers disappear
+    for name in os.listdir(root / 'BBB'):
+        os.remove(root / 'BBB' / name)
+    os.rmdir(root / 'BBB')
+    touch_directory(root, 1)
+    assert data.refresh(force=True)
+    assert [entry['symbol'] for entry in data.tickers()] == ['AAA']
+
+
+def test_refresh_interval_limits_filesystem_checks(root, scans):
+    data = DataCatalog(str(root), refresh_interval=3600, persist=False)
+    assert data.resolve('AAA')['date'] == '2025-05-02'
+    write_book(str(root / 'AAA' / 'AAA_2025-05-03.csv'), 50)
+    touch_directory(root / 'AAA', 1)
+    assert data.resolve('AAA')['date'] == '2025-05-02'
+    assert data.refresh(force=True) and data.resolve('AAA')['date'] == '2025-05-03'
+
+
+def test_index_persists_file_metadata_across_restarts(root, scans):
+    first = DataCatalog(str(root), refresh_interval=0)
+    tickers = first.tickers()
+    with open(root / INDEX_FILE_NAME) as f:
+        index = json.load(f)
+    assert index['version'] == catalog.INDEX_VERSION
+    assert {ticker: sorted(dates) for ticker, dates in index['tickers'].items()} == {
+        'AAA': ['2025-05-01', '2025-05-02'], 'BBB': ['2025-05-02']}
+
+    # A new catalog lists the directories again but reuses the metadata of unchanged files
+    scans.clear()
+    os.utime(root / 'BBB' / 'BBB_2025-05-02.csv', ns=(0, 10**18))
+    second = DataCatalog(str(root), refresh_interval=0)
+    assert second.tickers()[0] == tickers[0]
+    assert scans == ['BBB_2025-05-02.csv']
+    with open(root / INDEX_FILE_NAME) as f:
+        assert json.load(f)['tickers']['BBB']['2025-05-02']['mtime_ns'] == 10**18
+
+    # An unreadable index is ignored and everything is rescanned
+    (root / INDEX_FILE_NAME).write_text('{not json')
+    scans.clear()
+    assert DataCatalog(str(root), refresh_interval=0).tickers() == second.tickers()
+    assert len(scans) == 3
+
+    # Without persistence nothing is written
+    os.remove(root / INDEX_FILE_NAME)
+    DataCatalog(str(root), refresh_interval=0, persist=False).tickers()
+    assert not os.path.exists(root / INDEX_FILE_NAME)
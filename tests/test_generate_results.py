@@ -0,0 +1,100 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import generate_results
+from generate_results import SHARD_DIR_NAME, file_sha256, run_batch
+from synthetic_book import write_book
+
+PARAMS = {'sample_rows': 300, 'sampling': 'head', 'stride': 10, 'seed': 0}
+INPUTS = [('AAA', '2025-05-01'), ('AAA', '2025-05-02'), ('BBB', '2025-05-02')]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for seed, (ticker, date) in enumerate(INPUTS):
+        write_book(str(tmp_path / 'Data' / ticker / f'{ticker}_{date}.csv'), 400, seed=seed)
+    return tmp_path / 'Data'
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    """Runs the batch on threads and records every input that was actually fitted."""
+    fitted = []
+    process = generate_results.process_ticker_data
+    def recording_process(file_path, **params):
+        fitted.append(os.path.basename(file_path))
+        return process(file_path, **params)
+    monkeypatch.setattr(generate_results, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(generate_results, 'process_ticker_data', recording_process)
+    return fitted
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_batch_skips_unchanged_inputs_and_merges_shards(tmp_path, data_dir, processed):
+    output = tmp_path / 'out'
+    assert run_batch(str(data_dir), str(output), params=PARAMS) == {'processed': 3, 'skipped': 0, 'failed': 0,
+                                                                   'removed': 0}
+    assert sorted(processed) == ['AAA_2025-05-01.csv', 'AAA_2025-05-02.csv', 'BBB_2025-05-02.csv']
+    manifest = read_json(output / SHARD_DIR_NAME / 'manifest.json')
+    for ticker, date in INPUTS:
+        entry = manifest['entries'][f'{ticker}/{date}']
+        assert entry['status'] == 'ok' and entry['params'] == PARAMS
+        assert entry['sha256'] == file_sha256(str(data_dir / ticker / f'{ticker}_{date}.csv'))
+    results = read_json(output / 'results.json')
+    # Latest date first within each ticker, each result identical to its shard
+    assert [(result['ticker'], result['date']) for result in results] == [
+        ('AAA', '2025-05-02'), ('AAA', '2025-05-01'), ('BBB', '2025-05-02')]
+    assert results[1] == read_json(output / SHARD_DIR_NAME / 'AAA' / 'AAA_2025-05-01.json')
+
+    # Nothing changed: nothing is hashed or fitted
+    processed.clear()
+    assert run_batch(str(data_dir), str(output), params=PARAMS)['skipped'] == 3
+    assert processed == [] and read_json(output / 'results.json') == results
+
+    # A new mtime with the same content is recognized by its SHA-256 and not refitted
+    path = data_dir / 'AAA' / 'AAA_2025-05-01.csv'
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    assert run_batch(str(data_dir), str(output), params=PARAMS)['skipped'] == 3
+    assert processed == []
+    entry = read_json(output / SHARD_DIR_NAME / 'manifest.json')['entries']['AAA/2025-05-01']
+    assert entry['mtime_ns'] == os.stat(path).st_mtime_ns
+    # ... and the next run skips it on size and mtime alone
+    run_batch(str(data_dir), str(output), params=PARAMS)
+
+    # Edited content is refitted, and only its entry of results.json changes
+    write_book(str(path), 400, seed=9)
+    assert run_batch(str(data_dir), str(output), params=PARAMS) == {'processed': 1, 'skipped': 2, 'failed': 0,
+                                                                   'removed': 0}
+    assert processed == ['AAA_2025-05-01.csv']
+    edited = read_json(output / 'results.json')
+    assert edited[0] == results[0] and edited[2] == results[2]
+    assert edited[1]['model_params'] != results[1]['model_params']
+    assert read_json(output / SHARD_DIR_NAME / 'manifest.json')['entries']['AAA/2025-05-01']['sha256'] == \
+        file_sha256(str(path))
+
+
+def test_batch_reruns_on_new_parameters_and_drops_removed_inputs(tmp_path, data_dir, processed):
+    output = tmp_path / 'out'
+    run_batch(str(data_dir), str(output), params=PARAMS)
+
+    # Restricting the run leaves the other inputs and their shards alone
+    processed.clear()
+    summary = run_batch(str(data_dir), str(output), params={**PARAMS, 'sample_rows': 200}, tickers=['BBB'])
+    assert summary == {'processed': 1, 'skipped': 0, 'failed': 0, 'removed': 0}
+    assert processed == ['BBB_2025-05-02.csv']
+    assert len(read_json(output / 'results.json')) == 3
+
+    os.remove(data_dir / 'AAA' / 'AAA_2025-05-02.csv')
+    processed.clear()
+    summary = run_batch(str(data_dir), str(output), params=PARAMS, force=True)
+    assert summary == {'processed': 2, 'skipped': 0, 'failed': 0, 'removed': 1}
+    assert not os.path.exists(output / SHARD_DIR_NAME / 'AAA' / 'AAA_2025-05-02.json')
+    assert [(result['ticker'], result['date']) for result in read_json(output / 'results.json')] == [
+        ('AAA', '2025-05-01'), ('BBB', '2025-05-02')]
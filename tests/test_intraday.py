@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from book_cache import load_timestamped_book
+from intraday import BucketedImpactModel
+from order_book import OrderBook
+from synthetic_book import write_book
+
+
+@pytest.fixture
+def timestamped_book(tmp_path):
+    return load_timestamped_book(write_book(str(tmp_path / 'TEST_2025-05-02.csv'), 3000, seed=5))
+
+
+def prefix(book, rows):
+    return OrderBook(*(column[:rows] for column in book))
+
+
+def test_incremental_updates_match_one_pass(timestamped_book):
+    book, timestamps = timestamped_book
+    whole = BucketedImpactModel(bucket_minutes=0.25, order_size_points=10)
+    whole.update(book, timestamps)
+    whole.refit()
+
+    incremental = BucketedImpactModel(bucket_minutes=0.25, order_size_points=10)
+    for rows in (700, 701, 1900, len(timestamps)):
+        assert incremental.extends(timestamps[:rows])
+        previous = incremental.rows
+        assert incremental.update(prefix(book, rows), timestamps[:rows], chunk_rows=256) == rows - previous
+        incremental.refit()
+
+    assert len(whole.buckets()) > 1
+    assert incremental.rows == whole.rows == len(timestamps)
+    np.testing.assert_array_equal(incremental.counts, whole.counts)
+    np.testing.assert_array_equal(incremental.snapshots, whole.snapshots)
+    np.testing.assert_allclose(incremental.sum_y, whole.sum_y, rtol=1e-12)
+    np.testing.assert_allclose(incremental.params, whole.params, rtol=1e-9)
+
+
+def test_rewritten_rows_are_not_an_extension(timestamped_book):
+    book, timestamps = timestamped_book
+    model = BucketedImpactModel(bucket_minutes=0.25, order_size_points=10)
+    model.update(prefix(book, 1000), timestamps[:1000])
+    assert not model.extends(timestamps[1:])
+    assert not model.extends(timestamps[:999])
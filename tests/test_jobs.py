@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager, QueueFull
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def reporting(started, release=None):
+    """A job that reports progress until `release` is set, swallowing ordinary errors as analysis code may."""
+    def run(job):
+        started.set()
+        steps = 0
+        while release is None or not release.is_set():
+            try:
+                job.report(steps=steps)
+            except Exception:
+                pass
+            steps += 1
+            time.sleep(0.01)
+        return steps
+    return run
+
+
+@pytest.fixture
+def manager():
+    return JobManager(workers=1, ttl=60, max_pending=3)
+
+
+def test_running_job_is_cancelled_at_its_next_report(manager):
+    started = threading.Event()
+    job = manager.submit('analyze', reporting(started))
+    started.wait(10)
+    job.cancel()
+    wait_until(lambda: job.done)
+    assert job.snapshot()['status'] == 'cancelled'
+    assert job.result is None and job.snapshot()['progress']['steps'] >= 0
+
+
+def test_queued_job_is_cancelled_without_running(manager):
+    started, release = threading.Event(), threading.Event()
+    running = manager.submit('analyze', reporting(started, release))
+    queued = manager.submit('analyze', lambda job: pytest.fail('cancelled job ran'))
+    started.wait(10)
+    queued.cancel()
+    assert queued.snapshot()['status'] == 'cancelled'
+    release.set()
+    wait_until(lambda: running.done)
+    assert running.snapshot()['status'] == 'succeeded'
+    assert queued.started is None
+
+
+def test_unfinished_jobs_are_bounded_and_removal_cancels(manager):
+    started = threading.Event()
+    jobs = [manager.submit('analyze', reporting(started)) for _ in range(3)]
+    with pytest.raises(QueueFull):
+        manager.submit('analyze', lambda job: None)
+    started.wait(10)
+    for job in jobs:
+        assert manager.remove(job.id) is job
+    wait_until(lambda: all(job.done for job in jobs))
+    assert all(job.snapshot()['status'] == 'cancelled' for job in jobs)
+    assert manager.get(jobs[0].id) is None
+    assert manager.submit('analyze', lambda job: 1) is not None
+
+
+def test_failed_and_expired_jobs(manager):
+    failed = manager.submit('analyze', lambda job: 1 / 0)
+    wait_until(lambda: failed.done)
+    assert failed.snapshot()['status'] == 'failed' and 'division' in failed.snapshot()['error']
+    manager.ttl = 0
+    failed.finished -= 1
+    assert manager.get(failed.id) is None
@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+
+from order_book import (MISSING_TIMESTAMP, OrderBook, compute_slippage_points, cumulative_depth, fill_prices,
+                        levels_filled, side_slippage_points, snapshot_rows, walk_book)
+from slippage_model import calculate_slippage
+
+
+def scalar_slippage(order_sizes, prices, sizes, mid_prices):
+    """`calculate_slippage` for every (row, order size) pair, with missing levels dropped as the row loop did."""
+    result = np.zeros(order_sizes.shape)
+    for row in range(len(prices)):
+        row_prices = [price for price in prices[row] if not np.isnan(price)]
+        row_sizes = [size for size in sizes[row] if not np.isnan(size)]
+        for k, order_size in enumerate(order_sizes[row]):
+            result[row, k] = calculate_slippage(order_size, row_prices, row_sizes, mid_prices[row])
+    return result
+
+
+@pytest.fixture
+def book():
+    rng = np.random.default_rng(7)
+    rows, levels = 200, 10
+    prices = 100 + np.cumsum(rng.uniform(0.01, 0.05, (rows, levels)), axis=1)
+    sizes = rng.integers(1, 2000, (rows, levels)).astype(float)
+    # Missing levels anywhere in the ladder, on either the price or the size
+    prices[rng.random((rows, levels)) < 0.1] = np.nan
+    sizes[rng.random((rows, levels)) < 0.1] = np.nan
+    mid_prices = prices[:, 0] - 0.01
+    mid_prices[np.isnan(mid_prices)] = 100.0
+    return prices, sizes, mid_prices
+
+
+def test_walk_book_matches_calculate_slippage(book):
+    prices, sizes, mid_prices = book
+    depth = np.nansum(sizes, axis=1)
+    # From one share to twice the visible depth, so some orders exhaust the book
+    order_sizes = np.linspace(1, 2 * depth, 25, axis=1)
+    expected = scalar_slippage(order_sizes, prices, sizes, mid_prices)
+    np.testing.assert_allclose(walk_book(order_sizes, prices, sizes, mid_prices), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_walk_book_zero_order_size(book):
+    prices, sizes, mid_prices = book
+    order_sizes = np.zeros((len(prices), 3))
+    assert not walk_book(order_sizes, prices, sizes, mid_prices).any()
+
+
+def test_walk_book_all_levels_missing():
+    prices = np.full((1, 10), np.nan)
+    sizes = np.full((1, 10), np.nan)
+    slippage = walk_book(np.array([[5.0]]), prices, sizes, np.array([100.0]))
+    assert slippage[0, 0] == calculate_slippage(5.0, [], [], 100.0)
+
+
+@pytest.mark.parametrize('levels', [1, 2, 3, 10, 16, 17])
+def test_levels_filled_matches_linear_count(levels):
+    rng = np.random.default_rng(levels)
+    cum_size = np.cumsum(rng.integers(0, 3, (300, levels)), axis=1).astype(float)
+    order_sizes = rng.integers(0, 2 * levels + 2, (300, 6)).astype(float)
+    expected = (cum_size[:, None, :] <= order_sizes[:, :, None]).sum(axis=2)
+    np.testing.assert_array_equal(levels_filled(cum_size, order_sizes), expected)
+
+
+def test_cumulative_depth_pairs_levels_positionally():
+    prices = np.array([[10.0, np.nan, 12.0]])
+    sizes = np.array([[1.0, 2.0, np.nan]])
+    level_prices, cum_size, cum_notional = cumulative_depth(prices, sizes)
+    np.testing.assert_array_equal(level_prices, [[10.0, 12.0, 0.0]])
+    np.testing.assert_array_equal(cum_size, [[1.0, 3.0, 3.0]])
+    np.testing.assert_array_equal(cum_notional, [[10.0, 34.0, 34.0]])
+
+
+def test_fill_prices_match_the_scalar_walk(book):
+    prices, sizes, mid_prices = book
+    index = cumulative_depth(prices, sizes)
+    # Up to the usable depth, where the last price/size pair is consumed
+    order_sizes = np.linspace(1, index[1][:, -1], 15, axis=1)
+    avg_price = fill_prices(order_sizes, *index)
+    expected = scalar_slippage(order_sizes, prices, sizes, mid_prices) + mid_prices[:, None]
+    np.testing.assert_allclose(avg_price, expected, rtol=1e-12)
+
+
+def test_fill_prices_at_level_boundaries_and_beyond_the_book(book):
+    prices, sizes, _ = book
+    level_prices, cum_size, cum_notional = cumulative_depth(prices, sizes)
+    # Orders that exactly consume the first levels pay their volume-weighted price
+    boundaries = cum_size[:, :3]
+    np.testing.assert_allclose(fill_prices(boundaries, level_prices, cum_size, cum_notional),
+                               cum_notional[:, :3] / boundaries, rtol=1e-12)
+    # Shared order sizes, with sizes that are not positive or exceed the depth giving NaN
+    shared = np.array([0.0, -5.0, 1.0, cum_size[:, -1].max() + 1])
+    avg_price = fill_prices(shared, level_prices, cum_size, cum_notional)
+    assert avg_price.shape == (len(prices), 4)
+    assert np.isnan(avg_price[:, [0, 1, 3]]).all()
+    np.testing.assert_array_equal(avg_price[:, 2], level_prices[:, 0])
+
+
+def test_snapshot_rows_selects_by_time():
+    timestamps = np.array([30, 10, MISSING_TIMESTAMP, 20, 20, 50], dtype=np.int64)
+    np.testing.assert_array_equal(snapshot_rows(timestamps), [1, 3, 4, 0, 5])
+    np.testing.assert_array_equal(snapshot_rows(timestamps, start=20, end=30), [3, 4, 0])
+    np.testing.assert_array_equal(snapshot_rows(timestamps, start=31, end=49), [])
+    # The last snapshot at or before each time; -1 before the first one
+    np.testing.assert_array_equal(snapshot_rows(timestamps, at=np.array([5, 10, 25, 35, 50, 99])),
+                                  [-1, 1, 4, 0, 5, 5])
+
+
+def test_snapshot_rows_of_an_empty_book():
+    timestamps = np.array([MISSING_TIMESTAMP], dtype=np.int64)
+    np.testing.assert_array_equal(snapshot_rows(timestamps[:0], at=np.array([1, 2])), [-1, -1])
+    np.testing.assert_array_equal(snapshot_rows(timestamps, at=np.array([1])), [-1])
+    np.testing.assert_array_equal(snapshot_rows(timestamps, start=0), [])
+
+
+def two_sided_book(rows=300, levels=10, seed=11):
+    """A random book with missing levels on both sides and some snapshots without a top of book."""
+    rng = np.random.default_rng(seed)
+    ask_prices = 100.02 + np.cumsum(rng.uniform(0.01, 0.05, (rows, levels)), axis=1)
+    bid_prices = 99.98 - np.cumsum(rng.uniform(0.01, 0.05, (rows, levels)), axis=1)
+    ask_sizes, bid_sizes = rng.integers(1, 2000, (2, rows, levels)).astype(float)
+    for ladder in (ask_prices, bid_prices, ask_sizes, bid_sizes):
+        ladder[rng.random((rows, levels)) < 0.1] = np.nan
+    bid_top, ask_top = bid_prices[:, 0].copy(), ask_prices[:, 0].copy()
+    bid_top[:5] = np.nan
+    bid_sizes[10:15] = np.nan
+    return OrderBook(bid_top, ask_top, ask_prices, ask_sizes, bid_prices, bid_sizes)
+
+
+def mirrored(book):
+    """
+    The book reflected about a price of zero: bids become asks at minus their price and vice versa.
+    Negation is exact, so every walk of the mirrored book rounds exactly like the original.
+    """
+    return OrderBook(-book.ask_top, -book.bid_top, -book.bid_prices, book.bid_sizes, -book.ask_prices, book.ask_sizes)
+
+
+def test_sell_slippage_walks_the_bids():
+    book = two_sided_book()
+    # Up to the whole visible depth, which exceeds the usable depth where prices and sizes go missing apart
+    sizes, slippage, rows = compute_slippage_points(book, 10, 1.0, return_rows=True, side='sell')
+    mid_prices = (book.bid_top + book.ask_top) / 2
+    # Receiving below the mid on the bid ladder, as the scalar walk prices it
+    expected = -scalar_slippage(sizes[:, None], book.bid_prices[rows], book.bid_sizes[rows], mid_prices[rows])[:, 0]
+    np.testing.assert_allclose(slippage, expected, rtol=1e-9)
+    assert np.all(slippage > 0)
+    # No fill averages below the lowest bid, so orders beyond the usable depth are left out
+    level_prices, cum_size, _ = cumulative_depth(book.bid_prices[rows], book.bid_sizes[rows])
+    assert np.all(sizes <= cum_size[:, -1])
+    assert np.all(slippage <= mid_prices[rows] - np.nanmin(book.bid_prices[rows], axis=1))
+    assert not np.isin(rows, np.r_[0:5, 10:15]).any()
+
+
+@pytest.mark.parametrize('sides', [('sell',), ('buy', 'sell'), ('sell', 'buy')])
+def test_sell_side_equals_buy_side_of_the_mirrored_book(sides):
+    book = two_sided_book()
+    points = side_slippage_points(book, sides, 12, 0.8, return_rows=True)
+    mirror_buy = compute_slippage_points(mirrored(book), 12, 0.8, return_rows=True)
+    for sell, reflected in zip(points['sell'], mirror_buy):
+        np.testing.assert_array_equal(sell, reflected)
+    if 'buy' in sides:
+        for own, alone in zip(points['buy'], compute_slippage_points(book, 12, 0.8, return_rows=True)):
+            np.testing.assert_array_equal(own, alone)
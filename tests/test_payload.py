@@ -0,0 +1,78 @@
+import base64
+
+import numpy as np
+import pytest
+
+from payload import binned_summary, encode_slippage_data, lttb
+from streaming import BIN_EDGES
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(1)
+    order_sizes = rng.uniform(1, 10_000, 500)
+    return order_sizes, 1e-4 * order_sizes ** 0.6 + rng.normal(0, 1e-3, 500)
+
+
+@pytest.mark.parametrize('max_points', [3, 4, 10, 499])
+def test_lttb_keeps_endpoints_within_the_budget(points, max_points):
+    x, y = points
+    sampled_x, sampled_y = lttb(x, y, max_points)
+    assert len(sampled_x) == max_points
+    order = np.argsort(x)
+    assert (sampled_x[0], sampled_y[0]) == (x[order[0]], y[order[0]])
+    assert (sampled_x[-1], sampled_y[-1]) == (x[order[-1]], y[order[-1]])
+    assert np.all(np.diff(sampled_x) > 0)
+    # Every selected point is one of the input points
+    rows = np.searchsorted(x[order], sampled_x)
+    np.testing.assert_array_equal(y[order][rows], sampled_y)
+
+
+@pytest.mark.parametrize('max_points', [500, 501, 10_000])
+def test_lttb_returns_short_series_whole_and_sorted(points, max_points):
+    x, y = points
+    sampled_x, sampled_y = lttb(x, y, max_points)
+    order = np.argsort(x)
+    np.testing.assert_array_equal(sampled_x, x[order])
+    np.testing.assert_array_equal(sampled_y, y[order])
+
+
+def test_lttb_keeps_a_spike_and_rejects_tiny_budgets():
+    x = np.arange(10, dtype=float)
+    y = np.zeros(10)
+    y[6] = 5.0
+    sampled_x, sampled_y = lttb(x, y, 3)
+    np.testing.assert_array_equal(sampled_x, [0, 6, 9])
+    np.testing.assert_array_equal(sampled_y, [0, 5, 0])
+    for max_points in (0, 1, 2):
+        with pytest.raises(ValueError):
+            lttb(x, y, max_points)
+
+
+def test_binned_summary_matches_a_per_bin_loop(points):
+    x, y = points
+    summary = binned_summary(x, y)
+    bins = np.searchsorted(BIN_EDGES, x, side='right')
+    distinct = np.unique(bins)
+    assert summary['count'] == [int((bins == b).sum()) for b in distinct]
+    assert sum(summary['count']) == len(x)
+    for i, b in enumerate(distinct):
+        in_bin = bins == b
+        assert summary['order_size'][i] == pytest.approx(x[in_bin].mean())
+        assert summary['slippage'][i] == pytest.approx(y[in_bin].mean())
+        for q in (10, 50, 90):
+            assert summary[f'p{q}'][i] == pytest.approx(np.quantile(y[in_bin], q / 100))
+
+
+def test_binned_summary_of_no_points():
+    summary = binned_summary(np.array([]), np.array([]))
+    assert summary == {'order_size': [], 'slippage': [], 'count': [], 'p10': [], 'p50': [], 'p90': []}
+
+
+def test_base64_round_trips_as_float32(points):
+    x, y = points
+    encoded = encode_slippage_data(x, y, 'base64')
+    assert encoded['length'] == len(x)
+    for name, values in (('order_size', x), ('slippage', y)):
+        decoded = np.frombuffer(base64.b64decode(encoded[name]), dtype='<f4')
+        np.testing.assert_array_equal(decoded, values.astype(np.float32))
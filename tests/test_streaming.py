@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from book_cache import load_book
+from order_book import OrderBook
+from streaming import SAMPLING_MODES, head_sample, reservoir_sample, sample_sides, stride_sample
+from synthetic_book import write_book
+
+
+def numbered_book(rows):
+    """A book whose every column holds the row number, so sampled rows can be identified."""
+    numbers = np.arange(rows, dtype=float)
+    ladder = np.repeat(numbers[:, None], 3, axis=1)
+    return OrderBook(numbers, numbers, ladder, ladder, ladder, ladder)
+
+
+def chunked(book, chunk_rows):
+    rows = len(book.bid_top)
+    return [OrderBook(*(column[start:start + chunk_rows] for column in book)) for start in range(0, rows, chunk_rows)]
+
+
+def sampled_rows(chunks):
+    chunks = [chunk for chunk in chunks if chunk is not None]
+    return np.concatenate([chunk.bid_top for chunk in chunks]).astype(int) if chunks else np.array([], dtype=int)
+
+
+def sequential_reservoir(rows, size, seed):
+    """Textbook Algorithm R, one row and one draw at a time."""
+    rng = np.random.default_rng(seed)
+    reservoir = []
+    for i in range(rows):
+        if i < size:
+            reservoir.append(i)
+        else:
+            j = rng.integers(0, i + 1)
+            if j < size:
+                reservoir[j] = i
+    return sorted(reservoir)
+
+
+@pytest.mark.parametrize('rows, size', [(1000, 50), (1000, 1), (30, 50), (50, 50)])
+@pytest.mark.parametrize('chunk_rows', [1, 7, 64, 1000])
+def test_reservoir_sample_matches_sequential_algorithm_r(rows, size, chunk_rows):
+    for seed in (0, 3):
+        sample = reservoir_sample(chunked(numbered_book(rows), chunk_rows), size, seed)
+        expected = sequential_reservoir(rows, size, seed)
+        np.testing.assert_array_equal(sample.bid_top.astype(int), expected)
+        for column in sample:
+            np.testing.assert_array_equal(column.reshape(len(expected), -1)[:, 0], expected)
+
+
+def test_reservoir_sample_of_no_rows():
+    assert reservoir_sample(iter([]), 10) is None
+
+
+@pytest.mark.parametrize('stride', [1, 3, 10, 2000])
+def test_stride_sample_ignores_chunk_boundaries(stride):
+    book = numbered_book(1000)
+    expected = np.arange(0, 1000, stride)
+    for chunk_rows in (1, 7, 10, 64, 1000):
+        np.testing.assert_array_equal(sampled_rows(stride_sample(chunked(book, chunk_rows), stride)), expected)
+
+
+def test_head_sample_ignores_chunk_boundaries():
+    book = numbered_book(100)
+    for chunk_rows in (1, 7, 100):
+        for rows in (0, 1, 13, 100, 500):
+            np.testing.assert_array_equal(sampled_rows(head_sample(chunked(book, chunk_rows), rows)),
+                                          np.arange(min(rows, 100)))
+
+
+def mirrored(book):
+    """
+    The book reflected about a price of zero: bids become asks at minus their price and vice versa.
+    Negation is exact, so every walk of the mirrored book rounds exactly like the original.
+    """
+    return OrderBook(-book.ask_top, -book.bid_top, -book.bid_prices, book.bid_sizes, -book.ask_prices, book.ask_sizes)
+
+
+@pytest.mark.parametrize('sampling', SAMPLING_MODES)
+def test_sell_samples_equal_buy_samples_of_the_mirrored_book(tmp_path, sampling):
+    book = load_book(write_book(str(tmp_path / 'TEST_2025-05-02.csv'), 2000, seed=4), cache_dir=str(tmp_path))
+    options = {'sampling': sampling, 'sample_rows': 700, 'order_size_points': 15, 'stride': 3, 'seed': 2}
+    both = sample_sides(chunked(book, 256), ('buy', 'sell'), **options)
+    sell = sample_sides(chunked(book, 256), ('sell',), **options)['sell']
+    mirror = sample_sides(chunked(mirrored(book), 256), ('buy',), **options)['buy']
+    buy = sample_sides(chunked(book, 256), ('buy',), **options)['buy']
+
+    assert sell.snapshots == mirror.snapshots > 0 and len(sell.order_sizes) > 0
+    for sample in (sell, both['sell']):
+        for own, reflected in zip(sample, mirror):
+            np.testing.assert_array_equal(own, reflected)
+    for one_sided, two_sided in zip(buy, both['buy']):
+        np.testing.assert_array_equal(one_sided, two_sided)
+    # The bids are not the asks: selling is priced on its own ladder
+    assert not np.array_equal(buy.slippage, sell.slippage)
@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+from scipy.optimize import Bounds, minimize
+
+from trade_allocation import (marginal_cost_allocation, objective_function, objective_gradient,
+                              solve_portfolio_allocation, solve_trade_allocation, solve_trade_allocation_batch)
+
+
+def slsqp(total_shares, a, b):
+    constraints = {'type': 'eq', 'fun': lambda x: x.sum() - total_shares, 'jac': np.ones_like}
+    result = minimize(objective_function, np.full(len(a), total_shares / len(a)), args=((a, b),),
+                      jac=objective_gradient, method='SLSQP', bounds=Bounds(0, total_shares),
+                      constraints=constraints, options={'ftol': 1e-14, 'maxiter': 500})
+    assert result.success
+    return result.x
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_marginal_cost_allocation_matches_slsqp(seed):
+    rng = np.random.default_rng(seed)
+    a, b = rng.uniform(1e-6, 1e-4, 12), rng.uniform(0.3, 1.5, 12)
+    closed_form = marginal_cost_allocation(10_000, a, b)
+    numerical = slsqp(10_000, a, b)
+    assert closed_form.sum() == pytest.approx(10_000)
+    assert objective_function(closed_form, (a, b)) <= objective_function(numerical, (a, b)) * (1 + 1e-9)
+    np.testing.assert_allclose(closed_form, numerical, rtol=1e-3, atol=1e-3)
+
+
+def test_per_interval_parameters_use_the_closed_form(monkeypatch):
+    a, b = np.array([2e-5, 1e-5, 4e-5]), np.array([0.5, 0.8, 0.6])
+    expected = marginal_cost_allocation(5_000, a, b)
+    monkeypatch.setattr('trade_allocation.minimize', lambda *args, **kwargs: pytest.fail('SLSQP used'))
+    np.testing.assert_array_equal(solve_trade_allocation(5_000, 3, (a, b)), expected)
+    # Identical parameters in every interval are the scalar case
+    np.testing.assert_array_equal(solve_trade_allocation(5_000, 3, (np.full(3, 2e-5), np.full(3, 0.5))),
+                                  np.full(3, 5_000 / 3))
+
+
+def test_convex_problems_split_equally():
+    # Symmetric and convex, so the equal split satisfies the optimality conditions
+    allocation = solve_trade_allocation(10_000, 8, (3e-5, 0.7))
+    np.testing.assert_array_equal(allocation, np.full(8, 1_250.0))
+    numerical = slsqp(10_000, np.full(8, 3e-5), np.full(8, 0.7))
+    np.testing.assert_allclose(allocation, numerical, rtol=1e-6)
+
+
+def test_batch_matches_one_problem_at_a_time():
+    problems = [(10_000, 8, 3e-5, 0.7), (500, 3, 1e-4, -0.5), (2_000, 1, 2e-5, 1.1),
+                (7_500, 5, 1e-5, 0.0), (900, 4, -1e-5, 0.4)]
+    batch = solve_trade_allocation_batch(problems)
+    assert len(batch) == len(problems)
+    for allocation, (shares, intervals, a, b) in zip(batch, problems):
+        np.testing.assert_allclose(allocation, solve_trade_allocation(shares, intervals, (a, b)))
+    assert solve_trade_allocation_batch([]) == []
+
+
+BASKET = {'total_shares': np.array([6_000.0, 3_000.0, 9_000.0]),
+          'a': np.array([2e-5, 5e-5, 1e-5]), 'b': np.array([0.6, 0.9, 0.4])}
+PRICES = np.array([50.0, 120.0, 20.0])
+
+
+def portfolio_slsqp(total_shares, a, b, num_intervals, caps=np.inf, coupling=()):
+    """The joint allocation problem of `solve_portfolio_allocation`, solved with SLSQP over all variables."""
+    N, T = len(total_shares), num_intervals
+    # In units of each order's equal split, and of the equal split's cost
+    scale = total_shares[:, None] / T
+    unit = np.sum(a[:, None] * np.power(scale, (b + 1)[:, None])) * T
+
+    def cost(z):
+        return np.sum(a[:, None] * np.power(z.reshape(N, T) * scale, (b + 1)[:, None])) / unit
+
+    def gradient(z):
+        x = np.maximum(z.reshape(N, T) * scale, 1e-12)
+        return (a[:, None] * (b + 1)[:, None] * np.power(x, b[:, None]) * scale).ravel() / unit
+
+    constraints = [{'type': 'eq', 'fun': lambda z: z.reshape(N, T).sum(axis=1) - T}]
+    for weights, limits in coupling:
+        finite = np.isfinite(limits)
+        norm = np.mean(limits[finite])
+        jacobian = -(weights[:, None, None] * scale[:, :, None] * np.eye(T)[None]).transpose(2, 0, 1) / norm
+        constraints.append({'type': 'ineq',
+                            'fun': lambda z, w=weights, l=limits / norm, f=finite, n=norm:
+                                (l - w @ (z.reshape(N, T) * scale) / n)[f],
+                            'jac': lambda z, j=jacobian.reshape(T, N * T)[finite]: j})
+    upper = np.minimum(np.broadcast_to(caps, (N, T)) / scale, T).ravel()
+    result = minimize(cost, np.ones(N * T), jac=gradient, method='SLSQP', bounds=Bounds(0, upper),
+                      constraints=constraints, options={'ftol': 1e-12, 'maxiter': 1000})
+    assert result.success, result.message
+    return result.x.reshape(N, T) * scale
+
+
+@pytest.mark.parametrize('constraints', ['shares', 'cash', 'caps', 'all'])
+def test_portfolio_allocation_matches_slsqp(constraints):
+    T = 4
+    caps = np.inf
+    if constraints in ('caps', 'all'):
+        caps = np.full((3, T), np.inf)
+        caps[0] = [1_000.0, 2_500.0, 2_500.0, 2_500.0]
+    coupling = []
+    if constraints in ('shares', 'all'):
+        coupling.append((np.ones(3), np.array([3_000.0, 6_000.0, 4_000.0, 6_000.0])))
+    if constraints in ('cash', 'all'):
+        coupling.append((PRICES, np.array([250_000.0, 200_000.0, 150_000.0, np.inf])))
+
+    solution = solve_portfolio_allocation(BASKET['total_shares'], BASKET['a'], BASKET['b'], T, caps, coupling)
+    expected = portfolio_slsqp(BASKET['total_shares'], BASKET['a'], BASKET['b'], T, caps, coupling)
+
+    allocations = solution['allocations']
+    assert solution['converged']
+    np.testing.assert_allclose(allocations.sum(axis=1), BASKET['total_shares'])
+    assert np.all(allocations >= 0) and np.all(allocations <= np.broadcast_to(caps, allocations.shape) + 1e-6)
+    for weights, limits in coupling:
+        assert np.all(weights @ allocations <= limits * (1 + 1e-6))
+    # Every case has a limit that the equal split would break
+    equal_split = np.repeat(BASKET['total_shares'][:, None] / T, T, axis=1)
+    assert (np.any(equal_split > caps) or any(np.any(weights @ equal_split > limits) for weights, limits in coupling))
+    cost = solution['costs'].sum()
+    expected_cost = np.sum(BASKET['a'][:, None] * expected ** (BASKET['b'] + 1)[:, None])
+    assert cost == pytest.approx(expected_cost, rel=1e-6)
+    np.testing.assert_allclose(allocations, expected, rtol=1e-3, atol=1e-2 * BASKET['total_shares'].max() / T)
+
+
+def test_unconstrained_portfolio_is_the_equal_split():
+    solution = solve_portfolio_allocation(BASKET['total_shares'], BASKET['a'], BASKET['b'], 5)
+    assert solution['converged']
+    np.testing.assert_allclose(solution['allocations'], np.repeat(BASKET['total_shares'][:, None] / 5, 5, axis=1),
+                               rtol=1e-6)
+    assert solution['multipliers'].shape == (0, 5)
+
+
+def test_linear_cost_portfolio_meets_the_limits():
+    # With b = 0 every feasible allocation costs a * total_shares
+    b = np.zeros(3)
+    limits = np.array([4_000.0, 8_000.0, 6_000.0])
+    solution = solve_portfolio_allocation(BASKET['total_shares'], BASKET['a'], b, 3, coupling=[(np.ones(3), limits)])
+    assert solution['converged']
+    np.testing.assert_allclose(solution['allocations'].sum(axis=1), BASKET['total_shares'])
+    assert np.all(solution['allocations'].sum(axis=0) <= limits * (1 + 1e-6))
+    np.testing.assert_allclose(solution['costs'], BASKET['a'] * BASKET['total_shares'])
+
+
+@pytest.mark.parametrize('kwargs, message', [
+    ({'coupling': [(np.ones(3), np.full(4, 1_000.0))]}, 'limits are too small'),
+    ({'caps': np.full((3, 1), 100.0)}, 'caps are too small'),
+    ({'a': np.array([2e-5, -1e-5, 1e-5])}, 'a > 0'),
+    ({'b': np.array([0.6, -0.5, 0.4])}, 'b >= 0'),
+    ({'total_shares': np.array([6_000.0, 0.0, 9_000.0])}, 'must be positive'),
+])
+def test_infeasible_portfolios_raise(kwargs, message):
+    problem = {**BASKET, 'num_intervals': 4, **kwargs}
+    with pytest.raises(ValueError, match=message):
+        solve_portfolio_allocation(**problem)
+
+
+def test_jointly_infeasible_limits_do_not_converge():
+    # Each limit holds the basket on its own, but the share limit leaves the first three
+    # intervals more shares than their cash limits can pay for
+    coupling = [(np.ones(3), np.full(4, 4_500.0)), (PRICES, np.array([100_000.0, 100_000.0, 100_000.0, np.inf]))]
+    solution = solve_portfolio_allocation(BASKET['total_shares'], BASKET['a'], BASKET['b'], 4, coupling=coupling)
+    assert not solution['converged'] and solution['max_violation'] > 0